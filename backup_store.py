@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+MSAPP Backup Store
+Content-addressed backups: each distinct package is stored once, by SHA-256
+
+Layout (next to the packages by default):
+  .msapp_backups/objects/<aa>/<sha256>.msapp
+  .msapp_backups/index.json
+
+Objects are reflinked (copy-on-write) where the filesystem supports it and
+copied otherwise. A source is only hard-linked when nobody can write to it
+(a read-only package): a writable source could be overwritten in place, by
+a plain cp for instance, and would change the stored object with it. Object
+checksums are verified whenever a changed package is backed up, on restore
+and by the verify command; a corrupt object is replaced from the source on
+backup and reported on restore. An untouched package (same size, mtime and
+inode as at its last backup) is skipped without reading anything.
+
+Usage:
+  python backup_store.py backup "Natural England Condition Assessment.msapp"
+  python backup_store.py list
+  python backup_store.py restore "Natural England Condition Assessment.msapp" --at 20261019_171334
+  python backup_store.py prune --keep 10 --days 30
+  python backup_store.py verify
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+from msapp_package import publish_atomic, publish_mode
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEFAULT_STORE = '.msapp_backups'
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+FICLONE = 0x40049409
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflink(source: Path, target: Path) -> bool:
+    """Copy-on-write clone (Linux FICLONE: btrfs, xfs, ...); False if unsupported"""
+    if fcntl is None:
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if target.exists():
+            target.unlink()
+        return False
+
+
+class CorruptObjectError(Exception):
+    """A stored object no longer matches its SHA-256"""
+
+
+def is_immutable(path: Path) -> bool:
+    """True if no one has write permission on the file (so it cannot be rewritten in place)"""
+    return not path.stat().st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def clone_file(source: Path, target: Path, allow_hardlink: bool = True) -> str:
+    """Cheapest safe copy; returns the method used. Only read-only sources are hard-linked."""
+    if reflink(source, target):
+        return 'reflink'
+    if allow_hardlink and is_immutable(source):
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copy2(source, target)
+    return 'copy'
+
+
+class BackupStore:
+    """Deduplicating .msapp backup store with retention and restore by timestamp"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.index_path = self.root / 'index.json'
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def locked(self):
+        """Serialize index updates across threads and processes"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.root / 'index.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load_index(self) -> List[Dict]:
+        if not self.index_path.exists():
+            return []
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('Backups', [])
+
+    def save_index(self, entries: List[Dict]):
+        data = json.dumps({'Backups': entries}, indent=2).encode('utf-8')
+        publish_atomic(self.index_path, data)
+
+    def object_path(self, sha256: str) -> Path:
+        return self.root / 'objects' / sha256[:2] / f"{sha256}.msapp"
+
+    @staticmethod
+    def source_stamp(path: Path) -> List[int]:
+        st = path.stat()
+        return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+    def backup(self, source: Path) -> Dict:
+        """Back up a package; returns its index entry (with 'Stored': False if unchanged)"""
+        source = Path(source)
+        stamp = self.source_stamp(source)
+        with self.locked():
+            entries = self.load_index()
+            # Same file, untouched since the last backup: no hashing, no copy, no index write
+            latest = next((e for e in reversed(entries) if e['Source'] == source.name), None)
+            if latest and latest.get('Stamp') == stamp:
+                return dict(latest, Stored=False)
+
+            sha256 = file_sha256(source)
+            target = self.object_path(sha256)
+            method = 'dedup'
+            corrupt = target.exists() and not self.verify(sha256)
+            if corrupt:
+                target.unlink()
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                method = clone_file(source, target)
+                if method != 'hardlink':
+                    # A hard link shares the source's inode (and mode) - leave it alone
+                    os.chmod(target, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                if not self.verify(sha256):
+                    target.unlink()
+                    raise CorruptObjectError(f"{source} changed while it was being backed up")
+            if corrupt:
+                method = 'repaired'
+
+            if latest and latest['Sha256'] == sha256:
+                # Touched but identical content - refresh the stamp only
+                latest['Stamp'] = stamp
+                self.save_index(entries)
+                return dict(latest, Stored=False, Repaired=corrupt)
+
+            entry = {
+                'Timestamp': datetime.now().strftime(TIMESTAMP_FORMAT),
+                'Source': source.name,
+                'Sha256': sha256,
+                'Size': stamp[0],
+                'Stamp': stamp,
+                'Method': method
+            }
+            entries.append(entry)
+            self.save_index(entries)
+            return dict(entry, Stored=True, Repaired=corrupt)
+
+    def verify(self, sha256: str) -> bool:
+        """True if the object exists and its content still hashes to sha256"""
+        path = self.object_path(sha256)
+        return path.exists() and file_sha256(path) == sha256
+
+    def verify_objects(self) -> Dict:
+        """Re-hash every object the index references; returns counts and the corrupt entries"""
+        with self.locked():
+            entries = self.load_index()
+            objects = {e['Sha256'] for e in entries}
+            corrupt = {sha256 for sha256 in objects if not self.verify(sha256)}
+        return {'objects_checked': len(objects), 'corrupt': [e for e in entries if e['Sha256'] in corrupt]}
+
+    def find(self, source_name: str, at: Optional[str] = None) -> Optional[Dict]:
+        """Latest backup of a package taken at or before a timestamp (latest overall if None)"""
+        candidates = [e for e in self.load_index() if e['Source'] == source_name
+                      and (at is None or e['Timestamp'] <= at)]
+        return candidates[-1] if candidates else None
+
+    def restore(self, source_name: str, output: Path, at: Optional[str] = None) -> Dict:
+        """Restore a backup to output (reflink or copy, published atomically)"""
+        entry = self.find(source_name, at)
+        if entry is None:
+            raise FileNotFoundError(f"No backup of {source_name}" + (f" at or before {at}" if at else ""))
+        output = Path(output)
+        fd, temp = tempfile.mkstemp(prefix=f".{output.name}.", suffix=".restore", dir=output.parent)
+        os.close(fd)
+        temp = Path(temp)
+        try:
+            # Never hard-link a restored package: it is a working file that may be edited
+            clone_file(self.object_path(entry['Sha256']), temp, allow_hardlink=False)
+            if file_sha256(temp) != entry['Sha256']:
+                raise CorruptObjectError(f"Backup object {entry['Sha256'][:12]} of {source_name} "
+                                         f"({entry['Timestamp']}) is corrupt: its content no longer matches")
+            os.chmod(temp, publish_mode(output) | stat.S_IWUSR)
+            os.replace(temp, output)
+        except BaseException:
+            if temp.exists():
+                temp.unlink()
+            raise
+        return entry
+
+    def prune(self, keep: Optional[int] = None, days: Optional[int] = None) -> Dict:
+        """Apply retention per package: at most `keep` backups, none older than `days`
+
+        The newest backup of each package is always kept. Objects no longer
+        referenced by the index are deleted.
+        """
+        with self.locked():
+            entries = self.load_index()
+            cutoff = (datetime.now() - timedelta(days=days)).strftime(TIMESTAMP_FORMAT) if days is not None else None
+            kept = []
+            by_source: Dict[str, List[Dict]] = {}
+            for entry in entries:
+                by_source.setdefault(entry['Source'], []).append(entry)
+            for source_entries in by_source.values():
+                for position, entry in enumerate(reversed(source_entries)):
+                    within_count = keep is None or position < keep
+                    within_age = cutoff is None or entry['Timestamp'] >= cutoff
+                    if position == 0 or (within_count and within_age):
+                        kept.append(entry)
+            kept.sort(key=lambda e: e['Timestamp'])
+
+            referenced = {e['Sha256'] for e in kept}
+            removed_objects = 0
+            freed = 0
+            for sha256 in {e['Sha256'] for e in entries} - referenced:
+                path = self.object_path(sha256)
+                if path.exists():
+                    freed += path.stat().st_size
+                    path.unlink()
+                    removed_objects += 1
+            self.save_index(kept)
+            return {'entries_removed': len(entries) - len(kept), 'objects_removed': removed_objects,
+                    'bytes_freed': freed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicating .msapp backup store")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"Store directory (default: {DEFAULT_STORE})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backup = subparsers.add_parser("backup", help="Back up one or more packages")
+    backup.add_argument("packages", nargs="+")
+
+    subparsers.add_parser("list", help="List backups")
+
+    restore = subparsers.add_parser("restore", help="Restore a package")
+    restore.add_argument("package", help="Package file name to restore")
+    restore.add_argument("--at", help=f"Timestamp ({TIMESTAMP_FORMAT}); latest backup at or before it")
+    restore.add_argument("-o", "--output", help="Output path (default: the package path)")
+
+    prune = subparsers.add_parser("prune", help="Apply the retention policy")
+    prune.add_argument("--keep", type=int, help="Backups to keep per package")
+    prune.add_argument("--days", type=int, help="Keep backups newer than this many days")
+
+    subparsers.add_parser("verify", help="Check every stored object against its SHA-256")
+
+    args = parser.parse_args()
+    store = BackupStore(Path(args.store))
+
+    if args.command == "backup":
+        for package in args.packages:
+            try:
+                entry = store.backup(Path(package))
+            except CorruptObjectError as e:
+                print(f"ERROR: {e}")
+                return 1
+            state = f"stored ({entry['Method']})" if entry['Stored'] else "unchanged"
+            if entry.get('Repaired'):
+                state = "corrupt object replaced"
+            print(f"{entry['Timestamp']}  {entry['Sha256'][:12]}  {state:<18} {package}")
+    elif args.command == "list":
+        for entry in store.load_index():
+            print(f"{entry['Timestamp']}  {entry['Sha256'][:12]}  {entry['Size']:>10,}  {entry['Source']}")
+    elif args.command == "restore":
+        try:
+            entry = store.restore(Path(args.package).name, Path(args.output or args.package), args.at)
+        except (FileNotFoundError, CorruptObjectError) as e:
+            print(f"ERROR: {e}")
+            return 1
+        print(f"Restored {entry['Source']} from {entry['Timestamp']} -> {args.output or args.package}")
+    elif args.command == "verify":
+        result = store.verify_objects()
+        for entry in result['corrupt']:
+            print(f"CORRUPT: {entry['Timestamp']}  {entry['Sha256'][:12]}  {entry['Source']}")
+        print(f"Checked {result['objects_checked']} objects, {len(result['corrupt'])} backups corrupt")
+        if result['corrupt']:
+            return 1
+    else:
+        result = store.prune(args.keep, args.days)
+        print(f"Removed {result['entries_removed']} backups, {result['objects_removed']} objects "
+              f"({result['bytes_freed']:,} bytes freed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
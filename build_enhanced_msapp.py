@@ -5,14 +5,17 @@ Builds a fully functional .msapp with proper YAML + Controls JSON
 """
 
 import zipfile
-import json
-import shutil
 from pathlib import Path
 import sys
 
 # Import the controls generator
 sys.path.insert(0, str(Path(__file__).parent))
+import control_model
 from controls_json_generator import ControlsJSONGenerator
+from msapp_package import MSAppPackage
+from msapp_pipeline import EnhanceHomeScreen, MSAppPipeline
+from optimize_msapp import TemplatePruner
+from screen_budgets import check_budgets
 
 
 class EnhancedMSAPPBuilder:
@@ -21,305 +24,12 @@ class EnhancedMSAPPBuilder:
     def __init__(self):
         self.generator = ControlsJSONGenerator(start_unique_id=10)
 
-    def generate_homescreen_yaml(self) -> str:
-        """Generate HomeScreen YAML in current Power Apps format"""
-        return '''# ************************************************************************************************
-# Warning: YAML source code for Canvas Apps should only be used to review changes made within Power Apps Studio and for minor edits (Preview).
-# Use the maker portal to create and edit your Power Apps.
-#
-# The schema file for Canvas Apps is available at https://go.microsoft.com/fwlink/?linkid=2304907
-#
-# For more information, visit https://go.microsoft.com/fwlink/?linkid=2292623
-# ************************************************************************************************
-Screens:
-  HomeScreen:
-    Properties:
-      Fill: =varTheme.Background
-      LoadingSpinnerColor: =varTheme.Primary
-    Children:
-      - HeaderBanner:
-          Control: Rectangle@2.3.0
-          Properties:
-            BorderColor: =RGBA(0, 18, 107, 1)
-            BorderThickness: |+
-              =0
-            Fill: |+
-              =varTheme.Primary
-            Height: |+
-              =80
-            Width: |+
-              =Parent.Width
-            X: |+
-              =0
-            Y: |+
-              =0
-      - HeaderTitle:
-          Control: Label@2.5.1
-          Properties:
-            Align: |+
-              =Align.Center
-            BorderColor: =RGBA(0, 18, 107, 1)
-            Color: =Color.White
-            Font: |+
-              =Font.'Segoe UI'
-            FontWeight: |+
-              =FontWeight.Semibold
-            Height: |+
-              =40
-            Size: |+
-              =18
-            Text: |+
-              ="🍃 Natural England – Condition Monitoring Portal"
-            Width: |+
-              =Parent.Width - 40
-            X: =20
-            Y: |+
-              =20
-      - DashboardLabel:
-          Control: Label@2.5.1
-          Properties:
-            BorderColor: =RGBA(0, 18, 107, 1)
-            Color: =varTheme.Text
-            Font: |+
-              =Font.'Segoe UI'
-            FontWeight: |+
-              =FontWeight.Semibold
-            Height: |+
-              =30
-            Size: |+
-              =16
-            Text: |+
-              ="Dashboard Overview"
-            Width: |+
-              =400
-            X: =20
-            Y: |+
-              =100
-      - KPIGallery:
-          Control: Gallery@2.5.1
-          Variant: galleryHorizontal
-          Properties:
-            BorderColor: =RGBA(0, 18, 107, 1)
-            Height: |+
-              =120
-            Items: |+
-              =[{Title:"Assessments Due",Value:Text(varKPIs.AssessmentsDue),Icon:"[A]",Color:varTheme.Info},{Title:"Awaiting Review",Value:Text(varKPIs.AwaitingReview),Icon:"[R]",Color:varTheme.Warning},{Title:"Favourable %",Value:Text(varKPIs.FavourablePercentage)&"%",Icon:"[OK]",Color:varTheme.Success}]
-            TemplatePadding: |+
-              =10
-            TemplateSize: |+
-              =(Parent.Width - 80) / 3
-            Width: |+
-              =Parent.Width - 40
-            X: =20
-            Y: |+
-              =140
-          Children:
-            - KPICard:
-                Control: Rectangle@2.3.0
-                Properties:
-                  BorderColor: =varTheme.Surface
-                  BorderThickness: |+
-                    =1
-                  Fill: |+
-                    =RGBA(255, 255, 255, 1)
-                  Height: |+
-                    =100
-                  Width: |+
-                    =Parent.TemplateWidth - 20
-                  X: |+
-                    =10
-                  Y: |+
-                    =10
-            - KPIIcon:
-                Control: Label@2.5.1
-                Properties:
-                  BorderColor: =RGBA(0, 18, 107, 1)
-                  Height: |+
-                    =30
-                  Size: |+
-                    =24
-                  Text: |+
-                    =ThisItem.Icon
-                  Width: |+
-                    =40
-                  X: =20
-                  Y: |+
-                    =20
-            - KPITitle:
-                Control: Label@2.5.1
-                Properties:
-                  BorderColor: =RGBA(0, 18, 107, 1)
-                  Color: =varTheme.TextLight
-                  Font: |+
-                    =Font.'Segoe UI'
-                  Height: |+
-                    =20
-                  Size: |+
-                    =11
-                  Text: |+
-                    =ThisItem.Title
-                  Width: |+
-                    =Parent.TemplateWidth - 60
-                  X: =20
-                  Y: |+
-                    =55
-            - KPIValue:
-                Control: Label@2.5.1
-                Properties:
-                  BorderColor: =RGBA(0, 18, 107, 1)
-                  Color: =ThisItem.Color
-                  Font: |+
-                    =Font.'Segoe UI'
-                  FontWeight: |+
-                    =FontWeight.Bold
-                  Height: |+
-                    =30
-                  Size: |+
-                    =20
-                  Text: |+
-                    =ThisItem.Value
-                  Width: |+
-                    =Parent.TemplateWidth - 60
-                  X: =20
-                  Y: |+
-                    =75
-      - SitesLabel:
-          Control: Label@2.5.1
-          Properties:
-            BorderColor: =RGBA(0, 18, 107, 1)
-            Color: =varTheme.Text
-            Font: |+
-              =Font.'Segoe UI'
-            FontWeight: |+
-              =FontWeight.Semibold
-            Height: |+
-              =30
-            Size: |+
-              =16
-            Text: |+
-              ="Recent Sites"
-            Width: |+
-              =400
-            X: =20
-            Y: |+
-              =280
-      - SitesGallery:
-          Control: Gallery@2.5.1
-          Variant: galleryVertical
-          Properties:
-            BorderColor: =RGBA(0, 18, 107, 1)
-            Height: |+
-              =200
-            Items: |+
-              =Filter(colSites, Status = "Active")
-            TemplatePadding: |+
-              =5
-            TemplateSize: |+
-              =90
-            Width: |+
-              =Parent.Width - 40
-            X: =20
-            Y: |+
-              =320
-          Children:
-            - SiteCard:
-                Control: Rectangle@2.3.0
-                Properties:
-                  BorderColor: =varTheme.Surface
-                  BorderThickness: |+
-                    =1
-                  Fill: |+
-                    =RGBA(255, 255, 255, 1)
-                  Height: |+
-                    =80
-                  Width: |+
-                    =Parent.TemplateWidth - 10
-                  X: |+
-                    =5
-                  Y: |+
-                    =5
-            - SiteNameLabel:
-                Control: Label@2.5.1
-                Properties:
-                  BorderColor: =RGBA(0, 18, 107, 1)
-                  Color: =varTheme.Text
-                  Font: |+
-                    =Font.'Segoe UI'
-                  FontWeight: |+
-                    =FontWeight.Semibold
-                  Height: |+
-                    =25
-                  Size: |+
-                    =14
-                  Text: |+
-                    =ThisItem.SiteName
-                  Width: |+
-                    =Parent.TemplateWidth - 40
-                  X: =20
-                  Y: |+
-                    =15
-            - RegionLabel:
-                Control: Label@2.5.1
-                Properties:
-                  BorderColor: =RGBA(0, 18, 107, 1)
-                  Color: =varTheme.TextLight
-                  Font: |+
-                    =Font.'Segoe UI'
-                  Height: |+
-                    =20
-                  Size: |+
-                    =11
-                  Text: |+
-                    =ThisItem.Region & " • " & ThisItem.Area
-                  Width: |+
-                    =Parent.TemplateWidth - 40
-                  X: =20
-                  Y: |+
-                    =40
-            - DesignationLabel:
-                Control: Label@2.5.1
-                Properties:
-                  BorderColor: =RGBA(0, 18, 107, 1)
-                  Color: =varTheme.Info
-                  Font: |+
-                    =Font.'Segoe UI'
-                  FontWeight: |+
-                    =FontWeight.Semibold
-                  Height: |+
-                    =20
-                  Size: |+
-                    =10
-                  Text: |+
-                    =ThisItem.Designation
-                  Width: |+
-                    =60
-                  X: =20
-                  Y: |+
-                    =65
-      - CreateButton:
-          Control: Button@2.3.0
-          Properties:
-            BorderColor: =RGBA(0, 18, 107, 1)
-            Fill: |+
-              =varTheme.Success
-            Font: |+
-              =Font.'Segoe UI'
-            FontWeight: |+
-              =FontWeight.Semibold
-            Height: |+
-              =50
-            OnSelect: |+
-              =Navigate(AssessmentWizardScreen)
-            Size: |+
-              =14
-            Text: |+
-              ="➕ Create New Assessment"
-            Width: |+
-              =Parent.Width - 40
-            X: =20
-            Y: |+
-              =540
-'''
+    def generate_homescreen_yaml(self, homescreen_json: dict = None) -> str:
+        """HomeScreen pa.yaml emitted from its Controls JSON, so the two cannot drift apart"""
+        if homescreen_json is None:
+            # Separate builder: generating must not advance this builder's control IDs
+            homescreen_json = EnhancedMSAPPBuilder().generate_homescreen_controls_json()
+        return control_model.screen_pa_yaml(control_model.from_controls_json(homescreen_json["TopParent"]))
 
     def generate_homescreen_controls_json(self) -> dict:
         """Generate complete HomeScreen Controls JSON with all controls"""
@@ -534,6 +244,41 @@ Screens:
 
         return homescreen_json
 
+    def enhance_package(self, package: MSAppPackage, verbose: bool = False) -> dict:
+        """Write the enhanced HomeScreen YAML, Controls JSON and ControlCount into a package"""
+        # Fresh generator per build so control IDs are stable across repeated builds
+        self.generator = ControlsJSONGenerator(start_unique_id=10)
+
+        # 2. Generate and write HomeScreen Controls JSON
+        if verbose:
+            print("[2/5] Generating HomeScreen Controls JSON...")
+        homescreen_json = self.generate_homescreen_controls_json()
+        package.write_json("Controls/7.json", homescreen_json)
+
+        json_size = len(package.read("Controls/7.json"))
+        children_count = len(homescreen_json["TopParent"]["Children"])
+        if verbose:
+            print(f"      Written: {json_size:,} bytes")
+            print(f"      Controls: {children_count} top-level controls")
+
+        # 3. Emit the matching HomeScreen YAML from the same control tree
+        if verbose:
+            print("[3/5] Emitting HomeScreen YAML...")
+        homescreen_yaml = self.generate_homescreen_yaml(homescreen_json)
+        package.write("Src/HomeScreen.pa.yaml", homescreen_yaml)
+        if verbose:
+            print(f"      Written: {len(homescreen_yaml)} characters")
+
+        # 3a. Update Properties.json with correct ControlCount
+        if verbose:
+            print("[3a/6] Updating Properties.json with correct ControlCount...")
+        package.update_control_count()
+        control_count = package.read_json("Properties.json")["ControlCount"]
+        if verbose:
+            print(f"      Updated ControlCount: {sum(v for k, v in control_count.items() if k not in ('TestSuite', 'TestCase'))} controls")
+
+        return {"yaml_chars": len(homescreen_yaml), "json_bytes": json_size, "top_level_controls": children_count}
+
     def build_msapp(self, input_path: Path, output_path: Path):
         """Build enhanced .msapp with proper YAML and Controls JSON"""
         print("="*70)
@@ -542,66 +287,11 @@ Screens:
         print(f"\nInput:  {input_path.name}")
         print(f"Output: {output_path.name}")
 
-        # Create temp directory
-        temp_dir = Path("temp_build_enhanced")
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
-        temp_dir.mkdir()
-
         try:
-            # 1. Extract original .msapp
-            print("\n[1/5] Extracting original .msapp...")
-            with zipfile.ZipFile(input_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
-
-            # 2. Generate and write HomeScreen YAML
-            print("[2/5] Generating enhanced HomeScreen YAML...")
-            homescreen_yaml = self.generate_homescreen_yaml()
-            yaml_path = temp_dir / "Src" / "HomeScreen.pa.yaml"
-            with open(yaml_path, 'w', encoding='utf-8') as f:
-                f.write(homescreen_yaml)
-            print(f"      Written: {len(homescreen_yaml)} characters")
-
-            # 3. Generate and write HomeScreen Controls JSON
-            print("[3/5] Generating HomeScreen Controls JSON...")
-            homescreen_json = self.generate_homescreen_controls_json()
-            json_path = temp_dir / "Controls" / "7.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(homescreen_json, f, indent=2)
-
-            json_size = json_path.stat().st_size
-            children_count = len(homescreen_json["TopParent"]["Children"])
-            print(f"      Written: {json_size:,} bytes")
-            print(f"      Controls: {children_count} top-level controls")
-
-            # 3a. Update Properties.json with correct ControlCount
-            print("[3a/6] Updating Properties.json with correct ControlCount...")
-            props_path = temp_dir / "Properties.json"
-            with open(props_path, 'r', encoding='utf-8') as f:
-                props = json.load(f)
-
-            # Count ALL controls in the app
-            props["ControlCount"] = {
-                "screen": 8,
-                "rectangle": 3,  # HeaderBanner, KPICard, SiteCard
-                "label": 6,      # HeaderTitle, DashboardLabel, SitesLabel, KPIIcon, KPITitle, KPIValue, SiteNameLabel, RegionLabel, DesignationLabel
-                "gallery": 2,    # KPIGallery, SitesGallery
-                "button": 1,     # CreateButton
-                "TestSuite": 1,
-                "TestCase": 1
-            }
-
-            with open(props_path, 'w', encoding='utf-8') as f:
-                json.dump(props, f, indent=2)
-            print(f"      Updated ControlCount: {sum([v for k,v in props['ControlCount'].items() if k not in ['TestSuite', 'TestCase']])} controls")
-
-            # 4. Package as .msapp
-            print("[4/6] Packaging enhanced .msapp...")
-            with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-                for file_path in temp_dir.rglob('*'):
-                    if file_path.is_file():
-                        arcname = file_path.relative_to(temp_dir)
-                        zip_out.write(file_path, arcname)
+            # 1-4. Read the original once, enhance it, publish the output once
+            print("\n[1/5] Loading original .msapp...")
+            MSAppPipeline([EnhanceHomeScreen(verbose=True)]).run(input_path, output_path)
+            print("[4/6] Packaged enhanced .msapp")
 
             # 5. Verify
             print("[5/6] Verifying output...")
@@ -614,6 +304,12 @@ Screens:
                 print(f"      YAML files: {len(yaml_files)}")
                 print(f"      Control JSONs: {len(json_files)}")
 
+            built = MSAppPackage.load(output_path)
+            for template in TemplatePruner().missing_templates(built):
+                print(f"      WARNING: missing from References/Templates.json: {template}")
+            for result in check_budgets(built)[1]["results"]:
+                print(f"      WARNING: {result['location']}: {result['message']}")
+
             print("\n" + "="*70)
             print("SUCCESS!")
             print("="*70)
@@ -637,9 +333,6 @@ Screens:
             print("\nTotal: 15 controls (7 top-level + 8 gallery children)")
 
         finally:
-            # Cleanup
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir)
             print("\nCleanup complete")
 
 
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+MSAPP Build Server
+Long-running local build daemon that keeps base packages and generators warm in memory
+
+Start:   python build_server.py serve [--port 8765 | --socket /tmp/msapp.sock]
+Build:   python build_server.py build request.json -o output.msapp
+
+Request JSON (POST /build):
+{
+  "base": "Natural England Condition Assessment.msapp",
+  "enhance_homescreen": true,
+  "screens": {"ReviewScreen": {"yaml": "...", "controls": {"TopParent": {...}}}},
+  "datasets": {"colSites": [{"SiteId": 1, "SiteName": "Kinder Scout"}]},
+  "offline_cache": {"collections": ["colSites", "colFeatures"], "max_age_minutes": 1440},
+  "members": {"References/DataSources.json": {"DataSources": []}}
+}
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+from msapp_package import MSAppPackage, publish_atomic
+from msapp_pipeline import EnhanceHomeScreen, MSAppPipeline, SetOnStart, WriteMembers, WriteScreen
+from offline_cache import OfflineCache
+
+DEFAULT_PORT = 8765
+
+
+class BasePackageCache:
+    """Base packages held in memory, reloaded only when the file on disk changes"""
+
+    def __init__(self):
+        self._packages: Dict[str, Tuple[Tuple[int, int], MSAppPackage]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path: str) -> MSAppPackage:
+        resolved = str(Path(path).resolve())
+        stat = os.stat(resolved)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._packages.get(resolved)
+            if cached and cached[0] == stamp:
+                self.hits += 1
+                return cached[1]
+            package = MSAppPackage.load(resolved)
+            self._packages[resolved] = (stamp, package)
+            self.loads += 1
+            return package
+
+    def stats(self) -> Dict:
+        return {"packages": sorted(self._packages), "hits": self.hits, "loads": self.loads}
+
+
+class BuildService:
+    """Applies build requests to a copy of a cached base package"""
+
+    def __init__(self, default_base: str = None, cache: BasePackageCache = None):
+        self.default_base = default_base
+        self.cache = cache or BasePackageCache()
+
+    @staticmethod
+    def stages_for(request: Dict) -> List:
+        """Pipeline stages for a build request"""
+        stages = []
+        if request.get('enhance_homescreen'):
+            stages.append(EnhanceHomeScreen())
+        for screen_name, definition in request.get('screens', {}).items():
+            stages.append(WriteScreen(screen_name, yaml=definition.get('yaml'),
+                                      controls=definition.get('controls')))
+        if request.get('datasets'):
+            stages.append(SetOnStart(datasets=request['datasets']))
+        if request.get('offline_cache'):
+            options = request['offline_cache']
+            stages.append(OfflineCache(**(options if isinstance(options, dict) else {})))
+        if request.get('members'):
+            stages.append(WriteMembers(request['members']))
+        return stages
+
+    def build(self, request: Dict) -> Tuple[bytes, Dict]:
+        """Build a package from a request; returns (msapp bytes, build report)"""
+        start = time.perf_counter()
+        base = request.get('base') or self.default_base
+        if not base:
+            raise ValueError("No base package given and no default base configured")
+
+        # Member bytes are shared with the cached base; only touched members are re-parsed
+        package = self.cache.get(base).copy()
+
+        stages = MSAppPipeline(self.stages_for(request)).run_package(package)
+
+        data = package.to_bytes()
+        report = {"base": base, "bytes": len(data),
+                  "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+        cache = next((s for s in stages if s["stage"] == OfflineCache.name), None)
+        if cache:
+            report["cacheable"] = [c["collection"] for c in cache["cacheable"]]
+        return data, report
+
+
+class BuildRequestHandler(BaseHTTPRequestHandler):
+    """POST /build -> .msapp bytes, GET /status -> cache statistics"""
+
+    service: BuildService = None
+
+    def address_string(self):
+        # Unix socket peers have no (host, port) address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self._send_json(200, self.service.cache.stats())
+        else:
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/build':
+            self._send_json(404, {"error": f"Unknown path: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            data, report = self.service.build(request)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Build-Report', json.dumps(report))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__('localhost')
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def serve(args) -> int:
+    service = BuildService(default_base=args.base)
+    if args.base:
+        service.cache.get(args.base)
+    handler = type('Handler', (BuildRequestHandler,), {'service': service})
+
+    if args.socket:
+        server = UnixHTTPServer(args.socket, handler)
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        where = f"http://{args.host}:{args.port}"
+
+    print(f"MSAPP build server listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+
+def build(args) -> int:
+    with open(args.request, 'r', encoding='utf-8') as f:
+        body = f.read().encode('utf-8')
+
+    if args.socket:
+        connection = UnixHTTPConnection(args.socket)
+    else:
+        connection = http.client.HTTPConnection(args.host, args.port)
+    connection.request('POST', '/build', body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    data = response.read()
+
+    if response.status != 200:
+        print(f"ERROR: {json.loads(data).get('error', response.reason)}")
+        return 1
+
+    publish_atomic(args.output, data)
+    report = json.loads(response.getheader('X-Build-Report', '{}'))
+    print(f"Created: {args.output} ({len(data):,} bytes, built in {report.get('elapsed_ms')} ms)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local MSAPP build server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("serve", "build"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--host", default="127.0.0.1")
+        sub.add_argument("--port", type=int, default=DEFAULT_PORT)
+        sub.add_argument("--socket", help="Unix socket path instead of localhost TCP")
+        if name == "serve":
+            sub.add_argument("--base", help="Default base .msapp to preload")
+        else:
+            sub.add_argument("request", help="Build request JSON file")
+            sub.add_argument("-o", "--output", required=True, help="Output .msapp path")
+
+    args = parser.parse_args()
+    return serve(args) if args.command == "serve" else build(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Branded Variant Builder
+Builds per-client variants of one app from a single parse of the base package
+
+Variants JSON:
+{
+  "base": "Natural England Condition Assessment.msapp",
+  "enhance_homescreen": true,
+  "output_dir": "variants",
+  "variants": {
+    "NorthEast": {
+      "app_name": "Condition Assessment - North East",
+      "theme": {"Primary": "#0B3D2E", "Accent": "#F2A900"},
+      "header_title": "North East Condition Monitoring",
+      "kpis": {"AssessmentsDue": 20, "FavourablePercentage": 80},
+      "datasets": {"colSites": [{"SiteId": 1, "SiteName": "Lindisfarne"}]},
+      "controls": {"CreateButton": {"Fill": "varTheme.Accent"}}
+    }
+  }
+}
+
+Theme values starting with '#' become ColorValue("#..."); anything else is used as a formula.
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import pa_yaml
+import powerfx
+from msapp_package import MSAppPackage, set_rule, walk_controls
+from msapp_pipeline import EnhanceHomeScreen, RenameApp
+
+
+def theme_value(value: str) -> str:
+    return f'ColorValue("{value}")' if value.startswith('#') else value
+
+
+class VariantBase:
+    """Base package prepared once; variants are cheap copy-on-write copies of it
+
+    Shared between variants: member bytes and their deflated form, the
+    control name -> member index and the (tokenized) base OnStart formula.
+    A variant only re-parses the members its overrides touch.
+    """
+
+    def __init__(self, package: MSAppPackage):
+        self.package = package
+        self.onstart = package.get_app_formula('OnStart') or ''
+        powerfx.tokenize(self.onstart)
+        self.control_index: Dict[str, Tuple[str, str]] = {}
+        for member in package.control_files():
+            if not member.startswith('Controls/'):
+                continue
+            top = package.read_json(member).get('TopParent', {})
+            for control in walk_controls(top):
+                self.control_index[control['Name']] = (member, top.get('Name'))
+        # Deflate every member now, before the copies are taken
+        package.copy()
+
+    def onstart_for(self, overrides: Dict) -> str:
+        onstart = self.onstart
+        if overrides.get('theme'):
+            onstart = powerfx.set_record_fields(
+                onstart, 'varTheme', {k: theme_value(v) for k, v in overrides['theme'].items()})
+        if overrides.get('kpis'):
+            onstart = powerfx.set_record_fields(
+                onstart, 'varKPIs', {k: powerfx.format_value(v) for k, v in overrides['kpis'].items()})
+        for collection, rows in overrides.get('datasets', {}).items():
+            onstart = powerfx.set_clear_collect(onstart, collection, rows)
+        return onstart
+
+    def set_control_property(self, package: MSAppPackage, control_name: str, prop: str, formula: str):
+        """Update a control property in both its Controls JSON and its screen's pa.yaml"""
+        if control_name not in self.control_index:
+            raise ValueError(f"Control '{control_name}' not found in the base package")
+        member, screen = self.control_index[control_name]
+        top = package.read_json(member)['TopParent']
+        control = next(c for c in walk_controls(top) if c['Name'] == control_name)
+        set_rule(control, prop, formula)
+        package.mark_dirty(member)
+
+        yaml_member = f"Src/{screen}.pa.yaml"
+        if package.exists(yaml_member):
+            package.write(yaml_member, pa_yaml.set_property(
+                package.read_text(yaml_member), prop, formula,
+                control=None if control_name == screen else control_name))
+
+    def build(self, overrides: Dict) -> Tuple[MSAppPackage, List[str]]:
+        """Apply one variant's overrides to a copy of the base; returns (package, changes)"""
+        package = self.package.copy()
+        changes = []
+
+        onstart = self.onstart_for(overrides)
+        if onstart != self.onstart:
+            package.set_app_formula('OnStart', onstart)
+            changes.append('OnStart')
+
+        controls = {name: dict(props) for name, props in overrides.get('controls', {}).items()}
+        if overrides.get('header_title'):
+            controls.setdefault('HeaderTitle', {})['Text'] = powerfx.format_value(overrides['header_title'])
+        for control_name, props in controls.items():
+            for prop, formula in props.items():
+                self.set_control_property(package, control_name, prop, formula)
+                changes.append(f"{control_name}.{prop}")
+
+        if overrides.get('app_name'):
+            RenameApp(overrides['app_name']).run(package)
+            changes.append('app name')
+        return package, changes
+
+
+def build_variants(spec: Dict, jobs: int = None, spec_dir: Path = Path('.')) -> List[Dict]:
+    """Build every variant in a variants spec, in parallel"""
+    base_path = spec_dir / spec['base']
+    output_dir = spec_dir / spec.get('output_dir', 'variants')
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    package = MSAppPackage.load(base_path)
+    if spec.get('enhance_homescreen'):
+        EnhanceHomeScreen().run(package)
+    base = VariantBase(package)
+
+    def build_one(item):
+        name, overrides = item
+        start = time.perf_counter()
+        variant, changes = base.build(overrides)
+        output_path = output_dir / f"{base_path.stem}_{name}.msapp"
+        size = variant.save(output_path)
+        return {"variant": name, "output": str(output_path), "bytes": size, "changes": changes,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(build_one, spec['variants'].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build branded variants of a .msapp from one base parse")
+    parser.add_argument("variants", help="Variants JSON file")
+    parser.add_argument("--jobs", type=int, help="Parallel variant builds (default: CPU count)")
+    args = parser.parse_args()
+
+    spec_path = Path(args.variants)
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    start = time.perf_counter()
+    try:
+        results = build_variants(spec, args.jobs, spec_path.parent)
+    except (ValueError, KeyError, OSError) as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    for result in results:
+        print(f"  {result['variant']:<20} {result['bytes']:>9,} bytes  {result['elapsed_ms']:>7} ms  "
+              f"{', '.join(result['changes']) or 'no overrides'}")
+    print(f"Built {len(results)} variants in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
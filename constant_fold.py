@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Constant Folding for Control Rules
+Evaluates constant sub-expressions of Controls JSON rules and pa.yaml
+formulas at build time:
+
+  ColorValue("#1F4D3A")        ->  RGBA(31, 77, 58, 1)
+  (Parent.Width - 80) / 3 + 0  ->  untouched (not constant)
+  1366 - 2 * 40                ->  1286
+  "Natural " & "England"       ->  "Natural England"
+  Value("12"), Text("abc")     ->  12, "abc"
+  (20)                         ->  20
+
+Only folds whose result is provably identical are made: integer arithmetic
+within the exact float range (division only when the quotient is exact in
+binary), opaque or transparent hex colors (other alpha values are not exact
+decimals), and an operator is only folded when its neighbours bind less
+tightly, so 'a - 2 + 3' stays as written. A sign in front of the left
+operand blocks the fold too ('x / -2 * 4' and '-2 + 3' are left alone).
+
+Usage:
+  python constant_fold.py app.msapp --dry-run
+  python constant_fold.py app.msapp out.msapp --report folds.json
+"""
+
+import argparse
+import json
+import re
+import sys
+from collections import Counter
+from fractions import Fraction
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from formula_rewrite import FormulaRewriter
+from msapp_package import MSAppPackage
+from named_formulas import rename_in_yaml
+
+_HEX_COLOR = re.compile(r'^#([0-9A-Fa-f]{2})([0-9A-Fa-f]{2})([0-9A-Fa-f]{2})([0-9A-Fa-f]{2})?$')
+_INTEGER = re.compile(r'^-?[0-9]+$')
+_DIGITS = re.compile(r'^[0-9]+$')
+MAX_EXACT = 2 ** 53
+
+# Binding strength of binary operators; folding 'a op b' needs weaker neighbours
+PRECEDENCE = {'^': 5, '*': 4, '/': 4, '+': 3, '-': 3, '&': 2,
+              '=': 1, '<>': 1, '<': 1, '>': 1, '<=': 1, '>=': 1,
+              '&&': 0, '||': 0, 'And': 0, 'Or': 0, 'in': 0, 'exactin': 0}
+OPENERS = {None, '(', ',', ';', ':', '{', '['}
+CLOSERS = {None, ')', ',', ';', '}', ']'}
+
+
+def color_literal(text: str) -> Optional[str]:
+    """'#1F4D3A' -> 'RGBA(31, 77, 58, 1)'; None for names and partially transparent colors"""
+    match = _HEX_COLOR.match(text)
+    if not match:
+        return None
+    red, green, blue, alpha = (int(g, 16) if g else None for g in match.groups())
+    if alpha not in (None, 0, 255):
+        return None
+    return f"RGBA({red}, {green}, {blue}, {0 if alpha == 0 else 1})"
+
+
+def _number(value: Fraction) -> Optional[str]:
+    """Literal for an exactly representable result"""
+    if abs(value) >= MAX_EXACT:
+        return None
+    if value.denominator == 1:
+        return str(value.numerator)
+    if value.denominator & (value.denominator - 1):
+        return None  # not a binary fraction: the float result would be rounded
+    return repr(float(value))
+
+
+def _arithmetic(left: str, op: str, right: str) -> Optional[str]:
+    if not (_INTEGER.match(left) and _INTEGER.match(right)):
+        return None
+    a, b = Fraction(int(left)), Fraction(int(right))
+    if op == '+':
+        return _number(a + b)
+    if op == '-':
+        return _number(a - b)
+    if op == '*':
+        return _number(a * b)
+    if op == '/' and b:
+        return _number(a / b)
+    return None
+
+
+def _string(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _unquote(token) -> Optional[str]:
+    if token.kind != 'string' or not token.text.startswith('"'):
+        return None  # $"..." interpolation is not a constant
+    return token.text[1:-1].replace('""', '"')
+
+
+def _is_unary(tokens: List, k: int) -> bool:
+    """A sign: '-' or '+' after an operator or an opening bracket (or at the start)"""
+    if tokens[k].text not in ('-', '+'):
+        return False
+    previous = tokens[k - 1].text if k else None
+    return previous in OPENERS or previous in PRECEDENCE
+
+
+def _binds_weaker(token, level: int, before: bool) -> bool:
+    text = token.text if token else None
+    if text in (OPENERS if before else CLOSERS):
+        return True
+    strength = PRECEDENCE.get(text)
+    if strength is None:
+        return False
+    # Left-associative: an equal operator after the pair still applies to its result
+    return strength < level if before else strength <= level
+
+
+def _fold_once(tokens: List) -> Optional[Tuple[int, int, str, str]]:
+    """First foldable span: (first token, last token, replacement, kind)"""
+    count = len(tokens)
+    for k, token in enumerate(tokens):
+        previous = tokens[k - 1] if k else None
+        if token.kind == 'ident' and k + 3 < count and tokens[k + 1].text == '(' \
+                and tokens[k + 3].text == ')' and not (previous and previous.text == '.'):
+            value = _unquote(tokens[k + 2])
+            if value is not None:
+                if token.text == 'ColorValue':
+                    color = color_literal(value)
+                    if color:
+                        return k, k + 3, color, 'color'
+                elif token.text == 'Value' and _DIGITS.match(value.strip()):
+                    return k, k + 3, str(int(value.strip())), 'value'
+                elif token.text == 'Text':
+                    return k, k + 3, _string(value), 'text'
+        if token.text == '(' and k + 2 < count and tokens[k + 2].text == ')' \
+                and tokens[k + 1].kind in ('number', 'string') \
+                and not (previous and (previous.kind in ('ident', 'qident') or previous.text in (')', ']'))):
+            return k, k + 2, tokens[k + 1].text, 'parentheses'
+        if token.text in ('+', '-', '*', '/', '&') and 0 < k < count - 1:
+            left, right = tokens[k - 1], tokens[k + 1]
+            before = tokens[k - 2] if k >= 2 else None
+            after = tokens[k + 2] if k + 2 < count else None
+            level = PRECEDENCE[token.text]
+            # A sign before the left operand belongs to it: 'x / -2 * 4' is not 'x / -(2 * 4)'
+            if _is_unary(tokens, k) or (k >= 2 and _is_unary(tokens, k - 2)):
+                continue
+            if not (_binds_weaker(before, level, True) and _binds_weaker(after, level, False)):
+                continue
+            if token.text == '&':
+                a, b = _unquote(left), _unquote(right)
+                if a is not None and b is not None:
+                    return k - 1, k + 1, _string(a + b), 'concatenation'
+            elif left.kind == 'number' and right.kind == 'number':
+                folded = _arithmetic(left.text, token.text, right.text)
+                if folded is not None:
+                    return k - 1, k + 1, folded, 'arithmetic'
+    return None
+
+
+@lru_cache(maxsize=8192)
+def fold_formula(formula: str) -> Tuple[str, Tuple[Tuple[str, str, str], ...]]:
+    """(folded formula, ((kind, before, after), ...)); folds repeat until nothing is constant"""
+    folds = []
+    while True:
+        tokens = powerfx.significant(powerfx.tokenize(formula))
+        found = _fold_once(tokens)
+        if found is None:
+            return formula, tuple(folds)
+        first, last, replacement, kind = found
+        start, end = tokens[first].start, tokens[last].start + len(tokens[last].text)
+        folds.append((kind, formula[start:end], replacement))
+        formula = formula[:start] + replacement + formula[end:]
+
+
+def _fold(formula: str, ref=None) -> Optional[str]:
+    folded, folds = fold_formula(formula)
+    return folded if folds else None
+
+
+class ConstantFolding:
+    """Pipeline stage: {"stage": "constant_fold"}"""
+
+    name = "constant_fold"
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+
+    def run(self, package: MSAppPackage) -> Dict:
+        rewrite = FormulaRewriter([_fold]).run(package, self.dry_run)
+        yaml_only = [] if self.dry_run else rename_in_yaml(package, [_fold])
+        kinds = Counter()
+        changes = []
+        for change in rewrite["changes"]:
+            folds = fold_formula(change["before"])[1]
+            kinds.update(kind for kind, _, _ in folds)
+            changes.append({"rule": f"{change['screen']}/{change['control']}.{change['property']}",
+                            "folds": [{"from": before, "to": after} for _, before, after in folds],
+                            "bytes_saved": len(change["before"].encode('utf-8')) - len(change["after"].encode('utf-8'))})
+        return {
+            "changed_rules": len(changes),
+            "folds": sum(kinds.values()),
+            "by_kind": dict(kinds),
+            "bytes_saved": sum(c["bytes_saved"] for c in changes),
+            "changes": changes,
+            "yaml_only_changed": yaml_only
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold constant sub-expressions in control rules")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Folded.msapp)")
+    parser.add_argument("--dry-run", action="store_true", help="Report folds without writing a package")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = ConstantFolding(args.dry_run).run(package)
+    for change in report["changes"]:
+        print(f"  {change['rule']}:")
+        for fold in change["folds"]:
+            print(f"      {fold['from']}  ->  {fold['to']}")
+    for member in report["yaml_only_changed"]:
+        print(f"  {member} (pa.yaml only)")
+    if not report["folds"] and not report["yaml_only_changed"]:
+        print("Nothing to fold")
+        return 0
+    print(f"\n{report['folds']} folds in {report['changed_rules']} rules "
+          f"({', '.join(f'{n} {k}' for k, n in report['by_kind'].items())}); {report['bytes_saved']:,} bytes saved")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.dry_run:
+        output_path = Path(args.output) if args.output else input_path.parent / f"{input_path.stem}_Folded.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""
+Power Apps Control Model
+Plain-dict control tree shared by the source compilers and the Controls JSON / pa.yaml writers
+
+A control is {"Name": str, "Type": template name, "Variant": str,
+              "Properties": {property: formula}, "Children": [controls]}
+
+Canonical pa.yaml is the current Screens:/Children format with properties
+sorted by name; screen_pa_yaml(screen_from_pa_yaml(text)) == text for any
+canonical text. Round-trip tests: python -m pytest tests/test_control_model.py
+Self-check (round trip + timing on a synthetic screen):
+  python control_model.py --controls 1000
+  python control_model.py "Natural England Condition Assessment.msapp"
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import pa_yaml
+
+# Template name -> Controls JSON template info and pa.yaml control id
+TEMPLATES = {
+    "screen": {"Id": "http://microsoft.com/appmagic/screen", "Version": "1.0",
+               "Style": "defaultScreenStyle", "Yaml": None},
+    "label": {"Id": "http://microsoft.com/appmagic/label", "Version": "2.5.1",
+              "Style": "defaultLabelStyle", "Yaml": "Label@2.5.1"},
+    "rectangle": {"Id": "http://microsoft.com/appmagic/shapes/rectangle", "Version": "2.3.0",
+                  "Style": "defaultRectangleStyle", "Yaml": "Rectangle@2.3.0"},
+    "circle": {"Id": "http://microsoft.com/appmagic/shapes/circle", "Version": "2.3.0",
+               "Style": "defaultCircleStyle", "Yaml": "Circle@2.3.0"},
+    "gallery": {"Id": "http://microsoft.com/appmagic/gallery", "Version": "2.5.1",
+                "Style": "defaultGalleryStyle", "Yaml": "Gallery@2.5.1"},
+    "button": {"Id": "http://microsoft.com/appmagic/button", "Version": "2.3.0",
+               "Style": "defaultButtonStyle", "Yaml": "Button@2.3.0"},
+    "groupContainer": {"Id": "http://microsoft.com/appmagic/groupContainer", "Version": "1.3.0",
+                       "Style": "defaultGroupContainerStyle", "Yaml": "GroupContainer@1.3.0"},
+    "icon": {"Id": "http://microsoft.com/appmagic/icon", "Version": "2.5.0",
+             "Style": "defaultIconStyle", "Yaml": "Classic/Icon@2.5.0"},
+    "text": {"Id": "http://microsoft.com/appmagic/text", "Version": "2.3.2",
+             "Style": "defaultTextStyle", "Yaml": "Classic/TextInput@2.3.2"},
+    "dropdown": {"Id": "http://microsoft.com/appmagic/dropdown", "Version": "2.3.1",
+                 "Style": "defaultDropdownStyle", "Yaml": "Classic/DropDown@2.3.1"},
+    "checkbox": {"Id": "http://microsoft.com/appmagic/checkbox", "Version": "2.1.0",
+                 "Style": "defaultCheckboxStyle", "Yaml": "Classic/CheckBox@2.1.0"},
+    "datepicker": {"Id": "http://microsoft.com/appmagic/datepicker", "Version": "2.6.0",
+                   "Style": "defaultDatePickerStyle", "Yaml": "Classic/DatePicker@2.6.0"},
+}
+
+# Controls that can hold child controls
+CONTAINER_TYPES = {"screen", "gallery", "groupContainer"}
+
+# pa.yaml control id -> template name
+YAML_TYPES = {t["Yaml"]: name for name, t in TEMPLATES.items() if t["Yaml"]}
+
+_PLAIN_KEY = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+
+class PaYamlError(ValueError):
+    """Raised for pa.yaml text outside the canonical Screens:/Children format"""
+
+
+def new_control(name: str, control_type: str, properties: Dict[str, str] = None,
+                children: List[Dict] = None, variant: str = "") -> Dict:
+    """Create a control model node"""
+    return {
+        "Name": name,
+        "Type": control_type,
+        "Variant": variant,
+        "Properties": dict(properties or {}),
+        "Children": list(children or [])
+    }
+
+
+def walk(control: Dict) -> Iterator[Dict]:
+    """Depth-first walk of a control model"""
+    yield control
+    for child in control.get("Children", []):
+        yield from walk(child)
+
+
+def count_controls(control: Dict) -> Dict[str, int]:
+    """Template name -> number of controls, as used by Properties.json ControlCount"""
+    return dict(Counter(c["Type"] for c in walk(control)))
+
+
+def yaml_control_id(control_type: str) -> str:
+    template = TEMPLATES.get(control_type)
+    if template and template["Yaml"]:
+        return template["Yaml"]
+    return control_type
+
+
+def to_controls_json(control: Dict, parent: str = "", next_id: Optional[Iterator[int]] = None,
+                     publish_order: int = 0, zindex: Optional[Iterator[int]] = None) -> Dict:
+    """Control model -> ControlInfo JSON (the shape ControlsJSONGenerator produces)"""
+    template = TEMPLATES.get(control["Type"])
+    if template is None:
+        raise ValueError(f"Unsupported control type '{control['Type']}' for {control['Name']}")
+    if next_id is None:
+        next_id = iter(range(10, 1 << 30))
+    if zindex is None:
+        zindex = iter(range(1, 1 << 30))
+
+    rules = [{
+        "Property": prop,
+        "Category": "Behavior" if prop.startswith("On") else "Design",
+        "InvariantScript": formula,
+        "RuleProviderType": "User"
+    } for prop, formula in control["Properties"].items()]
+    if control["Type"] != "screen" and "ZIndex" not in control["Properties"]:
+        rules.append({"Property": "ZIndex", "Category": "Design",
+                      "InvariantScript": str(next(zindex)), "RuleProviderType": "Unknown"})
+
+    unique_id = str(next(next_id))
+    return {
+        "Type": "ControlInfo",
+        "Name": control["Name"],
+        "HasDynamicProperties": False,
+        "Template": {
+            "Id": template["Id"],
+            "Version": template["Version"],
+            "LastModifiedTimestamp": "0",
+            "Name": control["Type"],
+            "FirstParty": True,
+            "IsPremiumPcfControl": False,
+            "IsCustomGroupControlTemplate": False,
+            "CustomGroupControlTemplateName": "",
+            "IsComponentDefinition": False,
+            "OverridableProperties": {}
+        },
+        "Index": 0,
+        "PublishOrderIndex": publish_order,
+        "VariantName": control.get("Variant", ""),
+        "LayoutName": "",
+        "MetaDataIDKey": "",
+        "PersistMetaDataIDKey": False,
+        "IsFromScreenLayout": False,
+        "StyleName": template["Style"],
+        "Parent": parent,
+        "IsDataControl": control["Type"] == "gallery",
+        "AllowAccessToGlobals": True,
+        "OptimizeForDevices": "Off",
+        "IsGroupControl": False,
+        "IsAutoGenerated": False,
+        "Rules": rules,
+        "ControlPropertyState": [r["Property"] for r in rules],
+        "IsLocked": False,
+        "ControlUniqueId": unique_id,
+        "Children": [to_controls_json(child, control["Name"], next_id, order, zindex)
+                     for order, child in enumerate(control.get("Children", []))]
+    }
+
+
+def screen_controls_json(screen: Dict, start_unique_id: int = 10, index: int = 0) -> Dict:
+    """Controls/*.json document for a screen model"""
+    top = to_controls_json(screen, next_id=iter(range(start_unique_id, 1 << 30)))
+    top["Index"] = index
+    return {"TopParent": top}
+
+
+def from_controls_json(control: Dict, include_defaults: bool = False) -> Dict:
+    """ControlInfo JSON -> control model
+
+    Only 'User' rules become properties unless include_defaults is set; the
+    rest are Studio defaults that pa.yaml leaves out.
+    """
+    root = new_control(control.get("Name", ""), control.get("Template", {}).get("Name", ""),
+                       variant=control.get("VariantName", ""))
+    stack = [(control, root)]
+    while stack:
+        info, node = stack.pop()
+        for rule in info.get("Rules", []):
+            if include_defaults or rule.get("RuleProviderType") == "User":
+                node["Properties"][rule["Property"]] = rule.get("InvariantScript", "")
+        for child in info.get("Children", []):
+            child_node = new_control(child.get("Name", ""), child.get("Template", {}).get("Name", ""),
+                                     variant=child.get("VariantName", ""))
+            node["Children"].append(child_node)
+            stack.append((child, child_node))
+    return root
+
+
+def _rule_category(prop: str) -> str:
+    return "Behavior" if prop.startswith("On") else "Design"
+
+
+def _merge_rules(info: Dict, properties: Dict[str, str], prune: bool) -> List[str]:
+    """Set a ControlInfo's User rules from model properties; returns the User rules missing from the model"""
+    rules = {rule["Property"]: rule for rule in info.setdefault("Rules", [])}
+    for prop, formula in properties.items():
+        rule = rules.get(prop)
+        if rule is None:
+            info["Rules"].append({"Property": prop, "Category": _rule_category(prop),
+                                  "InvariantScript": formula, "RuleProviderType": "User"})
+            info.setdefault("ControlPropertyState", []).append(prop)
+        else:
+            rule["InvariantScript"] = formula
+            rule["RuleProviderType"] = "User"
+    missing = [prop for prop, rule in rules.items()
+               if rule.get("RuleProviderType") == "User" and prop not in properties]
+    if prune and missing:
+        info["Rules"] = [r for r in info["Rules"] if r["Property"] not in missing]
+        info["ControlPropertyState"] = [
+            s for s in info.get("ControlPropertyState", [])
+            if (s.get("InvariantPropertyName") if isinstance(s, dict) else s) not in missing]
+    return missing
+
+
+def merge_controls_json(screen: Dict, top: Dict, next_id: Iterator[int], prune: bool = False) -> Dict:
+    """Apply a screen model (e.g. parsed from edited pa.yaml) onto its existing ControlInfo tree
+
+    Controls are matched by name and keep their ControlUniqueId, template and
+    Studio default rules; User rules follow the model. New controls take ids
+    from next_id. Controls and User rules absent from the model are only
+    removed when prune is set. Returns {"added", "missing_controls", "missing_rules"}.
+    """
+    existing = {c["Name"]: c for c in walk_controls_json(top)}
+    in_model = {c["Name"] for c in walk(screen)}
+    zindex = iter(range(len(existing) + 1, 1 << 30))
+    changes = {"added": [], "missing_controls": [n for n in existing if n not in in_model], "missing_rules": []}
+
+    stack = [(screen, top)]
+    while stack:
+        node, info = stack.pop()
+        missing = _merge_rules(info, node["Properties"], prune)
+        changes["missing_rules"].extend(f"{node['Name']}.{prop}" for prop in missing)
+        if node.get("Variant"):
+            info["VariantName"] = node["Variant"]
+
+        children = []
+        for order, child in enumerate(node.get("Children", [])):
+            match = existing.get(child["Name"])
+            if match is not None and match.get("Template", {}).get("Name") == child["Type"]:
+                match["Parent"] = node["Name"]
+                match["PublishOrderIndex"] = order
+                children.append(match)
+                stack.append((child, match))
+            else:
+                children.append(to_controls_json(child, node["Name"], next_id, order, zindex))
+                changes["added"].extend(c["Name"] for c in walk(child))
+        if not prune:
+            # Keep controls the model does not mention (moved controls are placed where the model puts them)
+            children += [c for c in info.get("Children", []) if c["Name"] not in in_model]
+        info["Children"] = children
+    return changes
+
+
+def walk_controls_json(control: Dict) -> Iterator[Dict]:
+    """Depth-first walk of a ControlInfo tree"""
+    stack = [control]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(current.get("Children", [])))
+
+
+def _yaml_key(name: str) -> str:
+    return name if _PLAIN_KEY.match(name) else json.dumps(name, ensure_ascii=False)
+
+
+def _emit_properties(properties: Dict[str, str], indent: int, out: List[str]):
+    pad = ' ' * indent
+    for prop in sorted(properties):
+        value = properties[prop]
+        value = value if value.startswith('=') else '=' + value
+        if pa_yaml.needs_block(value):
+            out.extend(pa_yaml.format_property(_yaml_key(prop), value, indent))
+        else:
+            out.append(f"{pad}{_yaml_key(prop)}: {value}")
+
+
+def screen_pa_yaml(screen: Dict) -> str:
+    """Src/<Screen>.pa.yaml text for a screen model (canonical Screens:/Children format)
+
+    One pass over an explicit stack into a single line buffer, so deep or
+    very large screens cost one list append per line and one join.
+    """
+    out = [pa_yaml.HEADER.rstrip('\n'), "Screens:", f"  {_yaml_key(screen['Name'])}:"]
+    if screen["Properties"]:
+        out.append("    Properties:")
+        _emit_properties(screen["Properties"], 6, out)
+    if screen.get("Children"):
+        out.append("    Children:")
+    stack = [(child, 6) for child in reversed(screen.get("Children", []))]
+    while stack:
+        control, indent = stack.pop()
+        pad = ' ' * indent
+        out.append(f"{pad}- {_yaml_key(control['Name'])}:")
+        out.append(f"{pad}    Control: {yaml_control_id(control['Type'])}")
+        if control.get("Variant"):
+            out.append(f"{pad}    Variant: {control['Variant']}")
+        if control["Properties"]:
+            out.append(f"{pad}    Properties:")
+            _emit_properties(control["Properties"], indent + 6, out)
+        if control.get("Children"):
+            out.append(f"{pad}    Children:")
+            stack.extend((child, indent + 6) for child in reversed(control["Children"]))
+    out.append('')
+    return '\n'.join(out)
+
+
+def _split_key(text: str, line_no: int) -> Tuple[str, str]:
+    """'Key: value' -> (key, value); keys may be JSON double-quoted"""
+    if text.startswith('"'):
+        try:
+            key, end = json.JSONDecoder().raw_decode(text)
+        except ValueError:
+            raise PaYamlError(f"line {line_no}: bad quoted key")
+        rest = text[end:]
+    else:
+        colon = text.find(':')
+        key, rest = (text[:colon], text[colon:]) if colon > 0 else (text, '')
+    if not rest.startswith(':'):
+        raise PaYamlError(f"line {line_no}: expected 'key:' in '{text}'")
+    return key, rest[2:] if rest.startswith(': ') else rest[1:].strip()
+
+
+def screen_from_pa_yaml(text: str) -> Dict:
+    """Canonical pa.yaml (as written by screen_pa_yaml or Power Apps Studio) -> screen model"""
+    # Only structural lines are CR-stripped: a CR inside a block formula is part of the formula
+    lines = text.split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    n = len(lines)
+
+    stripped = [line.lstrip(' ') for line in lines]
+    indents = [len(line) - len(rest) for line, rest in zip(lines, stripped)]
+    # Blank and comment lines (only skipped between keys, never inside a block formula)
+    ignorable = [not rest.strip() or rest.startswith('#') for rest in stripped]
+
+    def skip(i: int) -> int:
+        while i < n and ignorable[i]:
+            i += 1
+        return i
+
+    def indent_of(i: int) -> int:
+        return indents[i]
+
+    def parse_properties(i: int, indent: int, properties: Dict[str, str]) -> int:
+        while True:
+            i = skip(i)
+            if i >= n or indent_of(i) < indent:
+                return i
+            if indent_of(i) != indent:
+                raise PaYamlError(f"line {i + 1}: unexpected indentation")
+            name, value = _split_key(lines[i][indent:].rstrip('\r'), i + 1)
+            i += 1
+            if value in ('|', '|-', '|+'):
+                body = []
+                while i < n and (indents[i] >= indent + 2 or not stripped[i].strip()):
+                    body.append(lines[i][indent + 2:])
+                    i += 1
+                if value == '|+':
+                    value = '\n'.join(body) + '\n'
+                else:
+                    while body and not body[-1]:
+                        body.pop()
+                    value = '\n'.join(body) + ('\n' if value == '|' else '')
+            properties[name] = value[1:] if value.startswith('=') else value
+
+    def parse_body(i: int, indent: int, control: Dict) -> int:
+        while True:
+            i = skip(i)
+            if i >= n or indent_of(i) < indent:
+                return i
+            if indent_of(i) != indent:
+                raise PaYamlError(f"line {i + 1}: unexpected indentation")
+            key, value = _split_key(lines[i][indent:].rstrip('\r'), i + 1)
+            i += 1
+            if key == 'Control':
+                control["Type"] = YAML_TYPES.get(value, value)
+            elif key == 'Variant':
+                control["Variant"] = value
+            elif key == 'Properties':
+                i = parse_properties(i, indent + 2, control["Properties"])
+            elif key == 'Children':
+                i = parse_children(i, indent + 2, control["Children"])
+            else:
+                raise PaYamlError(f"line {i}: unsupported key '{key}' on {control['Name']}")
+
+    def parse_children(i: int, indent: int, children: List[Dict]) -> int:
+        while True:
+            i = skip(i)
+            if i >= n or indent_of(i) < indent:
+                return i
+            if not lines[i][indent:].startswith('- '):
+                raise PaYamlError(f"line {i + 1}: expected '- <ControlName>:'")
+            name, _ = _split_key(lines[i][indent + 2:].rstrip('\r'), i + 1)
+            child = new_control(name, "")
+            children.append(child)
+            i = parse_body(i + 1, indent + 4, child)
+
+    i = skip(0)
+    if i >= n or lines[i].rstrip('\r') != 'Screens:':
+        raise PaYamlError("expected 'Screens:' (current pa.yaml format)")
+    i = skip(i + 1)
+    if i >= n or indent_of(i) != 2:
+        raise PaYamlError("no screen under 'Screens:'")
+    name, _ = _split_key(lines[i][2:].rstrip('\r'), i + 1)
+    screen = new_control(name, "screen")
+    i = parse_body(i + 1, 4, screen)
+    if skip(i) < n:
+        raise PaYamlError(f"line {skip(i) + 1}: only one screen per file is supported")
+    return screen
+
+
+def _difference(expected: Dict, actual: Dict, path: str = '') -> Optional[str]:
+    path = f"{path}/{expected['Name']}"
+    for field in ("Name", "Type", "Variant", "Properties"):
+        if expected.get(field, '') != actual.get(field, ''):
+            return f"{path}: {field} {expected.get(field)!r} != {actual.get(field)!r}"
+    if len(expected["Children"]) != len(actual["Children"]):
+        return f"{path}: {len(expected['Children'])} children != {len(actual['Children'])}"
+    for a, b in zip(expected["Children"], actual["Children"]):
+        found = _difference(a, b, path)
+        if found:
+            return found
+    return None
+
+
+def verify_roundtrip(screen: Dict) -> Optional[str]:
+    """First difference after emit -> parse -> emit, or None if the screen round-trips exactly"""
+    text = screen_pa_yaml(screen)
+    parsed = screen_from_pa_yaml(text)
+    return _difference(screen, parsed) or (
+        None if screen_pa_yaml(parsed) == text else "re-emitted text differs")
+
+
+def synthetic_screen(controls: int, name: str = "BenchScreen") -> Dict:
+    """Screen with about `controls` controls: galleries of labels plus formulas that need block scalars"""
+    screen = new_control(name, "screen", {"Fill": "RGBA(255, 255, 255, 1)", "OnVisible": "Refresh(colSites);\n"})
+    made = 1
+    while made < controls:
+        gallery = new_control(f"Gallery{made}", "gallery", {
+            "Items": 'Filter(colSites, Status = "Active")',
+            "OnSelect": 'Set(varSite, ThisItem);\nNavigate(SiteScreen, ScreenTransition.None)',
+            "Y": str(made * 10)}, variant="galleryVertical")
+        screen["Children"].append(gallery)
+        made += 1
+        for i in range(min(9, controls - made)):
+            gallery["Children"].append(new_control(f"Label{made}", "label", {
+                "Text": f'ThisItem.SiteName & ": " & {i}',
+                "Color": "varTheme.Text",
+                "Tooltip": '"Site #" & ThisItem.SiteId',
+                "Y": str(i * 20)}))
+            made += 1
+    return screen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round-trip and time the canonical pa.yaml emitter")
+    parser.add_argument("msapp", nargs="?", help="Round-trip every screen of a .msapp instead of a synthetic one")
+    parser.add_argument("--controls", type=int, default=1000, help="Synthetic screen size (default: 1000)")
+    args = parser.parse_args()
+
+    if args.msapp:
+        from msapp_package import MSAppPackage
+        package = MSAppPackage.load(Path(args.msapp))
+        screens = [from_controls_json(package.read_json(m)["TopParent"]) for m in package.control_files()
+                   if package.read_json(m).get("TopParent", {}).get("Template", {}).get("Name") == "screen"]
+    else:
+        screens = [synthetic_screen(args.controls)]
+
+    failed = 0
+    for screen in screens:
+        start = time.perf_counter()
+        text = screen_pa_yaml(screen)
+        emit_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        problem = verify_roundtrip(screen)
+        verify_ms = (time.perf_counter() - start) * 1000
+        deterministic = screen_pa_yaml(screen) == text
+        failed += bool(problem) or not deterministic
+        print(f"  {screen['Name']:<28} {sum(1 for _ in walk(screen)):>6} controls  {len(text):>9,} chars  "
+              f"emit {emit_ms:7.2f} ms  round trip {verify_ms:7.2f} ms  "
+              f"{problem or ('ok' if deterministic else 'NOT DETERMINISTIC')}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
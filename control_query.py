@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Control Tree Query API
+Indexed selector queries over every control in a package
+
+Selectors are whitespace-separated terms, all of which must match:
+  name=HeaderTitle          screen=HomeScreen        type=label (template name)
+  parent=KPIGallery         variant=galleryHorizontal member=Controls/7.json
+  rule:Fill                 control has a Fill rule
+  rule:Fill=varTheme.Primary   exact formula
+  rule:Fill~varTheme\\..*    regex search in the formula
+  key~regex                 regex on any field, e.g. name~^KPI
+'=' values containing * or ? are globs, e.g. name=KPI*
+Quote a value that contains spaces, as in a shell (backslashes are kept):
+  rule:BorderColor="RGBA(0, 18, 107, 1)"     rule:Text='"Natural England"'
+
+Usage:
+  python control_query.py app.msapp "screen=HomeScreen type=label parent=KPIGallery"
+  python control_query.py app.msapp "rule:Fill~varTheme\\." --show Fill
+"""
+
+import argparse
+import fnmatch
+import json
+import re
+import shlex
+import sys
+import time
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+sys.path.insert(0, str(Path(__file__).parent))
+from msapp_package import MSAppPackage
+
+# One indexed control; `control` is the live ControlInfo dict from the package
+ControlRef = namedtuple('ControlRef', ['id', 'name', 'type', 'screen', 'parent', 'variant', 'member', 'control'])
+
+# op is '=', '~' or '' (rule presence); prop is set for rule: terms
+Term = namedtuple('Term', ['field', 'prop', 'op', 'value'])
+
+FIELDS = ('name', 'type', 'screen', 'parent', 'variant', 'member')
+FIELD_ALIASES = {'template': 'type'}
+_TERM = re.compile(r'^(rule:[^=~]+|[a-z]+)(?:([=~])(.*))?$', re.DOTALL)
+
+
+class SelectorError(ValueError):
+    """Raised for selectors that cannot be parsed"""
+
+
+def split_selector(selector: str) -> List[str]:
+    """Shell-style split: quotes group a value with spaces and are removed; backslashes stay for regexes"""
+    lexer = shlex.shlex(selector, posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ''
+    lexer.commenters = ''
+    try:
+        return list(lexer)
+    except ValueError as e:
+        raise SelectorError(f"Cannot parse selector '{selector}': {e}")
+
+
+@lru_cache(maxsize=1024)
+def parse_selector(selector: str) -> tuple:
+    """'screen=HomeScreen rule:Fill~x' -> (Term, ...)"""
+    terms = []
+    for part in split_selector(selector):
+        match = _TERM.match(part)
+        if not match:
+            raise SelectorError(f"Cannot parse selector term '{part}'")
+        key, op, value = match.group(1), match.group(2) or '', match.group(3)
+        if key.startswith('rule:'):
+            terms.append(Term('rule', key[5:], op, value))
+            continue
+        key = FIELD_ALIASES.get(key, key)
+        if key not in FIELDS:
+            raise SelectorError(f"Unknown selector field '{key}' (use {', '.join(FIELDS)} or rule:<Property>)")
+        if not op:
+            raise SelectorError(f"Selector term '{part}' needs =value or ~regex")
+        terms.append(Term(key, None, op, value))
+    return tuple(terms)
+
+
+@lru_cache(maxsize=1024)
+def _regex(pattern: str):
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise SelectorError(f"Invalid regex '{pattern}': {e}")
+
+
+def _is_glob(value: str) -> bool:
+    return any(ch in value for ch in '*?[')
+
+
+def _rules(control: Dict) -> Dict[str, str]:
+    return {r.get('Property'): r.get('InvariantScript', '') for r in control.get('Rules', [])}
+
+
+class ControlIndex:
+    """Controls of a package indexed by name, type, screen, parent and rule property
+
+    Build once per package (and again after structural edits); lookups are
+    set intersections over the indexes followed by a filter on the rest.
+    """
+
+    def __init__(self, package: MSAppPackage):
+        self.package = package
+        self.controls: List[ControlRef] = []
+        self.indexes: Dict[str, Dict[str, Set[int]]] = {field: defaultdict(set) for field in FIELDS}
+        self.by_property: Dict[str, Set[int]] = defaultdict(set)
+        self.rules: List[Dict[str, str]] = []
+
+        for member in package.control_files():
+            top = package.read_json(member).get('TopParent')
+            if not top:
+                continue
+            stack = [(top, '')]
+            while stack:
+                control, parent = stack.pop()
+                ref = ControlRef(len(self.controls), control.get('Name', ''),
+                                 control.get('Template', {}).get('Name', ''), top.get('Name', ''),
+                                 parent, control.get('VariantName', ''), member, control)
+                self.controls.append(ref)
+                for field in FIELDS:
+                    self.indexes[field][getattr(ref, field)].add(ref.id)
+                rules = _rules(control)
+                self.rules.append(rules)
+                for prop in rules:
+                    self.by_property[prop].add(ref.id)
+                stack.extend((child, ref.name) for child in reversed(control.get('Children', [])))
+
+    def __len__(self):
+        return len(self.controls)
+
+    def _candidates(self, term: Term) -> Optional[Set[int]]:
+        """Ids an indexed term can match, or None if the term needs a scan"""
+        if term.field == 'rule':
+            return self.by_property.get(term.prop, set())
+        if term.op == '=' and not _is_glob(term.value):
+            return self.indexes[term.field].get(term.value, set())
+        if term.op == '=':
+            keys = [k for k in self.indexes[term.field] if fnmatch.fnmatchcase(k, term.value)]
+        else:
+            regex = _regex(term.value)
+            keys = [k for k in self.indexes[term.field] if regex.search(k)]
+        return set().union(*(self.indexes[term.field][k] for k in keys)) if keys else set()
+
+    def _matches_rule(self, control_id: int, term: Term) -> bool:
+        formula = self.rules[control_id].get(term.prop)
+        if formula is None:
+            return False
+        if term.op == '=':
+            return fnmatch.fnmatchcase(formula, term.value) if _is_glob(term.value) else formula == term.value
+        if term.op == '~':
+            return bool(_regex(term.value).search(formula))
+        return True
+
+    def query(self, selector: str) -> List[ControlRef]:
+        """Controls matching every term of a selector, in package order"""
+        terms = parse_selector(selector)
+        if not terms:
+            return list(self.controls)
+
+        candidate_sets = sorted((self._candidates(t) for t in terms), key=len)
+        ids = set(candidate_sets[0]).intersection(*candidate_sets[1:])
+        for term in terms:
+            if term.field == 'rule' and term.op:
+                ids = {i for i in ids if self._matches_rule(i, term)}
+        return [self.controls[i] for i in sorted(ids)]
+
+    def first(self, selector: str) -> Optional[ControlRef]:
+        found = self.query(selector)
+        return found[0] if found else None
+
+    def rule(self, ref: ControlRef, prop: str) -> Optional[str]:
+        return self.rules[ref.id].get(prop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the controls of a .msapp package")
+    parser.add_argument("msapp", help="Path to the .msapp file")
+    parser.add_argument("selector", nargs="+", help="Selector terms, e.g. screen=HomeScreen type=label")
+    parser.add_argument("--show", action="append", default=[], help="Rule to print for each match (repeatable)")
+    parser.add_argument("--count", action="store_true", help="Only print the number of matches")
+    parser.add_argument("--json", action="store_true", help="Print matches as JSON")
+    args = parser.parse_args()
+
+    package = MSAppPackage.load(Path(args.msapp))
+    start = time.perf_counter()
+    index = ControlIndex(package)
+    indexed_ms = (time.perf_counter() - start) * 1000
+
+    selector = ' '.join(args.selector)
+    start = time.perf_counter()
+    try:
+        matches = index.query(selector)
+    except SelectorError as e:
+        print(f"ERROR: {e}")
+        return 1
+    query_ms = (time.perf_counter() - start) * 1000
+
+    if args.count:
+        print(len(matches))
+    elif args.json:
+        print(json.dumps([dict({f: getattr(m, f) for f in FIELDS},
+                               rules={p: index.rule(m, p) for p in args.show}) for m in matches], indent=2))
+    else:
+        for ref in matches:
+            print(f"{ref.screen:<24} {ref.name:<32} {ref.type:<16} parent={ref.parent or '-'}")
+            for prop in args.show:
+                print(f"    {prop}: {index.rule(ref, prop)}")
+        print(f"\n{len(matches)} of {len(index)} controls "
+              f"(index {indexed_ms:.2f} ms, query {query_ms:.3f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,16 @@ Create renamed .msapp with different internal app name
 This forces Power Apps to create a NEW app instead of updating existing
 """
 
-import zipfile
-import json
-import shutil
+import argparse
+import re
+import sys
+import time
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from msapp_package import MSAppPackage
+from msapp_pipeline import MSAppPipeline, RenameApp
+
 def rename_msapp(input_path, output_path, new_name):
     """Rename app inside .msapp package"""
     print(f"Creating renamed version...")
@@ -16,68 +21,62 @@ def rename_msapp(input_path, output_path, new_name):
     print(f"  Output: {output_path.name}")
     print(f"  New App Name: {new_name}")
 
-    # Create temp directory
-    temp_dir = Path("temp_rename")
-    if temp_dir.exists():
-        shutil.rmtree(temp_dir)
-    temp_dir.mkdir()
-
-    try:
-        # Extract
-        print("\n1. Extracting original...")
-        with zipfile.ZipFile(input_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-
-        # Update Properties.json with new name
-        props_path = temp_dir / "Properties.json"
-        print(f"2. Updating {props_path.name}...")
-
-        with open(props_path, 'r', encoding='utf-8') as f:
-            props = json.load(f)
-
-        old_name = props.get('DisplayName', 'Unknown')
-
-        # Update app name fields
-        props['DisplayName'] = new_name
-        props['Name'] = new_name
-        if 'LocalizedDisplayName' in props:
-            props['LocalizedDisplayName'] = new_name
-
-        print(f"   Old name: {old_name}")
-        print(f"   New name: {new_name}")
-
-        with open(props_path, 'w', encoding='utf-8') as f:
-            json.dump(props, f, indent=2)
-
-        # Update Header.json if exists
-        header_path = temp_dir / "Header.json"
-        if header_path.exists():
-            print(f"3. Updating {header_path.name}...")
-            with open(header_path, 'r', encoding='utf-8') as f:
-                header = json.load(f)
-
-            if 'DocProperties' in header:
-                header['DocProperties']['DisplayName'] = new_name
-
-            with open(header_path, 'w', encoding='utf-8') as f:
-                json.dump(header, f, indent=2)
-
-        # Repackage
-        print(f"4. Creating new .msapp...")
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-            for file_path in temp_dir.rglob('*'):
-                if file_path.is_file():
-                    arcname = file_path.relative_to(temp_dir)
-                    zip_out.write(file_path, arcname)
-
-        file_size = output_path.stat().st_size
-        print(f"\nSUCCESS!")
-        print(f"Created: {output_path}")
-        print(f"Size: {file_size:,} bytes ({file_size / 1024:.1f} KB)")
-
-    finally:
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
+    # One pass: load, update Properties.json / Header.json, repackage
+    print(f"\nUpdating Properties.json and Header.json...")
+    report = MSAppPipeline([RenameApp(new_name)]).run(input_path, output_path)
+    print(f"   Old name: {report['stages'][0]['old_name'] or 'Unknown'}")
+    print(f"   New name: {new_name}")
+    file_size = report["package"]["output_bytes"]
+    print(f"\nSUCCESS!")
+    print(f"Created: {output_path}")
+    print(f"Size: {file_size:,} bytes ({file_size / 1024:.1f} KB)")
+
+def rename_msapp_bulk(input_path, renames):
+    """Emit one renamed package per (output_path, new_name) from a single read of the base
+
+    Only Properties.json and Header.json are rewritten; every other member is
+    deflated once and the same compressed bytes are written to every output.
+    """
+    start = time.perf_counter()
+    base = MSAppPackage.load(input_path)
+    results = []
+    for output_path, new_name in renames:
+        package = base.copy()
+        MSAppPipeline([RenameApp(new_name)]).run_package(package)
+        results.append((Path(output_path), new_name, package.save(output_path)))
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"Created {len(results)} renamed packages from {Path(input_path).name} in {elapsed:.0f} ms")
+    for output_path, new_name, file_size in results:
+        print(f"  {output_path.name:<50} {new_name} ({file_size:,} bytes)")
+    return results
+
+def output_file_name(new_name):
+    """Safe .msapp file name for an app name"""
+    return re.sub(r'[<>:"/\\|?*]', '_', new_name).strip() + ".msapp"
+
+def bulk_main(argv):
+    parser = argparse.ArgumentParser(description="Create renamed copies of a .msapp (one read of the base)")
+    parser.add_argument("input", help="Base .msapp package")
+    parser.add_argument("names", nargs="*", help="New app names")
+    parser.add_argument("--names-file", help="File with one app name per line")
+    parser.add_argument("--output-dir", default=".", help="Directory for the renamed packages")
+    args = parser.parse_args(argv)
+
+    names = list(args.names)
+    if args.names_file:
+        with open(args.names_file, 'r', encoding='utf-8') as f:
+            names.extend(line.strip() for line in f if line.strip())
+    if not names:
+        parser.error("no app names given")
+    input_file = Path(args.input)
+    if not input_file.exists():
+        print(f"ERROR: Input file not found: {input_file}")
+        return 1
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rename_msapp_bulk(input_file, [(output_dir / output_file_name(n), n) for n in names])
+    return 0
 
 def main():
     base_dir = Path(r"c:\Users\abhis\Documents\DEFRA\NRMS\Condition Assessment\condition-assessment")
@@ -116,4 +115,6 @@ def main():
     print("\n9. If it works, you can delete the old app")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(bulk_main(sys.argv[1:]))
     main()
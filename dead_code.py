@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Dead Collection and Variable Elimination
+Reachability analysis over every formula in a package (Controls JSON rules,
+App OnStart/Formulas and screen pa.yaml), then removal of what nothing reads:
+
+  Set(varCurrentUser, User())        removed when no formula reads varCurrentUser
+  ClearCollect(colSites, ...)        removed when no formula reads colSites
+  {"Name": "colMethods", ...}        DataSources.json collection entry removed
+
+A write is only removed when it is a whole statement (a top-level statement
+or a Concurrent argument) and its value only calls pure built-in functions;
+connector operations and flow runs (MyFlow.Run(...)) are always kept.
+Reads from removed statements do not keep a name alive, so chains of unused
+variables go together. Anything else that mentions a name (Patch, Remove,
+SaveData, a Set nested inside If) keeps it.
+
+Usage:
+  python dead_code.py app.msapp --dry-run
+  python dead_code.py app.msapp out.msapp --keep varCurrentUser --report dead.json
+"""
+
+import argparse
+import json
+import sys
+from collections import namedtuple
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from delegation_check import formula_sites
+from formula_rewrite import FormulaRewriter
+from msapp_package import MSAppPackage
+from named_formulas import impure_calls, rename_in_yaml
+from onstart_concurrency import DATASOURCES
+
+# Calls whose first argument is only written (its old value is never read)
+DEFINING_FUNCTIONS = {'Set': 'variable', 'ClearCollect': 'collection', 'Collect': 'collection',
+                      'Clear': 'collection'}
+
+Unit = namedtuple('Unit', ['target', 'removable', 'reads', 'writes'])
+
+
+def _unit(text: str) -> Unit:
+    """One statement: the name it defines (if it is a single Set/ClearCollect/...), whether it can be
+    dropped on its own, the names it reads and every name it writes (kind by name)"""
+    tokens = powerfx.significant(powerfx.tokenize(text))
+    reads, writes = set(), {}
+    for k, token in enumerate(tokens):
+        name = powerfx.identifier_name(token)
+        if name is None or (k + 1 < len(tokens) and tokens[k + 1].text == '('):
+            continue
+        if k >= 2 and tokens[k - 1].text == '(' and tokens[k - 2].text in DEFINING_FUNCTIONS:
+            writes[name] = DEFINING_FUNCTIONS[tokens[k - 2].text]
+        elif not (k > 0 and tokens[k - 1].text == '.'):
+            reads.add(name)
+
+    call = powerfx.parse_call(text)
+    if not (call and call[0] in DEFINING_FUNCTIONS and call[1]):
+        return Unit(None, False, reads, writes)
+    pure = not impure_calls(','.join(call[1][1:]))
+    return Unit(call[1][0], pure and list(writes) == [call[1][0]], reads, writes)
+
+
+def find_dead(formulas: List[str], declared: Set[str] = frozenset(), keep: Set[str] = frozenset()) -> Dict:
+    """Variables and collections no live statement reads
+
+    declared are collections known without a write (DataSources.json entries).
+    Returns {"dead": {name: kind}, "kept": {name: reason}} for unread names.
+    """
+    units = [_unit(text) for formula in formulas for _, _, text in powerfx.statement_units(formula)]
+    kinds = {name: 'collection' for name in declared}
+    for unit in units:
+        kinds.update(unit.writes)
+    stuck = set().union(*(unit.writes for unit in units if not unit.removable))
+
+    # Greatest fixpoint: start from everything and revive names read by statements that stay
+    dead = set(kinds)
+    while True:
+        read = set().union(*(u.reads for u in units if not (u.removable and u.target in dead)))
+        alive = dead & (read | stuck | set(keep))
+        if not alive:
+            break
+        dead -= alive
+    unread = set(kinds) - read
+    kept = {name: "kept by request" for name in unread & set(keep)}
+    kept.update({name: "written inside a larger statement or with side effects"
+                 for name in unread & stuck - set(keep)})
+    return {"dead": {name: kinds[name] for name in sorted(dead)}, "kept": dict(sorted(kept.items()))}
+
+
+def drop_statements(dead: Set[str]):
+    """Rewrite callback removing whole statements that define a dead name"""
+    def removable(text: str) -> bool:
+        unit = _unit(text)
+        return unit.removable and unit.target in dead
+
+    def drop(formula: str, ref=None) -> Optional[str]:
+        if not any(name in formula for name in dead):
+            return None
+        kept, changed = [], False
+        for statement in powerfx.split_statements(formula):
+            args = powerfx.concurrent_args(statement)
+            parts = [statement] if args is None else args
+            alive = [part for part in parts if not removable(part)]
+            if len(alive) == len(parts):
+                kept.append(statement)
+                continue
+            changed = True
+            if len(alive) > 1:
+                kept.append(powerfx.format_concurrent(alive))
+            elif alive:
+                kept.append(alive[0])
+        return powerfx.join_statements(kept) if changed else None
+    return drop
+
+
+def declared_collections(package: MSAppPackage) -> Set[str]:
+    if not package.exists(DATASOURCES):
+        return set()
+    return {s.get('Name') for s in package.read_json(DATASOURCES).get('DataSources', [])
+            if s.get('Type') == 'Collection'}
+
+
+class DeadCodeElimination:
+    """Pipeline stage: {"stage": "dead_code", "keep": ["varCurrentUser"]}"""
+
+    name = "dead_code"
+
+    def __init__(self, keep: List[str] = None, dry_run: bool = False):
+        self.keep = set(keep or [])
+        self.dry_run = dry_run
+
+    def run(self, package: MSAppPackage) -> Dict:
+        sites = formula_sites(package)
+        declared = declared_collections(package)
+        analysis = find_dead([s.formula for s in sites], declared, self.keep)
+        dead = analysis["dead"]
+        onstart = package.get_app_formula('OnStart') or ''
+
+        report = {
+            "variables": [n for n, kind in dead.items() if kind == 'variable'],
+            "collections": [n for n, kind in dead.items() if kind == 'collection'],
+            "datasources": sorted(declared & set(dead)),
+            "kept": analysis["kept"]
+        }
+        if not dead:
+            return report
+
+        drop = drop_statements(set(dead))
+        rewrite = FormulaRewriter([drop]).run(package, self.dry_run)
+        yaml_only = [] if self.dry_run else rename_in_yaml(package, [drop])
+        if report["datasources"] and not self.dry_run:
+            document = package.read_json(DATASOURCES)
+            document["DataSources"] = [s for s in document.get("DataSources", [])
+                                       if not (s.get('Type') == 'Collection' and s.get('Name') in dead)]
+            package.write_json(DATASOURCES, document)
+
+        new_onstart = drop(onstart) or onstart
+        report.update({
+            "changed_rules": [f"{c['screen']}/{c['control']}.{c['property']}" for c in rewrite["changes"]],
+            "yaml_only_changed": yaml_only,
+            "onstart_bytes_before": len(onstart.encode('utf-8')),
+            "onstart_bytes_after": len(new_onstart.encode('utf-8'))
+        })
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove unread collections, variables and DataSources entries")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Trimmed.msapp)")
+    parser.add_argument("--keep", action="append", default=[], metavar="NAME",
+                        help="Never remove this variable or collection (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing a package")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = DeadCodeElimination(args.keep, args.dry_run).run(package)
+    for kind in ("variables", "collections", "datasources"):
+        if report[kind]:
+            print(f"  unused {kind}: {', '.join(report[kind])}")
+    for name, reason in report["kept"].items():
+        print(f"  {name:<18} unread but kept: {reason}")
+    removed = report["variables"] or report["collections"] or report["datasources"]
+    if not removed:
+        print("Nothing to remove")
+        return 0
+    print(f"\n{len(report['changed_rules'])} rules changed; OnStart {report['onstart_bytes_before']:,} -> "
+          f"{report['onstart_bytes_after']:,} bytes")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.dry_run:
+        output_path = Path(args.output) if args.output else input_path.parent / f"{input_path.stem}_Trimmed.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Delegation and Row-Limit Analyzer
+Checks every control rule (Controls JSON and screen pa.yaml) for queries that
+will not scale once collections are replaced by server tables:
+
+  delegation-NonDelegableFunction   Search(SPList, ...), GroupBy(Sites, ...) on a source that cannot run it
+  delegation-NonDelegablePredicate  Filter(Sites, Len(Name) > 3) - the condition runs on the client
+  rowlimit-CollectFromSource        ClearCollect(colSites, Sites) copies at most the data row limit
+  perf-PerRowQuery                  LookUp/Filter/CountRows inside a gallery template or AddColumns
+
+Findings are written as SARIF in the AppCheckerResult.sarif format. Source
+types come from References/DataSources.json; --source maps a name to the
+type it is moving to, so a collection can be checked as the Dataverse table
+that will replace it.
+
+Usage:
+  python delegation_check.py app.msapp
+  python delegation_check.py app.msapp --source colSites=dataverse --sarif delegation.sarif
+  python delegation_check.py app.msapp out.msapp          # also embed DelegationCheckResult.sarif
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter, namedtuple
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import control_model
+import powerfx
+from msapp_package import MSAppPackage
+from onstart_concurrency import DATASOURCES
+from sarif import result_message, sarif_log, sarif_result, sarif_rule, write_sarif
+
+SARIF_MEMBER = 'DelegationCheckResult.sarif'
+DEFAULT_ROW_LIMIT = 500
+
+LOCAL_KINDS = {'collection', 'static'}
+SOURCE_KINDS = ('dataverse', 'sharepoint', 'sql', 'excel', 'connector', 'collection', 'static')
+KIND_LABELS = {'dataverse': 'Dataverse', 'sharepoint': 'SharePoint', 'sql': 'SQL Server', 'excel': 'Excel Online',
+               'connector': 'a connector'}
+
+# Functions whose first argument is the table they query
+TABLE_FUNCTIONS = {'Filter', 'Search', 'Sort', 'SortByColumns', 'FirstN', 'LastN', 'AddColumns', 'DropColumns',
+                   'ShowColumns', 'RenameColumns', 'Distinct', 'GroupBy', 'Ungroup'}
+QUERY_FUNCTIONS = TABLE_FUNCTIONS | {'LookUp', 'First', 'Last', 'CountRows', 'CountIf', 'CountA', 'Sum', 'Average',
+                                     'Min', 'Max', 'StdevP', 'VarP', 'Concat', 'ForAll', 'RemoveIf', 'UpdateIf'}
+# Which arguments are evaluated against each row (and must translate to a server query)
+ROW_ARGUMENTS = {'Filter': slice(1, None), 'LookUp': slice(1, 2), 'CountIf': slice(1, None),
+                 'RemoveIf': slice(1, None), 'Sort': slice(1, 2), 'Sum': slice(1, 2), 'Average': slice(1, 2),
+                 'Min': slice(1, 2), 'Max': slice(1, 2)}
+
+_SHAPING = {'AddColumns', 'DropColumns', 'ShowColumns', 'RenameColumns'}
+_CONDITION = {'StartsWith', 'IsBlank', 'Not', 'And', 'Or'}
+
+# Source kind -> functions the server runs, functions allowed on columns in conditions, operators it cannot run
+DELEGABLE_FUNCTIONS = {
+    'dataverse': {'Filter', 'Search', 'LookUp', 'Sort', 'SortByColumns', 'First', 'CountRows', 'CountIf',
+                  'Sum', 'Average', 'Min', 'Max', 'RemoveIf', 'UpdateIf'} | _SHAPING,
+    'sharepoint': {'Filter', 'LookUp', 'Sort', 'SortByColumns', 'First'} | _SHAPING,
+    'sql': {'Filter', 'Search', 'LookUp', 'Sort', 'SortByColumns', 'First', 'Sum', 'Average', 'Min', 'Max',
+            'RemoveIf', 'UpdateIf'} | _SHAPING,
+    'excel': set(),
+    'connector': set()
+}
+CONDITION_FUNCTIONS = {'dataverse': _CONDITION, 'sharepoint': _CONDITION, 'sql': _CONDITION | {'EndsWith'},
+                       'excel': set(), 'connector': set()}
+NON_DELEGABLE_OPERATORS = {'dataverse': {'&', '*', '/', 'exactin'}, 'sharepoint': {'&', '+', '-', '*', '/', 'in', 'exactin'},
+                           'sql': {'&', 'exactin'}, 'excel': set(), 'connector': set()}
+
+# Identifiers that are never a column of the queried table
+KEYWORDS = {'true', 'false', 'And', 'Or', 'Not', 'in', 'exactin', 'As', 'ThisRecord', 'ThisItem', 'Self',
+            'Parent', 'App', 'Host'}
+
+RULES = [
+    sarif_rule("delegation-NonDelegableFunction",
+               "{0} cannot be delegated to {1} ({2}); only the first {3} rows are processed",
+               "Power Apps runs non-delegable queries over the rows it downloads, which stops at the data row "
+               "limit, so results are silently incomplete on large tables.",
+               ["Use a function the data source can run, or narrow the table with a delegable Filter first."],
+               level="High"),
+    sarif_rule("delegation-NonDelegablePredicate",
+               "{0} in the {1} condition on {2} cannot be delegated to {3}; the condition runs on the first {4} "
+               "rows only",
+               "A condition is only sent to the server when every part of it can be translated; one function or "
+               "operator applied to a column makes the whole query local.",
+               ["Compare columns directly (=, <, StartsWith, IsBlank), or store the computed value in a column."],
+               level="High"),
+    sarif_rule("rowlimit-CollectFromSource",
+               "{0} copies at most {1} rows of {2} into {3}",
+               "Collecting from a server table downloads one page limited by the data row limit; rows beyond it "
+               "never reach the collection.",
+               ["Query the table directly from the control, or collect a delegable Filter that stays under the "
+                "limit."],
+               level="Medium"),
+    sarif_rule("perf-PerRowQuery",
+               "{0}({1}) is evaluated once per row of {2}",
+               "A lookup inside a gallery template or AddColumns runs for every row, one request per row for "
+               "server tables.",
+               ["Join the data once in the Items formula (or a collection) and read ThisItem fields in the "
+                "template."],
+               level="Medium"),
+]
+
+Site = namedtuple('Site', ['screen', 'control', 'type', 'prop', 'formula', 'gallery'])
+Finding = namedtuple('Finding', ['rule', 'arguments', 'level'])
+
+
+def source_kind(entry: Dict) -> str:
+    """DataSources.json entry -> one of SOURCE_KINDS"""
+    kind = entry.get('Type', '')
+    if kind == 'Collection':
+        return 'collection'
+    if kind == 'StaticDataSourceInfo':
+        return 'static'
+    if kind == 'NativeCDSDataSourceInfo':
+        return 'dataverse'
+    api = str(entry.get('ApiId', '')).lower()
+    for marker, name in (('sharepointonline', 'sharepoint'), ('sql', 'sql'), ('excelonline', 'excel')):
+        if marker in api:
+            return name
+    return 'connector'
+
+
+def row_limit(package: MSAppPackage) -> int:
+    if not package.exists('Properties.json'):
+        return DEFAULT_ROW_LIMIT
+    return int(package.read_json('Properties.json').get('DefaultConnectedDataSourceMaxGetRowsCount')
+               or DEFAULT_ROW_LIMIT)
+
+
+def formula_sites(package: MSAppPackage) -> List[Site]:
+    """Every rule in the package with the gallery (if any) whose template contains the control
+
+    Controls JSON rules come first; screen pa.yaml properties are added where the JSON has no rule.
+    """
+    sites, seen = [], set()
+    for member in package.control_files():
+        top = package.read_json(member).get('TopParent')
+        if not top:
+            continue
+        stack = [(top, None)]
+        while stack:
+            control, gallery = stack.pop()
+            kind = control.get('Template', {}).get('Name', '')
+            for rule in control.get('Rules', []):
+                site = Site(top.get('Name', ''), control.get('Name', ''), kind, rule.get('Property'),
+                            rule.get('InvariantScript', ''), gallery)
+                sites.append(site)
+                seen.add(site[:2] + site[3:4])
+            inner = control.get('Name') if kind == 'gallery' else gallery
+            stack.extend((child, inner) for child in reversed(control.get('Children', [])))
+
+    for member in package.names():
+        if not (member.startswith('Src/') and member.endswith('.pa.yaml')):
+            continue
+        try:
+            screen = control_model.screen_from_pa_yaml(package.read_text(member))
+        except control_model.PaYamlError:
+            continue
+        stack = [(screen, None)]
+        while stack:
+            control, gallery = stack.pop()
+            for prop, formula in control["Properties"].items():
+                if (screen["Name"], control["Name"], prop) not in seen:
+                    sites.append(Site(screen["Name"], control["Name"], control["Type"], prop, formula, gallery))
+            inner = control["Name"] if control["Type"] == 'gallery' else gallery
+            stack.extend((child, inner) for child in reversed(control["Children"]))
+    return sites
+
+
+def data_sources(package: MSAppPackage, sites: List[Site], overrides: Dict[str, str] = None) -> Dict[str, str]:
+    """name -> source kind: DataSources.json, then every collection a formula creates, then overrides"""
+    kinds = {}
+    if package.exists(DATASOURCES):
+        for entry in package.read_json(DATASOURCES).get('DataSources', []):
+            kinds[entry.get('Name')] = source_kind(entry)
+    for site in sites:
+        if 'Collect' not in site.formula:
+            continue
+        tokens = _tokens(site.formula)
+        for k, name, args in _calls(tokens):
+            if name in ('Collect', 'ClearCollect') and args and args[0][1] - args[0][0] == 1:
+                kinds.setdefault(powerfx.identifier_name(tokens[args[0][0]]), 'collection')
+    kinds.update(overrides or {})
+    return kinds
+
+
+def global_names(sites: List[Site], kinds: Dict[str, str]) -> Set[str]:
+    """Names that are not table columns: controls, screens, variables, named formulas and data sources"""
+    names = set(kinds) | KEYWORDS
+    for site in sites:
+        names.update((site.screen, site.control))
+        if site.prop == 'Formulas':
+            names.update(name for name, _ in powerfx.parse_named_formulas(site.formula))
+        if 'Set' not in site.formula and 'UpdateContext' not in site.formula:
+            continue
+        tokens = _tokens(site.formula)
+        for k, name, args in _calls(tokens):
+            if name == 'Set' and args:
+                names.add(powerfx.identifier_name(tokens[args[0][0]]))
+            elif name == 'UpdateContext' and args:
+                record = powerfx.parse_record(_text(tokens, args[0]))
+                names.update(field for field, _ in record or [])
+    names.discard(None)
+    return names
+
+
+def _tokens(formula: str) -> List:
+    return powerfx.significant(powerfx.tokenize(formula))
+
+
+def _text(tokens: List, span: Tuple[int, int]) -> str:
+    return ' '.join(t.text for t in tokens[span[0]:span[1]])
+
+
+def _arguments(tokens: List, open_k: int) -> Tuple[List[Tuple[int, int]], int]:
+    """Argument spans of the call whose '(' is at open_k, and the index of its ')'"""
+    spans, depth, start = [], 0, open_k + 1
+    for k in range(open_k, len(tokens)):
+        text = tokens[k].text
+        if text in powerfx.OPEN_BRACKETS:
+            depth += 1
+        elif text in powerfx.CLOSE_BRACKETS:
+            depth -= 1
+            if depth == 0:
+                if k > start or spans:
+                    spans.append((start, k))
+                return spans, k
+        elif text == ',' and depth == 1:
+            spans.append((start, k))
+            start = k + 1
+    return spans, len(tokens)
+
+
+def _calls(tokens: List) -> Iterator[Tuple[int, str, List[Tuple[int, int]]]]:
+    """(index, function name, argument spans) for every call in a token list"""
+    for k in range(len(tokens) - 1):
+        if tokens[k].kind == 'ident' and tokens[k + 1].text == '(':
+            yield k, tokens[k].text, _arguments(tokens, k + 1)[0]
+
+
+def _source(tokens: List, span: Tuple[int, int], kinds: Dict[str, str]) -> Optional[str]:
+    """Data source a table argument reads, following delegable Filter/Sort/... wrappers"""
+    start, end = span
+    if end - start == 1:
+        name = powerfx.identifier_name(tokens[start])
+        return name if name in kinds else None
+    function = tokens[start].text
+    if tokens[start].kind != 'ident' or function not in TABLE_FUNCTIONS or tokens[start + 1].text != '(':
+        return None
+    args, close = _arguments(tokens, start + 1)
+    if close != end - 1 or not args:
+        return None
+    source = _source(tokens, args[0], kinds)
+    if source is None:
+        return None
+    kind = kinds[source]
+    return source if kind in LOCAL_KINDS or function in DELEGABLE_FUNCTIONS[kind] else None
+
+
+def _is_column(tokens: List, k: int, names: Set[str]) -> bool:
+    name = powerfx.identifier_name(tokens[k])
+    if name is None:
+        return False
+    if k > 0 and tokens[k - 1].text == '.':
+        return k > 1 and tokens[k - 2].text == 'ThisRecord'
+    following = tokens[k + 1].text if k + 1 < len(tokens) else ''
+    return following not in ('(', '.') and name not in names
+
+
+def _references_column(tokens: List, span: Tuple[int, int], names: Set[str]) -> bool:
+    return any(_is_column(tokens, k, names) for k in range(*span))
+
+
+def _condition_findings(tokens: List, span: Tuple[int, int], function: str, source: str, kind: str,
+                        names: Set[str], kinds: Dict[str, str], limit: int) -> Iterator[Finding]:
+    """Parts of a row condition that stop the query from being delegated"""
+    allowed = CONDITION_FUNCTIONS[kind]
+    operators = NON_DELEGABLE_OPERATORS[kind]
+    reported = set()
+    for k in range(*span):
+        token = tokens[k]
+        if token.kind == 'ident' and k + 1 < span[1] and tokens[k + 1].text == '(':
+            if token.text in allowed or token.text in reported:
+                continue
+            args, close = _arguments(tokens, k + 1)
+            if token.text in QUERY_FUNCTIONS and args and _source(tokens, args[0], kinds):
+                continue  # a query of its own, checked separately
+            if _references_column(tokens, (k + 2, close), names):
+                reported.add(token.text)
+                yield Finding("delegation-NonDelegablePredicate",
+                              [f"{token.text}()", function, source, KIND_LABELS[kind], limit], None)
+        elif token.text in operators and token.kind in ('op', 'ident') and token.text not in reported:
+            neighbours = [j for j in (k - 1, k + 1) if span[0] <= j < span[1]]
+            if any(_is_column(tokens, j, names) for j in neighbours):
+                reported.add(token.text)
+                yield Finding("delegation-NonDelegablePredicate",
+                              [f"operator '{token.text}'", function, source, KIND_LABELS[kind], limit], None)
+
+
+def analyze_formula(formula: str, gallery: Optional[str], kinds: Dict[str, str], names: Set[str],
+                    limit: int) -> List[Finding]:
+    """Delegation, row-limit and per-row findings for one formula"""
+    if not any(name in formula for name in kinds):
+        return []
+    tokens = _tokens(formula)
+    findings = []
+    per_row_until = -1
+    for k, function, args in _calls(tokens):
+        if function in ('Collect', 'ClearCollect') and len(args) > 1:
+            target = _text(tokens, args[0])
+            for span in args[1:]:
+                source = _source(tokens, span, kinds)
+                if source and kinds[source] not in LOCAL_KINDS:
+                    findings.append(Finding("rowlimit-CollectFromSource", [function, limit, source, target], None))
+            continue
+        if function not in QUERY_FUNCTIONS or not args:
+            continue
+        source = _source(tokens, args[0], kinds)
+        if source is None:
+            continue
+        kind = kinds[source]
+        remote = kind not in LOCAL_KINDS
+
+        if remote and function not in DELEGABLE_FUNCTIONS[kind]:
+            findings.append(Finding("delegation-NonDelegableFunction",
+                                    [f"{function}()", source, KIND_LABELS[kind], limit], None))
+        elif remote:
+            for span in args[ROW_ARGUMENTS.get(function, slice(0))]:
+                findings.extend(_condition_findings(tokens, span, function, source, kind, names, kinds, limit))
+
+        if function == 'AddColumns':
+            for span in args[2::2]:
+                inner_until = -1
+                for j, inner, inner_args in _calls(tokens[span[0]:span[1]]):
+                    shifted = [(a + span[0], b + span[0]) for a, b in inner_args]
+                    inner_source = inner in QUERY_FUNCTIONS and shifted and _source(tokens, shifted[0], kinds)
+                    if inner_source and j + span[0] > inner_until:
+                        inner_until = shifted[-1][1]
+                        findings.append(Finding("perf-PerRowQuery", [inner, inner_source, f"AddColumns({source})"],
+                                                "Low" if kinds[inner_source] in LOCAL_KINDS else "High"))
+        if gallery and k > per_row_until:
+            per_row_until = _arguments(tokens, k + 1)[1]
+            findings.append(Finding("perf-PerRowQuery", [function, source, gallery],
+                                    "High" if remote else "Low"))
+    return findings
+
+
+def check_delegation(package: MSAppPackage, overrides: Dict[str, str] = None) -> Tuple[Dict, Dict]:
+    """Analyze every formula in a package; returns (SARIF log, summary)"""
+    sites = formula_sites(package)
+    kinds = data_sources(package, sites, overrides)
+    names = global_names(sites, kinds)
+    limit = row_limit(package)
+
+    results = []
+    for site in sites:
+        for finding in analyze_formula(site.formula, site.gallery, kinds, names, limit):
+            location = f"{site.control}.{site.prop}" if site.control == site.screen else \
+                f"{site.screen}.{site.control}.{site.prop}"
+            results.append(sarif_result(RULES, finding.rule, location, site.screen, site.type, site.prop,
+                                        finding.arguments, finding.level))
+    log = sarif_log("msapp delegation check", "1.0", RULES, results)
+    summary = {
+        "formulas": len(sites),
+        "row_limit": limit,
+        "sources": {name: kind for name, kind in sorted(kinds.items())},
+        "findings": len(results),
+        "by_rule": dict(Counter(r["ruleId"] for r in results)),
+        "by_level": dict(Counter(r["properties"]["level"] for r in results)),
+        "results": [{"rule": r["ruleId"], "level": r["properties"]["level"],
+                     "location": r["locations"][0]["logicalLocations"][0]["fullyQualifiedName"],
+                     "message": result_message(log, r)} for r in results]
+    }
+    return log, summary
+
+
+def parse_sources(specs: List[str]) -> Dict[str, str]:
+    """['colSites=dataverse', ...] -> {'colSites': 'dataverse'}"""
+    sources = {}
+    for spec in specs:
+        name, _, kind = spec.partition('=')
+        if kind not in SOURCE_KINDS:
+            raise ValueError(f"--source expects NAME=KIND with KIND one of {', '.join(SOURCE_KINDS)}, got '{spec}'")
+        sources[name] = kind
+    return sources
+
+
+class DelegationCheck:
+    """Pipeline stage: {"stage": "delegation_check", "sources": {"colSites": "dataverse"}}"""
+
+    name = "delegation_check"
+
+    def __init__(self, sources: Dict[str, str] = None, sarif_member: Optional[str] = SARIF_MEMBER):
+        self.sources = dict(sources or {})
+        self.sarif_member = sarif_member
+
+    def run(self, package: MSAppPackage) -> Dict:
+        log, summary = check_delegation(package, self.sources)
+        if self.sarif_member:
+            package.write(self.sarif_member, json.dumps(log))
+            summary["sarif_member"] = self.sarif_member
+        summary["warnings"] = [f"{r['location']}: {r['message']}" for r in summary.pop("results")
+                               if r["level"] == "High"]
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag non-delegable queries, row-limit hazards and per-row lookups")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help=f"Also save a copy of the package with {SARIF_MEMBER}")
+    parser.add_argument("--source", action="append", default=[], metavar="NAME=KIND",
+                        help=f"Treat a data source or collection as KIND ({', '.join(SOURCE_KINDS)}); repeatable")
+    parser.add_argument("--sarif", help="SARIF output path (default: <input>_Delegation.sarif)")
+    parser.add_argument("--report", help="Write the JSON summary to this path")
+    parser.add_argument("--strict", action="store_true", help="Exit with status 2 when there are High findings")
+    args = parser.parse_args()
+
+    try:
+        overrides = parse_sources(args.source)
+    except ValueError as e:
+        parser.error(str(e))
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    log, summary = check_delegation(package, overrides)
+    for result in summary["results"]:
+        print(f"  [{result['level']:<6}] {result['location']}: {result['message']}")
+    remote = {n: k for n, k in summary["sources"].items() if k not in LOCAL_KINDS}
+    print(f"\n{summary['findings']} findings in {summary['formulas']} formulas "
+          f"(row limit {summary['row_limit']}; server sources: {', '.join(f'{n}={k}' for n, k in remote.items()) or 'none'})")
+
+    sarif_path = Path(args.sarif) if args.sarif else input_path.parent / f"{input_path.stem}_Delegation.sarif"
+    write_sarif(sarif_path, log)
+    print(f"Created: {sarif_path}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    if args.output:
+        package.write(SARIF_MEMBER, json.dumps(log))
+        package.save(Path(args.output))
+        print(f"Created: {args.output}")
+    return 2 if args.strict and summary["by_level"].get("High") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""
+Example member transformer plugin for msapp_pipeline.py
+
+    {"stage": "transform_members", "plugins": ["examples/member_plugin.py"]}
+"""
+
+import re
+
+PARSER_ERRORS = re.compile(r'"(ParserErrorCount|BindingErrorCount)": \d+')
+
+
+def register(registry):
+    @registry.transformer('Controls/*.json', needs='json')
+    def unlock_screens(name, document):
+        """Clear IsLocked on every top-level screen"""
+        top = document.get('TopParent', {})
+        if top.get('IsLocked'):
+            top['IsLocked'] = False
+            return document
+        return None
+
+    @registry.transformer('Properties.json', needs='text')
+    def reset_error_counts(name, text):
+        """Zero the parser/binding error counters left by a failed Studio save"""
+        updated = PARSER_ERRORS.sub(lambda m: f'"{m.group(1)}": 0', text)
+        return updated if updated != text else None
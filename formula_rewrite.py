@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Bulk Formula Rewrite Engine
+Token-aware find/replace (or callback) rewrites over every control formula,
+applied to the Controls JSON rules and mirrored into the Src/*.pa.yaml files
+
+Patterns match on significant tokens, so whitespace and comments inside a
+match are ignored and strings are never touched:
+  RGBA(0, 18, 107, 1)  also matches  RGBA(0,18,107,1)
+  colSites             matches the identifier only, not "colSites" in a string
+
+--rename also renames a Type "Collection" entry of the same name in
+References/DataSources.json, so the declaration follows the formulas.
+
+Usage:
+  python formula_rewrite.py app.msapp out.msapp --replace "RGBA(0, 18, 107, 1)=>RGBA(0, 0, 0, 0)" --property BorderColor
+  python formula_rewrite.py app.msapp out.msapp --rename colMethods=colSurveyMethods
+  python formula_rewrite.py app.msapp --replace "Font.'Segoe UI'=>Font.'Open Sans'" --dry-run
+"""
+
+import argparse
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import pa_yaml
+import powerfx
+from control_query import ControlIndex, ControlRef
+from msapp_package import MSAppPackage
+from onstart_concurrency import DATASOURCES
+
+
+class TokenReplace:
+    """Replace every token sequence equal to `pattern` with `replacement`"""
+
+    def __init__(self, pattern: str, replacement: str):
+        self.pattern = [t.text for t in powerfx.significant(powerfx.tokenize(pattern))]
+        if not self.pattern:
+            raise ValueError("Empty rewrite pattern")
+        self.replacement = replacement
+        self.description = f"{pattern} => {replacement}"
+
+    def __call__(self, formula: str, ref: ControlRef = None) -> Optional[str]:
+        tokens = powerfx.significant(powerfx.tokenize(formula))
+        size = len(self.pattern)
+        spans = []
+        i = 0
+        while i <= len(tokens) - size:
+            if tokens[i].text == self.pattern[0] and [t.text for t in tokens[i:i + size]] == self.pattern:
+                last = tokens[i + size - 1]
+                spans.append((tokens[i].start, last.start + len(last.text)))
+                i += size
+            else:
+                i += 1
+        if not spans:
+            return None
+        parts = []
+        position = 0
+        for start, end in spans:
+            parts.append(formula[position:start])
+            parts.append(self.replacement)
+            position = end
+        parts.append(formula[position:])
+        return ''.join(parts)
+
+
+class IdentifierRename(TokenReplace):
+    """TokenReplace of one identifier; a declared collection of that name is renamed with it"""
+
+    def __init__(self, old: str, new: str):
+        super().__init__(old, powerfx.format_name(new))
+        tokens = powerfx.significant(powerfx.tokenize(old))
+        self.old = powerfx.identifier_name(tokens[0]) if len(tokens) == 1 else None
+        self.new = new
+
+
+def rename_identifier(old: str, new: str) -> TokenReplace:
+    """Rename a collection/variable/control identifier"""
+    return IdentifierRename(old, new)
+
+
+def rename_collections(package: MSAppPackage, renames: Dict[str, str], dry_run: bool = False) -> List[str]:
+    """Rename Type "Collection" entries in References/DataSources.json; returns "old -> new" per entry"""
+    if not renames or not package.exists(DATASOURCES):
+        return []
+    document = package.read_json(DATASOURCES)
+    sources = document.get('DataSources', [])
+    declared = {s.get('Name') for s in sources}
+    renamed = []
+    for source in sources:
+        old = source.get('Name')
+        new = renames.get(old)
+        # An existing entry under the new name already declares it; leave both for the caller
+        if source.get('Type') != 'Collection' or new is None or new in declared:
+            continue
+        renamed.append(f"{old} -> {new}")
+        if not dry_run:
+            source['Name'] = new
+    if renamed and not dry_run:
+        package.mark_dirty(DATASOURCES)
+    return renamed
+
+
+class FormulaRewriter:
+    """Applies rewrites to matching control rules in one pass over the control index"""
+
+    def __init__(self, rewrites: List[Callable], selector: str = '', properties: List[str] = None):
+        self.rewrites = rewrites
+        self.selector = selector
+        self.properties = set(properties) if properties else None
+
+    def rewrite(self, formula: str, ref: ControlRef) -> str:
+        for rewrite in self.rewrites:
+            result = rewrite(formula, ref)
+            if result is not None:
+                formula = result
+        return formula
+
+    def run(self, package: MSAppPackage, dry_run: bool = False) -> Dict:
+        index = ControlIndex(package)
+        selector = self.selector
+        if self.properties and len(self.properties) == 1:
+            selector = f"{selector} rule:{next(iter(self.properties))}".strip()
+
+        memo: Dict[str, str] = {}
+        changes = []
+        yaml_edits: Dict[str, List[Tuple[Optional[str], str, str]]] = defaultdict(list)
+        dirty_members = set()
+
+        for ref in index.query(selector):
+            for rule in ref.control.get('Rules', []):
+                prop = rule.get('Property')
+                if self.properties and prop not in self.properties:
+                    continue
+                before = rule.get('InvariantScript', '')
+                # Identical formulas (generator defaults) are rewritten once; callbacks see each control
+                if before in memo and all(isinstance(r, TokenReplace) for r in self.rewrites):
+                    after = memo[before]
+                else:
+                    after = memo[before] = self.rewrite(before, ref)
+                if after == before:
+                    continue
+                changes.append({"screen": ref.screen, "control": ref.name, "property": prop,
+                                "member": ref.member, "before": before, "after": after})
+                if dry_run:
+                    continue
+                rule['InvariantScript'] = after
+                dirty_members.add(ref.member)
+                yaml_edits[f"Src/{ref.screen}.pa.yaml"].append(
+                    (None if ref.name == ref.screen else ref.name, prop, after))
+
+        yaml_updated = []
+        yaml_missing = []
+        for member in dirty_members:
+            package.mark_dirty(member)
+        for yaml_member, edits in yaml_edits.items():
+            if not package.exists(yaml_member):
+                continue
+            text = package.read_text(yaml_member)
+            updated = text
+            for control, prop, formula in edits:
+                # Only mirror properties the YAML spells out (it omits defaults such as ZIndex)
+                if pa_yaml.get_property(updated, prop, control) is None:
+                    yaml_missing.append(f"{yaml_member}: {control or 'screen'}.{prop}")
+                    continue
+                updated = pa_yaml.set_property(updated, prop, formula, control)
+            if updated != text:
+                package.write(yaml_member, updated)
+                yaml_updated.append(yaml_member)
+
+        renames = {r.old: r.new for r in self.rewrites if isinstance(r, IdentifierRename) and r.old}
+        datasources_renamed = rename_collections(package, renames, dry_run)
+
+        return {
+            "rewrites": [getattr(r, 'description', getattr(r, '__name__', repr(r))) for r in self.rewrites],
+            "controls_scanned": len(index),
+            "changed_rules": len(changes),
+            "datasources_renamed": datasources_renamed,
+            "affected_controls": sorted({f"{c['screen']}/{c['control']}" for c in changes}),
+            "yaml_updated": sorted(yaml_updated),
+            "yaml_not_mirrored": yaml_missing,
+            "changes": changes
+        }
+
+
+class RewriteFormulas:
+    """Pipeline stage wrapper: {"stage": "rewrite_formulas", "replace": {...}, "rename": {...}}"""
+
+    name = "rewrite_formulas"
+
+    def __init__(self, replace: Dict[str, str] = None, rename: Dict[str, str] = None,
+                 selector: str = '', properties: List[str] = None):
+        rewrites = [TokenReplace(p, r) for p, r in (replace or {}).items()]
+        rewrites += [rename_identifier(o, n) for o, n in (rename or {}).items()]
+        self.rewriter = FormulaRewriter(rewrites, selector, properties)
+
+    def run(self, package: MSAppPackage) -> Dict:
+        report = self.rewriter.run(package)
+        report.pop("changes")
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token-aware bulk formula rewrite for a .msapp package")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Rewritten.msapp)")
+    parser.add_argument("--replace", action="append", default=[], metavar="FROM=>TO",
+                        help="Replace a formula fragment (repeatable)")
+    parser.add_argument("--rename", action="append", default=[], metavar="OLD=NEW",
+                        help="Rename an identifier, e.g. a collection (repeatable)")
+    parser.add_argument("--selector", default="", help="Limit to controls matching a control_query selector")
+    parser.add_argument("--property", action="append", dest="properties", help="Limit to a property (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without writing a package")
+    args = parser.parse_args()
+
+    rewrites = []
+    for spec in args.replace:
+        if '=>' not in spec:
+            parser.error(f"--replace expects FROM=>TO, got '{spec}'")
+        rewrites.append(TokenReplace(*spec.split('=>', 1)))
+    for spec in args.rename:
+        if '=' not in spec:
+            parser.error(f"--rename expects OLD=NEW, got '{spec}'")
+        rewrites.append(rename_identifier(*spec.split('=', 1)))
+    if not rewrites:
+        parser.error("nothing to do: give --replace and/or --rename")
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = FormulaRewriter(rewrites, args.selector, args.properties).run(package, dry_run=args.dry_run)
+
+    for change in report["changes"]:
+        print(f"  {change['screen']}/{change['control']}.{change['property']}: "
+              f"{change['before'][:60]} -> {change['after'][:60]}")
+    print(f"\n{report['changed_rules']} rules in {len(report['affected_controls'])} controls "
+          f"(of {report['controls_scanned']} scanned)")
+    for missing in report["yaml_not_mirrored"]:
+        print(f"   NOTE: not in pa.yaml (Controls JSON only): {missing}")
+    for renamed in report["datasources_renamed"]:
+        print(f"  DataSources.json collection: {renamed}")
+
+    if not args.dry_run and (report["changed_rules"] or report["datasources_renamed"]):
+        output_path = Path(args.output) if args.output else \
+            input_path.parent / f"{input_path.stem}_Rewritten.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+FX Screen Source Compiler
+Compiles src/screens/*.fx control trees into the control model used by the Python builders
+"""
+
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+import powerfx
+from control_model import CONTAINER_TYPES, new_control
+
+# .fx constructor -> control template name
+FX_TYPES = {
+    "Screen": "screen",
+    "Label": "label",
+    "Rectangle": "rectangle",
+    "Circle": "circle",
+    "Gallery": "gallery",
+    "Button": "button",
+    "Container": "groupContainer",
+    "Icon": "icon",
+    "TextInput": "text",
+    "Dropdown": "dropdown",
+    "Checkbox": "checkbox",
+    "DatePicker": "datepicker",
+}
+
+
+class FXCompileError(ValueError):
+    """Raised when an .fx file cannot be compiled to a control tree"""
+
+
+def _property(arg: str):
+    """('Prop', 'formula') for a 'Prop: formula' argument, None otherwise"""
+    tokens = powerfx.significant(powerfx.tokenize(arg))
+    if len(tokens) >= 3 and tokens[0].kind in ('ident', 'qident') and tokens[1].text == ':':
+        end = tokens[-1].start + len(tokens[-1].text)
+        return powerfx.identifier_name(tokens[0]), arg[tokens[2].start:end]
+    return None
+
+
+def _strip_comments(arg: str) -> str:
+    return ''.join(t.text for t in powerfx.tokenize(arg) if t.kind != 'comment').strip()
+
+
+def _scoped(formula: str, scopes: List[str]) -> str:
+    """Wrap a formula in the enclosing With(...) records whose fields it uses"""
+    for scope in reversed(scopes):
+        fields = {name for name, _ in powerfx.parse_record(scope) or []}
+        names = {powerfx.identifier_name(t) for t in powerfx.significant(powerfx.tokenize(formula))}
+        if fields & names:
+            formula = f"With({scope}, {formula})"
+    return formula
+
+
+class FXScreenCompiler:
+    """Turns one Screen(...) definition into a control model"""
+
+    def __init__(self, screen_name: str):
+        self.screen_name = screen_name
+        self.counters = Counter()
+
+    def control_name(self, fx_type: str) -> str:
+        self.counters[fx_type] += 1
+        return f"{self.screen_name}{fx_type}{self.counters[fx_type]}"
+
+    def conditional_controls(self, arg: str, name: str, condition: str = None, scopes: List[str] = ()) -> List:
+        """[(control call, Visible condition, With scopes)] for Control(...), nested
+        If(cond, Control(...)[, Control(...)]) or With({record}, Control(...))"""
+        arg = _strip_comments(arg)
+        call = powerfx.parse_call(arg)
+        if call and call[0] in FX_TYPES:
+            return [(call, condition, list(scopes))]
+        if call and call[0] == "If" and len(call[1]) in (2, 3):
+            test = _scoped(call[1][0], list(scopes))
+            branch_conditions = [test, f"!({test})"]
+            result = []
+            for branch, branch_condition in zip(call[1][1:], branch_conditions):
+                if condition:
+                    branch_condition = f"({condition}) && ({branch_condition})"
+                result.extend(self.conditional_controls(branch, name, branch_condition, scopes))
+            return result
+        if call and call[0] == "With" and len(call[1]) == 2 and powerfx.parse_record(call[1][0]) is not None:
+            return self.conditional_controls(call[1][1], name, condition, list(scopes) + [call[1][0]])
+        raise FXCompileError(f"{name}: cannot compile argument '{arg[:60]}'")
+
+    def build(self, fx_type: str, args: List[str], name: str, scopes: List[str] = ()) -> List[Dict]:
+        """Build a control; children of non-container controls are hoisted after it"""
+        control_type = FX_TYPES[fx_type]
+        control = new_control(name, control_type)
+        nested = []
+        for arg in args:
+            prop = _property(arg)
+            if prop:
+                control["Properties"][prop[0]] = _scoped(prop[1], list(scopes))
+                continue
+            for call, visible, inner in self.conditional_controls(arg, name, scopes=scopes):
+                children = self.build(call[0], call[1], self.control_name(call[0]), inner)
+                if visible is not None:
+                    current = children[0]["Properties"].get("Visible")
+                    children[0]["Properties"]["Visible"] = f"({visible}) && ({current})" if current else visible
+                nested.extend(children)
+
+        if control_type == "gallery":
+            layout = control["Properties"].pop("Layout", "Layout.Vertical")
+            control["Variant"] = "galleryHorizontal" if layout.endswith("Horizontal") else "galleryVertical"
+
+        if control_type in CONTAINER_TYPES:
+            control["Children"] = nested
+            return [control]
+        return [control] + nested
+
+    def compile(self, text: str) -> Dict:
+        tokens = powerfx.significant(powerfx.tokenize(text))
+        start = next((i for i, t in enumerate(tokens[:-1])
+                      if t.text == "Screen" and tokens[i + 1].text == "("), None)
+        if start is None:
+            raise FXCompileError(f"{self.screen_name}: no Screen(...) definition found")
+        call = powerfx.parse_call(text[tokens[start].start:tokens[-1].start + len(tokens[-1].text)].rstrip(';'))
+        if call is None:
+            raise FXCompileError(f"{self.screen_name}: unbalanced Screen(...) definition")
+        return self.build("Screen", call[1], self.screen_name)[0]
+
+
+def compile_screen(path: Path, screen_name: str = None) -> Dict:
+    """Compile an .fx screen file; the screen is named after the file unless given"""
+    path = Path(path)
+    text = path.read_text(encoding='utf-8')
+    return FXScreenCompiler(screen_name or path.stem).compile(text)
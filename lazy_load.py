@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Per-screen Lazy Collection Loading
+Maps which screens reference which collections (Controls JSON rules and
+Src/*.pa.yaml properties) and moves each OnStart ClearCollect into the
+OnVisible of the screens that use it, guarded so it runs once:
+
+  OnStart:    ...;ClearCollect(colFeatures,{...});...
+  OnVisible:  If(!varColFeaturesLoaded, ClearCollect(colFeatures,{...}); Set(varColFeaturesLoaded, true))
+
+A load stays in OnStart when the app itself (another OnStart statement,
+App.Formulas, a component) uses the collection, or when the load reads
+something another OnStart statement writes. Unused collections are left
+alone and reported.
+
+Usage:
+  python lazy_load.py app.msapp --dry-run
+  python lazy_load.py app.msapp out.msapp --report lazy.json
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Set
+
+sys.path.insert(0, str(Path(__file__).parent))
+import control_model
+import pa_yaml
+import powerfx
+from control_query import ControlIndex
+from msapp_package import MSAppPackage, set_rule
+from onstart_concurrency import Statement
+
+
+@lru_cache(maxsize=8192)
+def referenced_names(formula: str) -> FrozenSet[str]:
+    """Identifiers a formula mentions (functions excluded)"""
+    tokens = powerfx.significant(powerfx.tokenize(formula))
+    return frozenset(powerfx.identifier_name(t) for k, t in enumerate(tokens)
+                     if powerfx.identifier_name(t) is not None
+                     and not (k + 1 < len(tokens) and tokens[k + 1].text == '('))
+
+
+def loaded_flag(collection: str) -> str:
+    """varColSitesLoaded for colSites"""
+    return f"var{collection[:1].upper()}{collection[1:]}Loaded"
+
+
+def guarded_load(collection: str, statement: str) -> str:
+    flag = loaded_flag(collection)
+    return f"If(!{flag}, {statement}; Set({flag}, true))"
+
+
+def collection_usage(package: MSAppPackage, index: ControlIndex = None) -> Dict[str, Dict[str, Set[str]]]:
+    """name -> {screen or App/component: {control.property, ...}} over Controls JSON and screen pa.yaml"""
+    index = index or ControlIndex(package)
+    usage: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+    for ref in index.controls:
+        owner = ref.screen if ref.member.startswith('Controls/') else f"{ref.member}:{ref.screen}"
+        for prop, formula in index.rules[ref.id].items():
+            for name in referenced_names(formula):
+                usage[name][owner].add(f"{ref.name}.{prop}")
+    for member in package.names():
+        if not (member.startswith('Src/') and member.endswith('.pa.yaml')):
+            continue
+        try:
+            screen = control_model.screen_from_pa_yaml(package.read_text(member))
+        except control_model.PaYamlError:
+            continue
+        for control in control_model.walk(screen):
+            for prop, formula in control["Properties"].items():
+                for name in referenced_names(formula):
+                    usage[name][screen["Name"]].add(f"{control['Name']}.{prop}")
+    return usage
+
+
+def screen_order(package: MSAppPackage, index: ControlIndex) -> List[str]:
+    """Screens in the order a user reaches them: the StartScreen first, then by screen Index"""
+    screens = sorted((ref for ref in index.query('type=screen parent=') if ref.member.startswith('Controls/')),
+                     key=lambda ref: ref.control.get('Index', 0))
+    names = [ref.name for ref in screens]
+    start = referenced_names(package.get_app_formula('StartScreen') or '') & set(names)
+    first = [n for n in names if n in start][:1] or names[:1]
+    return first + [n for n in names if n not in first]
+
+
+def prepend_on_visible(package: MSAppPackage, index: ControlIndex, screen: str, statements: List[str],
+                       warnings: List[str]):
+    """Run statements at the start of a screen's OnVisible (Controls JSON and Src pa.yaml)"""
+    ref = index.first(f"name={screen} type=screen")
+    current = index.rule(ref, 'OnVisible') or ''
+    formula = powerfx.join_statements(statements + powerfx.split_statements(current))
+    set_rule(ref.control, 'OnVisible', formula)
+    package.mark_dirty(ref.member)
+
+    yaml_member = f"Src/{screen}.pa.yaml"
+    if package.exists(yaml_member):
+        try:
+            package.write(yaml_member, pa_yaml.set_property(package.read_text(yaml_member), 'OnVisible', formula))
+        except ValueError as e:
+            warnings.append(f"{yaml_member}: {e}; OnVisible only set in Controls JSON")
+
+
+class LazyLoadCollections:
+    """Pipeline stage: {"stage": "lazy_load"}"""
+
+    name = "lazy_load"
+
+    def __init__(self, collections: List[str] = None, dry_run: bool = False):
+        self.collections = set(collections) if collections else None
+        self.dry_run = dry_run
+
+    def run(self, package: MSAppPackage) -> Dict:
+        onstart = package.get_app_formula('OnStart') or ''
+        units = powerfx.statement_units(onstart)
+        statements = [Statement(text, set()) for _, _, text in units]
+        index = ControlIndex(package)
+        app = index.first('type=appinfo')
+        usage = collection_usage(package, index)
+        order = screen_order(package, index)
+        formulas = package.get_app_formula('Formulas') or ''
+
+        plan = {}
+        report = {"moved": [], "kept": {}, "unused": [], "warnings": []}
+        for k, (_, _, text) in enumerate(units):
+            call = powerfx.parse_call(text)
+            if not (call and call[0] == 'ClearCollect' and call[1]):
+                continue
+            collection = call[1][0]
+            if self.collections is not None and collection not in self.collections:
+                continue
+            statement = statements[k]
+            owners = usage.get(collection, {})
+            screens = [s for s in order if s in owners]
+            others = sorted(o for o in owners if o not in order and not (app and o == app.screen))
+            readers = [s.label for i, s in enumerate(statements) if i != k and collection in s.reads | s.writes]
+            inputs = [s.label for i, s in enumerate(statements) if i != k and s.writes & statement.reads]
+
+            if statement.barrier:
+                report["kept"][collection] = "load has ordering side effects"
+            elif readers:
+                report["kept"][collection] = f"used by OnStart: {', '.join(readers)}"
+            elif inputs:
+                report["kept"][collection] = f"load depends on OnStart: {', '.join(inputs)}"
+            elif collection in referenced_names(formulas):
+                report["kept"][collection] = "used by App.Formulas"
+            elif others:
+                report["kept"][collection] = f"used outside screens: {', '.join(others)}"
+            elif not screens:
+                report["unused"].append(collection)
+            else:
+                plan[k] = (collection, screens)
+
+        if not plan:
+            return report
+
+        loads_by_screen: Dict[str, List[str]] = defaultdict(list)
+        for k, (collection, screens) in plan.items():
+            for screen in screens:
+                loads_by_screen[screen].append(guarded_load(collection, units[k][2]))
+            report["moved"].append({
+                "collection": collection,
+                "first_screen": screens[0],
+                "screens": screens,
+                "bytes": len(units[k][2].encode('utf-8')),
+                "estimated_ms": round(statements[k].cost_ms, 2),
+                "used_by": {s: sorted(usage[collection][s]) for s in screens}
+            })
+
+        remaining = onstart
+        for k in sorted(plan, reverse=True):
+            remaining = powerfx.replace_unit(remaining, units[k][0], units[k][1], None)
+        moved_ms = sum(m["estimated_ms"] for m in report["moved"])
+        total_ms = sum(s.cost_ms for s in statements)
+        start_screen = order[0] if order else None
+        report.update({
+            "onstart_ms_before": round(total_ms, 2),
+            "onstart_ms_after": round(total_ms - moved_ms, 2),
+            "start_screen": start_screen,
+            "start_screen_ms": round(sum(m["estimated_ms"] for m in report["moved"] if start_screen in m["screens"]), 2)
+        })
+        if self.dry_run:
+            return report
+
+        package.set_app_formula('OnStart', remaining)
+        for screen, loads in loads_by_screen.items():
+            prepend_on_visible(package, index, screen, loads, report["warnings"])
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move OnStart collection loads to the screens that use them")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_LazyLoad.msapp)")
+    parser.add_argument("--collection", action="append", dest="collections",
+                        help="Only consider this collection (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the plan without writing a package")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = LazyLoadCollections(args.collections, args.dry_run).run(package)
+
+    for moved in report["moved"]:
+        print(f"  {moved['collection']:<18} -> {moved['first_screen']}.OnVisible"
+              f"{' (+' + ', '.join(moved['screens'][1:]) + ')' if len(moved['screens']) > 1 else ''}"
+              f"  {moved['bytes']:,} bytes, ~{moved['estimated_ms']} ms")
+    for collection, reason in report["kept"].items():
+        print(f"  {collection:<18} kept in OnStart: {reason}")
+    for collection in report["unused"]:
+        print(f"  {collection:<18} not used by any screen (left in OnStart)")
+    for warning in report["warnings"]:
+        print(f"   WARNING: {warning}")
+    if report["moved"]:
+        print(f"\nOnStart: ~{report['onstart_ms_before']} ms -> ~{report['onstart_ms_after']} ms; "
+              f"{report['start_screen']} OnVisible now loads ~{report['start_screen_ms']} ms")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.dry_run and report["moved"]:
+        output_path = Path(args.output) if args.output else \
+            input_path.parent / f"{input_path.stem}_LazyLoad.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+In-memory MSAPP Package Model
+Loads a .msapp archive once and exposes its members as bytes or parsed JSON
+"""
+
+import io
+import json
+import os
+import stat
+import struct
+import tempfile
+import time
+import zipfile
+import zlib
+from collections import Counter, namedtuple
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+import control_model
+import pa_yaml
+
+CONTROL_FOLDERS = ('Controls/', 'Components/', 'AppTests/')
+APP_YAML = 'Src/App.pa.yaml'
+EDITOR_STATE = 'Src/_EditorState.pa.yaml'
+TMPFS_ROOT = '/dev/shm'
+COMPRESS_LEVEL = 6
+
+# One deflated archive member, ready to be written into any number of archives
+CompressedMember = namedtuple('CompressedMember', ['name', 'crc', 'size', 'data'])
+
+
+class MSAppPackage:
+    """In-memory view of a .msapp archive keyed by forward-slash member names"""
+
+    def __init__(self, members: Dict[str, bytes] = None, compressed: Dict = None):
+        self.members: Dict[str, bytes] = dict(members or {})
+        self._json_cache: Dict[str, Any] = {}
+        self._dirty: set = set()
+        # name -> (source bytes, CompressedMember); valid while the member still holds those bytes
+        self._compressed: Dict[str, tuple] = dict(compressed or {})
+
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        """Normalize archive member names to forward slashes"""
+        return name.replace('\\', '/')
+
+    @classmethod
+    def load(cls, source: Union[str, Path, bytes]) -> "MSAppPackage":
+        """Read every member of a .msapp file (or raw zip bytes) into memory"""
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        members = {}
+        with zipfile.ZipFile(source, 'r') as zip_ref:
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                members[cls.normalize_name(info.filename)] = zip_ref.read(info)
+        return cls(members)
+
+    def copy(self) -> "MSAppPackage":
+        """Shallow copy - member bytes and their compressed form are shared, parsed JSON is not"""
+        self.flush()
+        # Deflate the source once so every copy reuses it for the members it leaves alone
+        for name in self.members:
+            self.compressed(name)
+        return MSAppPackage(self.members, self._compressed)
+
+    def names(self) -> List[str]:
+        """Member names in archive order"""
+        return list(self.members)
+
+    def exists(self, name: str) -> bool:
+        return name in self.members
+
+    def read(self, name: str) -> bytes:
+        """Read raw member bytes, flushing any pending JSON edits first"""
+        if name in self._dirty:
+            self._flush_member(name)
+        return self.members[name]
+
+    def read_text(self, name: str) -> str:
+        return self.read(name).decode('utf-8-sig')
+
+    def write(self, name: str, data: Union[bytes, str]):
+        """Replace (or add) a member"""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.members[name] = data
+        self._json_cache.pop(name, None)
+        self._dirty.discard(name)
+
+    def remove(self, name: str):
+        self.members.pop(name, None)
+        self._json_cache.pop(name, None)
+        self._dirty.discard(name)
+
+    def read_json(self, name: str) -> Any:
+        """Parse a JSON member once and return the cached object"""
+        if name not in self._json_cache:
+            self._json_cache[name] = json.loads(self.read_text(name))
+        return self._json_cache[name]
+
+    def write_json(self, name: str, data: Any):
+        """Store a parsed JSON member; serialized lazily on read/save"""
+        self._json_cache[name] = data
+        self._dirty.add(name)
+        if name not in self.members:
+            self.members[name] = b''
+
+    def mark_dirty(self, name: str):
+        """Flag a JSON member obtained via read_json as modified in place"""
+        self.write_json(name, self.read_json(name))
+
+    def _flush_member(self, name: str):
+        self.members[name] = json.dumps(self._json_cache[name], indent=2).encode('utf-8')
+        self._dirty.discard(name)
+
+    def flush(self):
+        """Serialize all modified JSON members back to bytes"""
+        for name in list(self._dirty):
+            self._flush_member(name)
+
+    def control_files(self) -> List[str]:
+        """Controls/*.json, Components/*.json and AppTests/*.json member names"""
+        return [n for n in self.members
+                if n.endswith('.json') and n.startswith(CONTROL_FOLDERS)]
+
+    def iter_controls(self, members: Optional[List[str]] = None) -> Iterator[Dict]:
+        """Yield every control dict (TopParent and all descendants)"""
+        for name in (members if members is not None else self.control_files()):
+            top = self.read_json(name).get('TopParent')
+            if top:
+                yield from walk_controls(top)
+
+    def find_control_file(self, top_parent: str) -> Optional[str]:
+        """Controls/*.json member whose TopParent has the given name"""
+        for name in self.control_files():
+            if name.startswith('Controls/') and \
+                    self.read_json(name).get('TopParent', {}).get('Name') == top_parent:
+                return name
+        return None
+
+    def app_control_file(self) -> Optional[str]:
+        """Controls/*.json member holding the App (appinfo) control"""
+        for name in self.control_files():
+            top = self.read_json(name).get('TopParent', {})
+            if top.get('Template', {}).get('Id', '').endswith('/appinfo'):
+                return name
+        return None
+
+    def get_app_formula(self, prop: str) -> Optional[str]:
+        """App-level formula, e.g. OnStart, from the App control JSON"""
+        member = self.app_control_file()
+        if member is None:
+            return None
+        return get_rule(self.read_json(member)['TopParent'], prop)
+
+    def set_app_formula(self, prop: str, formula: str):
+        """Set an App-level formula in both the App control JSON and Src/App.pa.yaml"""
+        member = self.app_control_file()
+        if member is not None:
+            set_rule(self.read_json(member)['TopParent'], prop, formula)
+            self.mark_dirty(member)
+        if self.exists(APP_YAML):
+            self.write(APP_YAML, pa_yaml.set_property(self.read_text(APP_YAML), prop, formula))
+
+    def max_unique_id(self, exclude: Optional[str] = None) -> int:
+        """Largest numeric ControlUniqueId, optionally ignoring one member"""
+        members = [n for n in self.control_files() if n != exclude]
+        return max((int(c['ControlUniqueId']) for c in self.iter_controls(members)
+                    if str(c.get('ControlUniqueId', '')).isdigit()), default=0)
+
+    def update_control_count(self):
+        """Recompute Properties.json ControlCount from the Controls/*.json trees"""
+        counts = Counter(c.get('Template', {}).get('Name')
+                         for c in self.iter_controls([n for n in self.control_files() if n.startswith('Controls/')]))
+        for internal in ('appinfo', 'hostControl'):
+            counts.pop(internal, None)
+        props = self.read_json('Properties.json')
+        previous = props.get('ControlCount', {})
+        control_count = dict(counts)
+        for key in ('TestSuite', 'TestCase'):
+            if key in previous:
+                control_count[key] = previous[key]
+        props['ControlCount'] = control_count
+        self.mark_dirty('Properties.json')
+
+    def set_screen(self, screen: Dict) -> str:
+        """Write a screen control model as Controls JSON + Src pa.yaml; returns the Controls member"""
+        member = self.find_control_file(screen['Name'])
+        if member:
+            top = self.read_json(member)['TopParent']
+            index, unique_id = top.get('Index', 0), int(top['ControlUniqueId'])
+            next_id = self.max_unique_id(exclude=member) + 1
+        else:
+            unique_id = self.max_unique_id() + 1
+            next_id = unique_id + 1
+            member = f"Controls/{unique_id}.json"
+            index = sum(1 for c in self.iter_controls(self.control_files()) if c.get('Template', {}).get('Name') == 'screen'
+                        and c.get('Parent', '') == '')
+
+        document = control_model.screen_controls_json(screen, start_unique_id=next_id, index=index)
+        document['TopParent']['ControlUniqueId'] = str(unique_id)
+        self.write_json(member, document)
+        self.write(f"Src/{screen['Name']}.pa.yaml", control_model.screen_pa_yaml(screen))
+        self._edit_screens_order(lambda order: order if screen['Name'] in order else order + [screen['Name']])
+        return member
+
+    def remove_screen(self, name: str) -> Optional[str]:
+        """Drop a screen's Controls JSON and Src pa.yaml; returns the removed Controls member"""
+        member = self.find_control_file(name)
+        if member:
+            self.remove(member)
+        self.remove(f"Src/{name}.pa.yaml")
+        self._edit_screens_order(lambda order: [s for s in order if s != name])
+        return member
+
+    def _edit_screens_order(self, edit: Callable[[List[str]], List[str]]):
+        """Apply an edit to the Studio screen order in Src/_EditorState.pa.yaml, if present"""
+        if not self.exists(EDITOR_STATE):
+            return
+        text = self.read_text(EDITOR_STATE)
+        order = pa_yaml.screens_order(text)
+        updated = edit(order)
+        if updated != order:
+            self.write(EDITOR_STATE, pa_yaml.set_screens_order(text, updated))
+
+    def to_bytes(self) -> bytes:
+        """Serialize the package as a zip archive"""
+        buffer = io.BytesIO()
+        self.write_zip(buffer)
+        return buffer.getvalue()
+
+    def compressed(self, name: str) -> CompressedMember:
+        """Deflate a member once; reused across saves, and by copies for unchanged members"""
+        data = self.read(name)
+        cached = self._compressed.get(name)
+        if cached is None or cached[0] is not data:
+            cached = (data, compress_member(name, data))
+            self._compressed[name] = cached
+        return cached[1]
+
+    def write_zip(self, target):
+        """Write all members with forward slashes (Power Apps compatible)"""
+        self.flush()
+        write_compressed_zip(target, [self.compressed(name) for name in self.members])
+
+    def save(self, output_path: Union[str, Path]) -> int:
+        """Publish the package atomically and return its size in bytes"""
+        return publish_atomic(output_path, self.write_zip)
+
+    def extract_to(self, directory: Union[str, Path]):
+        """Write every member below a directory (for inspecting a build)"""
+        self.flush()
+        for name, data in self.members.items():
+            path = Path(directory) / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+
+
+def compress_member(name: str, data: bytes) -> CompressedMember:
+    """Raw-deflate member data the way zipfile.ZIP_DEFLATED does"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15)
+    return CompressedMember(name, zlib.crc32(data), len(data),
+                            compressor.compress(data) + compressor.flush())
+
+
+def _dos_timestamp() -> tuple:
+    t = time.localtime()
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+def write_compressed_zip(target, members: List[CompressedMember]):
+    """Write already-deflated members as a zip archive (path or binary file object)
+
+    Equivalent to zipfile.ZIP_DEFLATED output, without recompressing anything.
+    """
+    if len(members) >= 0xFFFF:
+        raise ValueError("Too many members for a non-zip64 archive")
+    dos_time, dos_date = _dos_timestamp()
+    if isinstance(target, (str, Path)):
+        with open(target, 'wb') as f:
+            return write_compressed_zip(f, members)
+
+    central = []
+    offset = 0
+    for member in members:
+        name = member.name.encode('utf-8')
+        flags = 0 if member.name.isascii() else 0x800
+        if offset >= 0xFFFFFFFF or member.size >= 0xFFFFFFFF:
+            raise ValueError("Archive too large for a non-zip64 archive")
+        header = struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, flags, zipfile.ZIP_DEFLATED,
+                             dos_time, dos_date, member.crc, len(member.data), member.size, len(name), 0)
+        target.write(header + name)
+        target.write(member.data)
+        central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 20, 20, flags, zipfile.ZIP_DEFLATED,
+                                   dos_time, dos_date, member.crc, len(member.data), member.size,
+                                   len(name), 0, 0, 0, 0, 0o100644 << 16, offset) + name)
+        offset += len(header) + len(name) + len(member.data)
+
+    directory = b''.join(central)
+    target.write(directory)
+    target.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(members), len(members),
+                             len(directory), offset, 0))
+
+
+def workspace_root() -> Optional[str]:
+    """tmpfs when available, otherwise the system temp directory"""
+    if os.path.isdir(TMPFS_ROOT) and os.access(TMPFS_ROOT, os.W_OK):
+        return TMPFS_ROOT
+    return None
+
+
+def make_workspace(prefix: str = 'msapp_') -> Path:
+    """Create a uniquely named working directory private to this build"""
+    return Path(tempfile.mkdtemp(prefix=prefix, dir=workspace_root()))
+
+
+def publish_mode(output_path: Union[str, Path]) -> int:
+    """Mode for a published file: the existing file's, or what a plain open() would create"""
+    try:
+        return stat.S_IMODE(os.stat(output_path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def publish_atomic(output_path: Union[str, Path], write: Union[bytes, Callable]) -> int:
+    """Write to a unique temp file beside output_path, then rename it into place
+
+    write is the file content or a callable taking the open binary file.
+    Readers (and concurrent builds) only ever see a complete package.
+    """
+    output_path = Path(output_path)
+    fd, temp_name = tempfile.mkstemp(prefix=f".{output_path.name}.", suffix=".tmp",
+                                     dir=output_path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if callable(write):
+                write(f)
+            else:
+                f.write(write)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; give the package the mode it would have had without the temp file
+        os.chmod(temp_name, publish_mode(output_path))
+        os.replace(temp_name, output_path)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.unlink(temp_name)
+        raise
+    return output_path.stat().st_size
+
+
+def walk_controls(control: Dict) -> Iterator[Dict]:
+    """Depth-first walk of a control and its Children"""
+    stack = [control]
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(reversed(current.get('Children', [])))
+
+
+def get_rule(control: Dict, prop: str) -> Optional[str]:
+    """InvariantScript of a control property, None if not set"""
+    for rule in control.get('Rules', []):
+        if rule.get('Property') == prop:
+            return rule.get('InvariantScript')
+    return None
+
+
+def set_rule(control: Dict, prop: str, script: str, category: str = None):
+    """Replace (or add) a control property rule"""
+    for rule in control.setdefault('Rules', []):
+        if rule.get('Property') == prop:
+            rule['InvariantScript'] = script
+            return
+    control['Rules'].append({
+        "Property": prop,
+        "Category": category or ("Behavior" if prop.startswith('On') else "Design"),
+        "InvariantScript": script,
+        "RuleProviderType": "User"
+    })
+    states = control.setdefault('ControlPropertyState', [])
+    if prop not in states:
+        states.append(prop)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+MSAPP Transform Pipeline
+Composable transform stages applied in one pass: the source archive is read
+once, every stage edits the in-memory package, and the output is written once
+
+Pipeline JSON:
+{
+  "base": "Natural England Condition Assessment.msapp",
+  "output": "Natural England CA - ENHANCED.msapp",
+  "stages": [
+    {"stage": "set_onstart", "datasets": {"colSites": [{"SiteId": 1, "SiteName": "Kinder Scout"}]}},
+    {"stage": "enhance_homescreen"},
+    {"stage": "write_screen", "name": "ReviewScreen", "source": "src/screens/ReviewScreen.fx"},
+    {"stage": "update_datasources", "collections": ["colSites", "colFeatures"]},
+    {"stage": "rename_app", "name": "Natural England CA - ENHANCED"},
+    {"stage": "set_properties", "values": {"AppDescription": "SSSI condition assessments"}},
+    {"stage": "set_control_count"},
+    {"stage": "rewrite_formulas", "replace": {"RGBA(0, 18, 107, 1)": "RGBA(0, 0, 0, 0)"}, "properties": ["BorderColor"]},
+    {"stage": "transform_members", "plugins": ["examples/member_plugin.py"]},
+    {"stage": "sync_yaml", "direction": "to_yaml"},
+    {"stage": "named_formulas", "move": {"varTheme": "Theme", "varKPIs": "KPIs"}},
+    {"stage": "static_tables", "names": {"colSites": "Sites"}},
+    {"stage": "dead_code", "keep": ["varCurrentUser"]},
+    {"stage": "lazy_load"},
+    {"stage": "constant_fold"},
+    {"stage": "offline_cache", "collections": ["colSites", "colUsers"], "max_age_minutes": 1440},
+    {"stage": "concurrent_onstart"},
+    {"stage": "delegation_check", "sources": {"colSites": "dataverse"}},
+    {"stage": "startup_cost", "budget": 1500},
+    {"stage": "screen_budgets", "budgets": {"controls": 250}},
+    {"stage": "themes"}
+  ]
+}
+
+Member transformer plugins are modules (or .py files) with a register(registry) function:
+
+    def register(registry):
+        @registry.transformer('Controls/*.json', needs='json')
+        def unlock_controls(name, document):
+            ...                     # mutate and return document, or return None if unchanged
+"""
+
+import argparse
+import fnmatch
+import importlib
+import importlib.util
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+import optimize_msapp
+import pa_yaml
+import powerfx
+from constant_fold import ConstantFolding
+from dead_code import DeadCodeElimination
+from delegation_check import DelegationCheck
+from formula_rewrite import RewriteFormulas
+from lazy_load import LazyLoadCollections
+from msapp_package import MSAppPackage
+from named_formulas import NamedFormulas
+from offline_cache import OfflineCache
+from onstart_concurrency import ConcurrentOnStart
+from pa_yaml_sync import SyncScreenYaml
+from screen_budgets import ScreenBudgets
+from startup_cost import StartupCost
+from static_tables import StaticTables
+
+DATASOURCES = 'References/DataSources.json'
+DECODERS = ('bytes', 'text', 'json', 'yaml')
+
+
+class SetOnStart:
+    """Replace App.OnStart and/or re-seed collections in it"""
+
+    name = "set_onstart"
+
+    def __init__(self, formula: str = None, datasets: Dict[str, List[dict]] = None):
+        self.formula = formula
+        self.datasets = datasets or {}
+
+    def run(self, package: MSAppPackage) -> Dict:
+        onstart = self.formula if self.formula is not None else (package.get_app_formula('OnStart') or '')
+        for collection, rows in self.datasets.items():
+            onstart = powerfx.set_clear_collect(onstart, collection, rows)
+        package.set_app_formula('OnStart', onstart)
+        return {"statements": len(powerfx.split_statements(onstart)),
+                "seeded": sorted(self.datasets)}
+
+
+class WriteScreen:
+    """Write one screen from an .fx source or a control model, or from prebuilt pa.yaml / Controls JSON"""
+
+    name = "write_screen"
+
+    def __init__(self, name: str, source: str = None, yaml: str = None, controls: Dict = None,
+                 screen: Dict = None):
+        self.screen = name
+        self.source = source
+        self.yaml = yaml
+        self.controls = controls
+        self.model = screen
+
+    def run(self, package: MSAppPackage) -> Dict:
+        if self.source or self.model:
+            if self.model:
+                model = dict(self.model, Name=self.screen)
+            else:
+                from fx_source import compile_screen
+                model = compile_screen(Path(self.source), self.screen)
+            member = package.set_screen(model)
+            return {"screen": self.screen, "member": member}
+
+        member = None
+        if self.yaml is not None:
+            package.write(f"Src/{self.screen}.pa.yaml", self.yaml)
+        if self.controls is not None:
+            member = package.find_control_file(self.screen) or \
+                f"Controls/{package.max_unique_id() + 1}.json"
+            package.write_json(member, self.controls)
+        return {"screen": self.screen, "member": member}
+
+
+class UpdateDataSources:
+    """Declare collections in References/DataSources.json, keeping other entries"""
+
+    name = "update_datasources"
+
+    def __init__(self, collections: List[str], replace: bool = False):
+        self.collections = collections
+        self.replace = replace
+
+    def run(self, package: MSAppPackage) -> Dict:
+        document = package.read_json(DATASOURCES) if package.exists(DATASOURCES) else {"DataSources": []}
+        sources = document.setdefault("DataSources", [])
+        if self.replace:
+            sources[:] = [s for s in sources if s.get("Type") != "Collection"]
+        existing = {s.get("Name") for s in sources}
+        added = [c for c in self.collections if c not in existing]
+        sources.extend({"Name": c, "Type": "Collection"} for c in added)
+        package.write_json(DATASOURCES, document)
+        return {"added": added, "total": len(sources)}
+
+
+class RenameApp:
+    """Rename the app so Power Apps imports it as a new app"""
+
+    name = "rename_app"
+
+    def __init__(self, name: str):
+        self.new_name = name
+
+    def run(self, package: MSAppPackage) -> Dict:
+        props = package.read_json('Properties.json')
+        old_name = props.get('DisplayName')
+        props['DisplayName'] = self.new_name
+        props['Name'] = self.new_name
+        if 'LocalizedDisplayName' in props:
+            props['LocalizedDisplayName'] = self.new_name
+        package.mark_dirty('Properties.json')
+
+        if package.exists('Header.json'):
+            header = package.read_json('Header.json')
+            if 'DocProperties' in header:
+                header['DocProperties']['DisplayName'] = self.new_name
+                package.mark_dirty('Header.json')
+        return {"old_name": old_name, "new_name": self.new_name}
+
+
+class SetProperties:
+    """Set top-level Properties.json values such as AppDescription"""
+
+    name = "set_properties"
+
+    def __init__(self, values: Dict[str, Any]):
+        self.values = dict(values)
+
+    def run(self, package: MSAppPackage) -> Dict:
+        package.read_json('Properties.json').update(self.values)
+        package.mark_dirty('Properties.json')
+        return {"properties": sorted(self.values)}
+
+
+class SetControlCount:
+    """Set Properties.json ControlCount (recomputed from the controls unless given)"""
+
+    name = "set_control_count"
+
+    def __init__(self, counts: Dict[str, int] = None):
+        self.counts = counts
+
+    def run(self, package: MSAppPackage) -> Dict:
+        if self.counts is None:
+            package.update_control_count()
+        else:
+            package.read_json('Properties.json')['ControlCount'] = dict(self.counts)
+            package.mark_dirty('Properties.json')
+        return {"control_count": package.read_json('Properties.json')['ControlCount']}
+
+
+class EnhanceHomeScreen:
+    """The build_enhanced_msapp HomeScreen (Src yaml + Controls JSON + ControlCount)"""
+
+    name = "enhance_homescreen"
+
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+
+    def run(self, package: MSAppPackage) -> Dict:
+        from build_enhanced_msapp import EnhancedMSAPPBuilder
+        return dict(EnhancedMSAPPBuilder().enhance_package(package, self.verbose), screen="HomeScreen")
+
+
+class WriteMembers:
+    """Write arbitrary members (dict/list content is stored as JSON)"""
+
+    name = "write_members"
+
+    def __init__(self, members: Dict):
+        self.members = members
+
+    def run(self, package: MSAppPackage) -> Dict:
+        for name, content in self.members.items():
+            if isinstance(content, (dict, list)):
+                package.write_json(name, content)
+            else:
+                package.write(name, content)
+        return {"members": sorted(self.members)}
+
+
+class TransformerRegistry:
+    """Member transformers registered against archive path globs"""
+
+    def __init__(self):
+        self.transformers: List[Dict] = []
+
+    def add(self, pattern: str, function: Callable, needs: str = 'bytes', name: str = None):
+        if needs not in DECODERS:
+            raise ValueError(f"{name or function.__name__}: needs must be one of {', '.join(DECODERS)}")
+        self.transformers.append({"pattern": pattern, "function": function, "needs": needs,
+                                  "name": name or function.__name__})
+
+    def transformer(self, pattern: str, needs: str = 'bytes'):
+        """Decorator form of add()"""
+        def decorate(function):
+            self.add(pattern, function, needs)
+            return function
+        return decorate
+
+    def matching(self, member: str) -> List[Dict]:
+        return [t for t in self.transformers if fnmatch.fnmatchcase(member, t["pattern"])]
+
+    def load_plugin(self, plugin: str):
+        """Import a plugin module name or .py path and call its register(registry)"""
+        if plugin.endswith('.py'):
+            spec = importlib.util.spec_from_file_location(Path(plugin).stem, plugin)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        else:
+            module = importlib.import_module(plugin)
+        if not hasattr(module, 'register'):
+            raise ValueError(f"Plugin {plugin} has no register(registry) function")
+        module.register(self)
+
+
+def _load_yaml():
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("PyYAML is required for transformers that need parsed YAML (pip install pyyaml)")
+    return yaml
+
+
+class MemberDecoder:
+    """Decodes a member at most once per representation and re-encodes results"""
+
+    def __init__(self, package: MSAppPackage, name: str, decoded: Counter):
+        self.package = package
+        self.name = name
+        self.decoded = decoded
+        self.values: Dict[str, Any] = {}
+
+    def get(self, needs: str) -> Any:
+        if needs not in self.values:
+            if needs == 'bytes':
+                value = self.package.read(self.name)
+            elif needs == 'text':
+                value = self.package.read_text(self.name)
+            elif needs == 'json':
+                value = self.package.read_json(self.name)
+            else:
+                value = _load_yaml().safe_load(self.package.read_text(self.name))
+            self.decoded[needs] += 1
+            self.values[needs] = value
+        return self.values[needs]
+
+    def put(self, needs: str, value: Any):
+        if needs == 'json':
+            self.package.write_json(self.name, value)
+        elif needs == 'yaml':
+            text = _load_yaml().safe_dump(value, sort_keys=False, allow_unicode=True, width=1 << 16)
+            if self.package.read_text(self.name).startswith(pa_yaml.HEADER.splitlines()[0]):
+                text = pa_yaml.HEADER + text
+            self.package.write(self.name, text)
+        else:
+            self.package.write(self.name, value)
+        # Other representations are stale now; the next transformer re-decodes from this one
+        self.values = {needs: value}
+
+
+class TransformMembers:
+    """Run plugin transformers over matching members in the same pass"""
+
+    name = "transform_members"
+
+    def __init__(self, plugins: List[str] = None, registry: TransformerRegistry = None):
+        self.registry = registry or TransformerRegistry()
+        for plugin in plugins or []:
+            self.registry.load_plugin(plugin)
+
+    def run(self, package: MSAppPackage) -> Dict:
+        decoded = Counter()
+        changed, errors = [], []
+        matched = 0
+        for member in package.names():
+            transformers = self.registry.matching(member)
+            if not transformers:
+                continue
+            matched += 1
+            decoder = MemberDecoder(package, member, decoded)
+            for transformer in transformers:
+                try:
+                    result = transformer["function"](member, decoder.get(transformer["needs"]))
+                except Exception as e:
+                    errors.append(f"{transformer['name']} on {member}: {e}")
+                    continue
+                if result is not None:
+                    decoder.put(transformer["needs"], result)
+                    if member not in changed:
+                        changed.append(member)
+        report = {"transformers": len(self.registry.transformers), "matched_members": matched,
+                  "decoded": dict(decoded), "changed": changed}
+        if errors:
+            report["errors"] = errors
+        return report
+
+
+STAGES = {
+    SetOnStart.name: SetOnStart,
+    WriteScreen.name: WriteScreen,
+    UpdateDataSources.name: UpdateDataSources,
+    RenameApp.name: RenameApp,
+    SetProperties.name: SetProperties,
+    SetControlCount.name: SetControlCount,
+    EnhanceHomeScreen.name: EnhanceHomeScreen,
+    WriteMembers.name: WriteMembers,
+    TransformMembers.name: TransformMembers,
+    RewriteFormulas.name: RewriteFormulas,
+    SyncScreenYaml.name: SyncScreenYaml,
+    ConcurrentOnStart.name: ConcurrentOnStart,
+    NamedFormulas.name: NamedFormulas,
+    LazyLoadCollections.name: LazyLoadCollections,
+    DeadCodeElimination.name: DeadCodeElimination,
+    ConstantFolding.name: ConstantFolding,
+    StaticTables.name: StaticTables,
+    OfflineCache.name: OfflineCache,
+    DelegationCheck.name: DelegationCheck,
+    StartupCost.name: StartupCost,
+    ScreenBudgets.name: ScreenBudgets,
+    **optimize_msapp.STAGES
+}
+
+
+def create_stage(spec: Dict):
+    """Instantiate a stage from {"stage": name, **options}"""
+    options = dict(spec)
+    name = options.pop("stage")
+    if name not in STAGES:
+        raise ValueError(f"Unknown stage '{name}' (available: {', '.join(STAGES)})")
+    return STAGES[name](**options)
+
+
+class MSAppPipeline:
+    """Runs transform stages over one in-memory package"""
+
+    def __init__(self, stages: List):
+        self.stages = stages
+
+    def run_package(self, package: MSAppPackage) -> List[Dict]:
+        """Apply every stage in order; returns one report entry per stage"""
+        report = []
+        for stage in self.stages:
+            start = time.perf_counter()
+            result = stage.run(package)
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            report.append({"stage": stage.name, **result})
+        return report
+
+    def run(self, input_path: Path, output_path: Path) -> Dict:
+        """Read input_path once, apply all stages, publish output_path once"""
+        start = time.perf_counter()
+        # Before saving: output_path may be input_path
+        input_size = Path(input_path).stat().st_size
+        package = MSAppPackage.load(input_path)
+        stages = self.run_package(package)
+        output_size = package.save(output_path)
+        return {
+            "stages": stages,
+            "package": {"input_bytes": input_size, "output_bytes": output_size},
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+
+def has_errors(report: Dict) -> bool:
+    return any(stage.get("errors") for stage in report["stages"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply transform stages to a .msapp in a single pass")
+    parser.add_argument("pipeline", help="Pipeline JSON file")
+    parser.add_argument("--base", help="Override the pipeline's base package")
+    parser.add_argument("-o", "--output", help="Override the pipeline's output package")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    with open(args.pipeline, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    base = Path(args.base or spec.get("base", ""))
+    output = args.output or spec.get("output")
+    if not base.is_file():
+        print(f"ERROR: Base package not found: {base}")
+        return 1
+    if not output:
+        print("ERROR: No output package given")
+        return 1
+
+    try:
+        pipeline = MSAppPipeline([create_stage(s) for s in spec.get("stages", [])])
+        report = pipeline.run(base, Path(output))
+    except (ValueError, TypeError, KeyError) as e:
+        print(f"ERROR: {e}")
+        return 1
+
+    for stage in report["stages"]:
+        print(f"   [{stage['stage']}] {stage['elapsed_ms']} ms")
+        for error in stage.get("errors", []):
+            print(f"      ERROR: {error}")
+    print(f"Created: {output} ({report['package']['output_bytes']:,} bytes, {report['elapsed_ms']} ms)")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 2 if has_errors(report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+App.Formulas Generation Mode
+Moves static globals out of App OnStart into App.Formulas named formulas and
+renames their references in every control rule
+
+  OnStart:   Set(varTheme,{Primary:ColorValue("#1F4D3A"),...});Set(varKPIs,{...});...
+  Formulas:  Theme = {Primary:ColorValue("#1F4D3A"),...};
+             KPIs = {...};
+  Rules:     varTheme.Primary -> Theme.Primary
+
+Named formulas are evaluated on first use, so nothing is computed at launch
+unless a visible screen needs it. A variable is only moved when OnStart is
+the one place it is set and its value only calls pure built-in functions
+(a connector operation or flow run such as MyFlow.Run(...) keeps it in OnStart).
+Values using volatile functions (Now, GUID, Rand, ...) also stay: OnStart
+captures them once at launch, a named formula would recalculate them.
+
+Usage:
+  python named_formulas.py app.msapp out.msapp
+  python named_formulas.py app.msapp out.msapp --move varTheme=Theme --move varCurrentUser=CurrentUser
+  python named_formulas.py app.msapp --dry-run
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+import control_model
+import pa_yaml
+import powerfx
+from control_query import ControlIndex
+from formula_rewrite import FormulaRewriter, rename_identifier
+from msapp_package import MSAppPackage
+
+DEFAULT_MOVES = {"varTheme": "Theme", "varKPIs": "KPIs"}
+# Built-in functions without side effects. Anything else (behavior functions, connector
+# operations, flows, component functions) is assumed to have one.
+PURE_FUNCTIONS = {
+    'Abs', 'Acos', 'Acot', 'AddColumns', 'And', 'AsType', 'Asin', 'Atan', 'Atan2', 'Average', 'Blank',
+    'Boolean', 'Char', 'Coalesce', 'ColorFade', 'ColorValue', 'Concat', 'Concatenate', 'Cos', 'Cot', 'Count',
+    'CountA', 'CountIf', 'CountRows', 'Date', 'DateAdd', 'DateDiff', 'DateTime', 'DateTimeValue', 'DateValue',
+    'Day', 'Dec2Hex', 'Decimal', 'Degrees', 'Distinct', 'DropColumns', 'EDate', 'EOMonth', 'EncodeUrl',
+    'EndsWith', 'Error', 'Exp', 'Filter', 'Find', 'First', 'FirstN', 'Float', 'ForAll', 'GUID', 'GroupBy',
+    'Hex2Dec', 'Hour', 'If', 'IfError', 'Index', 'Int', 'IsBlank', 'IsBlankOrError', 'IsEmpty', 'IsError',
+    'IsMatch', 'IsNumeric', 'IsToday', 'IsType', 'ISOWeekNum', 'JSON', 'Language', 'Last', 'LastN', 'Left',
+    'Len', 'Ln', 'Log', 'LookUp', 'Lower', 'Match', 'MatchAll', 'Max', 'Mid', 'Min', 'Minute', 'Mod', 'Month',
+    'Not', 'Now', 'Or', 'Param', 'ParseJSON', 'Pi', 'PlainText', 'Power', 'Proper', 'RGBA', 'Radians', 'Rand',
+    'RandBetween', 'RenameColumns', 'Replace', 'Right', 'Round', 'RoundDown', 'RoundUp', 'Search', 'Second',
+    'Sequence', 'ShowColumns', 'Shuffle', 'Sin', 'Sort', 'SortByColumns', 'Split', 'Sqrt', 'StartsWith',
+    'StdevP', 'Substitute', 'Sum', 'Switch', 'Table', 'Tan', 'Text', 'Time', 'TimeValue', 'TimeZoneOffset',
+    'Today', 'Trim', 'TrimEnds', 'Trunc', 'Ungroup', 'UniChar', 'Upper', 'User', 'Value', 'VarP', 'WeekNum',
+    'Weekday', 'With', 'Year'
+}
+# Pure, but a new result on every evaluation - fine to drop when unused, not a static value
+VOLATILE_FUNCTIONS = {'GUID', 'IsToday', 'Now', 'Rand', 'RandBetween', 'Shuffle', 'Today'}
+
+
+def impure_calls(formula: str, pure: set = PURE_FUNCTIONS) -> set:
+    """Calls that may have side effects: functions outside `pure` and every X.Y(...) operation"""
+    tokens = powerfx.significant(powerfx.tokenize(formula))
+    impure = set()
+    for k, token in enumerate(tokens[:-1]):
+        if token.kind != 'ident' or tokens[k + 1].text != '(':
+            continue
+        if k >= 2 and tokens[k - 1].text == '.':
+            impure.add(f"{tokens[k - 2].text}.{token.text}")
+        elif token.text not in pure:
+            impure.add(token.text)
+    return impure
+
+
+def _sets_variable(formula: str, variable: str) -> bool:
+    """True if a formula contains Set(variable, ...) anywhere"""
+    if variable not in formula:
+        return False
+    tokens = powerfx.significant(powerfx.tokenize(formula))
+    return any(t.text == 'Set' and tokens[k + 1].text == '(' and powerfx.identifier_name(tokens[k + 2]) == variable
+               for k, t in enumerate(tokens[:-2]))
+
+
+def rename_in_yaml(package: MSAppPackage, renames: List) -> List[str]:
+    """Apply renames to screen pa.yaml properties that have no Controls JSON rule to mirror from"""
+    renamed = []
+    for member in package.names():
+        if not (member.startswith('Src/') and member.endswith('.pa.yaml')):
+            continue
+        text = package.read_text(member)
+        try:
+            screen = control_model.screen_from_pa_yaml(text)
+        except control_model.PaYamlError:
+            continue
+        updated = text
+        for control in control_model.walk(screen):
+            for prop, formula in control["Properties"].items():
+                new = formula
+                for rename in renames:
+                    new = rename(new) or new
+                if new != formula:
+                    target = None if control is screen else control["Name"]
+                    updated = pa_yaml.set_property(updated, prop, new, target)
+                    renamed.append(f"{member}: {control['Name']}.{prop}")
+        if updated != text:
+            package.write(member, updated)
+    return renamed
+
+
+class NamedFormulas:
+    """Pipeline stage: {"stage": "named_formulas", "move": {"varTheme": "Theme", "varKPIs": "KPIs"}}"""
+
+    name = "named_formulas"
+
+    def __init__(self, move: Dict[str, str] = None, dry_run: bool = False):
+        self.moves = dict(move or DEFAULT_MOVES)
+        self.dry_run = dry_run
+
+    def run(self, package: MSAppPackage) -> Dict:
+        onstart = package.get_app_formula('OnStart') or ''
+        existing = powerfx.parse_named_formulas(package.get_app_formula('Formulas') or '')
+        index = ControlIndex(package)
+        app = index.first('type=appinfo')
+        in_use = {ref.name for ref in index.controls} | {name for name, _ in existing}
+
+        units = {}
+        for position, arg, statement in powerfx.statement_units(onstart):
+            call = powerfx.parse_call(statement)
+            if call and call[0] == 'Set' and len(call[1]) == 2:
+                units[call[1][0]] = (position, arg, call[1][1])
+
+        moved, warnings = [], []
+        for variable, formula_name in self.moves.items():
+            if variable not in units:
+                warnings.append(f"{variable}: no Set({variable}, ...) in OnStart")
+                continue
+            value = units[variable][2]
+            if formula_name in in_use:
+                warnings.append(f"{variable}: name '{formula_name}' is already used in the app")
+                continue
+            side_effects = impure_calls(value)
+            if side_effects:
+                warnings.append(f"{variable}: value calls {', '.join(sorted(side_effects))}, not a pure formula")
+                continue
+            volatile = impure_calls(value, PURE_FUNCTIONS - VOLATILE_FUNCTIONS)
+            if volatile:
+                warnings.append(f"{variable}: value calls {', '.join(sorted(volatile))}, captured once in OnStart "
+                                "but recalculated as a named formula")
+                continue
+            other_sets = [f"{ref.screen}/{ref.name}.{prop}" for ref in index.controls
+                          for prop, formula in index.rules[ref.id].items()
+                          if _sets_variable(formula, variable) and not (ref is app and prop == 'OnStart')]
+            if other_sets or sum(1 for _, _, s in powerfx.statement_units(onstart) if _sets_variable(s, variable)) > 1:
+                warnings.append(f"{variable}: also set in {', '.join(other_sets) or 'OnStart'}, not static")
+                continue
+            moved.append((variable, formula_name))
+            in_use.add(formula_name)
+
+        report = {"moved": {v: n for v, n in moved}, "warnings": warnings}
+        if not moved:
+            return report
+
+        # Drop the Set() statements (last first, so earlier unit positions stay valid)
+        for variable, _ in sorted(moved, key=lambda m: units[m[0]][:2], reverse=True):
+            position, arg, _ = units[variable]
+            onstart = powerfx.replace_unit(onstart, position, arg, None)
+        formulas = existing + [(name, units[variable][2]) for variable, name in moved]
+
+        if not self.dry_run:
+            package.set_app_formula('OnStart', onstart)
+        renames = [rename_identifier(v, n) for v, n in moved]
+        rewrite = FormulaRewriter(renames).run(package, self.dry_run)
+        yaml_renamed = [] if self.dry_run else rename_in_yaml(package, renames)
+        if not self.dry_run:
+            package.set_app_formula('Formulas', powerfx.format_named_formulas(formulas))
+
+        report.update({
+            "formulas": [name for name, _ in formulas],
+            "onstart_statements": len(powerfx.statement_units(onstart)),
+            "renamed_rules": rewrite["changed_rules"],
+            "used_by_screens": {name: sorted({c["screen"] for c in rewrite["changes"]
+                                              if v in c["before"] and not (app and c["member"] == app.member)})
+                                for v, name in moved},
+            "yaml_only_renamed": yaml_renamed
+        })
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move static OnStart globals into App.Formulas")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Formulas.msapp)")
+    parser.add_argument("--move", action="append", default=[], metavar="VAR=NAME",
+                        help="Variable to move and its formula name (repeatable; default: "
+                             + ", ".join(f"{v}={n}" for v, n in DEFAULT_MOVES.items()) + ")")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing a package")
+    args = parser.parse_args()
+
+    moves = {}
+    for spec in args.move:
+        if '=' not in spec:
+            parser.error(f"--move expects VAR=NAME, got '{spec}'")
+        variable, name = spec.split('=', 1)
+        moves[variable] = name
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = NamedFormulas(moves or None, args.dry_run).run(package)
+    for variable, name in report["moved"].items():
+        screens = report["used_by_screens"][name]
+        print(f"  {variable} -> App.Formulas {name}  (used on {', '.join(screens) or 'no screen'})")
+    for warning in report["warnings"]:
+        print(f"   WARNING: {warning}")
+    if not report["moved"]:
+        print("Nothing moved")
+        return 0
+    print(f"\n{report['renamed_rules']} rules renamed; OnStart now has {report['onstart_statements']} statements")
+
+    if not args.dry_run:
+        output_path = Path(args.output) if args.output else \
+            input_path.parent / f"{input_path.stem}_Formulas.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
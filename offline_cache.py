@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Offline Collection Cache
+Wraps App OnStart collection loads in a LoadData-first, refresh-later
+pattern so repeated launches without a connection start from device storage:
+
+  OnStart:    ClearCollect(colSites, ...)
+
+becomes
+
+  OnStart:    Clear(colSites);LoadData(colSites,"colSites.v1a2b3c4d",true);
+              Clear(colSitesCachedAt);LoadData(colSitesCachedAt,"colSites.v1a2b3c4d.at",true);
+              If(IsEmpty(colSites), <refresh>)
+  OnVisible:  If(Connection.Connected && (IsEmpty(colSitesCachedAt) ||
+              DateDiff(First(colSitesCachedAt).At, Now(), TimeUnit.Minutes) >= 1440), <refresh>)
+  <refresh>:  ClearCollect(colSites, ...);ClearCollect(colSitesCachedAt,{At:Now()});
+              SaveData(colSites,"colSites.v1a2b3c4d");SaveData(colSitesCachedAt,"colSites.v1a2b3c4d.at")
+
+The load only runs in OnStart when nothing is cached; a cache older than the
+staleness window is refreshed from the start screen's OnVisible once the app
+is showing (or in OnStart with --refresh-in-onstart). Storage keys carry a
+version, by default a hash of the load statement, so changing the load
+invalidates old caches. Only loads that read a connector are cached: a seed
+built from literals costs less than reading it back from device storage.
+Loads with ordering side effects are not cached; collections the app also
+edits are cached with a warning, since edits are not written back to device
+storage.
+
+Usage:
+  python offline_cache.py app.msapp --dry-run
+  python offline_cache.py app.msapp out.msapp --collection colSites --collection colUsers --max-age 720
+  python offline_cache.py app.msapp out.msapp --version 3 --report cache.json
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from control_query import ControlIndex
+from delegation_check import formula_sites
+from lazy_load import prepend_on_visible, screen_order
+from msapp_package import MSAppPackage
+from onstart_concurrency import DATASOURCES, Statement, remote_data_sources
+
+DEFAULT_MAX_AGE_MINUTES = 24 * 60
+
+
+def stamp_collection(collection: str) -> str:
+    """colSitesCachedAt for colSites"""
+    return f"{collection}CachedAt"
+
+
+def cache_key(collection: str, version: str) -> str:
+    return f"{collection}.v{version}"
+
+
+def load_version(statement: str) -> str:
+    """Short hash of a load statement; changes whenever the load does"""
+    return hashlib.sha1(statement.encode('utf-8')).hexdigest()[:8]
+
+
+def refresh(collection: str, statement: str, key: str) -> str:
+    stamp = stamp_collection(collection)
+    return powerfx.join_statements([
+        statement, f"ClearCollect({stamp},{{At:Now()}})",
+        f"SaveData({collection},{powerfx.format_value(key)})",
+        f"SaveData({stamp},{powerfx.format_value(key + '.at')})"])
+
+
+def stale(collection: str, max_age: int) -> str:
+    stamp = stamp_collection(collection)
+    return f"Connection.Connected && (IsEmpty({stamp}) || " \
+           f"DateDiff(First({stamp}).At, Now(), TimeUnit.Minutes) >= {max_age})"
+
+
+def cached_load(collection: str, statement: str, key: str, max_age: int, refresh_in_onstart: bool) -> str:
+    """OnStart replacement for a load: read device storage, load from the source only when needed"""
+    stamp = stamp_collection(collection)
+    condition = f"IsEmpty({collection})"
+    if refresh_in_onstart:
+        condition = f"{condition} || ({stale(collection, max_age)})"
+    return powerfx.join_statements([
+        f"Clear({collection})", f"LoadData({collection},{powerfx.format_value(key)},true)",
+        f"Clear({stamp})", f"LoadData({stamp},{powerfx.format_value(key + '.at')},true)",
+        f"If({condition}, {refresh(collection, statement, key)})"])
+
+
+def deferred_refresh(collection: str, statement: str, key: str, max_age: int) -> str:
+    """Start screen OnVisible statement refreshing a stale cache"""
+    return f"If({stale(collection, max_age)}, {refresh(collection, statement, key)})"
+
+
+class OfflineCache:
+    """Pipeline stage: {"stage": "offline_cache", "collections": ["colSites"], "max_age_minutes": 1440}"""
+
+    name = "offline_cache"
+
+    def __init__(self, collections: List[str] = None, max_age_minutes: int = DEFAULT_MAX_AGE_MINUTES,
+                 version: str = None, refresh_in_onstart: bool = False, dry_run: bool = False):
+        if max_age_minutes <= 0:
+            raise ValueError("max_age_minutes must be positive")
+        self.collections = set(collections) if collections else None
+        self.max_age = int(max_age_minutes)
+        self.version = None if version is None else str(version)
+        self.refresh_in_onstart = refresh_in_onstart
+        self.dry_run = dry_run
+
+    def run(self, package: MSAppPackage) -> Dict:
+        onstart = package.get_app_formula('OnStart') or ''
+        units = powerfx.statement_units(onstart)
+        report = {"cacheable": [], "kept": {}, "warnings": [], "max_age_minutes": self.max_age}
+
+        seeds = {}
+        for k, (_, _, text) in enumerate(units):
+            call = powerfx.parse_call(text)
+            if call and call[0] == 'ClearCollect' and call[1]:
+                seeds.setdefault(call[1][0].strip(), k)
+        wanted = sorted(set(seeds) if self.collections is None else self.collections)
+        for collection in wanted:
+            if collection not in seeds:
+                report["kept"][collection] = "no ClearCollect load in OnStart"
+        calls = [powerfx.parse_call(text) for _, _, text in units]
+        stored = {call[1][0].strip() for call in calls if call and call[0] == 'LoadData' and call[1]}
+
+        remote = remote_data_sources(package)
+        plan = {}
+        for collection in wanted:
+            if collection not in seeds:
+                continue
+            k = seeds[collection]
+            statement = Statement(units[k][2], remote)
+            if collection in stored:
+                report["kept"][collection] = "already loaded from device storage"
+            elif not statement.remote:
+                report["kept"][collection] = "load reads no connector; nothing to cache"
+            elif statement.barrier:
+                report["kept"][collection] = "load has ordering side effects"
+            else:
+                plan[k] = collection
+        if not plan:
+            return report
+
+        edited, loads = {}, {units[k][2] for k in plan}
+        for site in formula_sites(package):
+            for _, _, text in powerfx.statement_units(site.formula):
+                if text in loads:
+                    continue
+                for name in Statement(text, set()).writes & set(plan.values()):
+                    edited.setdefault(name, f"{site.control}.{site.prop}")
+
+        index = ControlIndex(package)
+        order = screen_order(package, index)
+        start_screen = order[0] if order else None
+        if start_screen is None and not self.refresh_in_onstart:
+            report["warnings"].append("no start screen found; stale caches are refreshed in OnStart")
+        in_onstart = self.refresh_in_onstart or start_screen is None
+
+        remaining, deferred = onstart, []
+        for k in sorted(plan, reverse=True):
+            collection, text = plan[k], units[k][2]
+            key = cache_key(collection, self.version or load_version(text))
+            remaining = powerfx.replace_unit(remaining, units[k][0], units[k][1],
+                                             cached_load(collection, text, key, self.max_age, in_onstart))
+            if not in_onstart:
+                deferred.insert(0, deferred_refresh(collection, text, key, self.max_age))
+            report["cacheable"].insert(0, {
+                "collection": collection,
+                "key": key,
+                "stamp": stamp_collection(collection),
+                "refresh": "OnStart" if in_onstart else f"{start_screen}.OnVisible",
+                "load_bytes": len(text.encode('utf-8'))
+            })
+            if collection in edited:
+                report["warnings"].append(f"{collection} is also changed by {edited[collection]}; "
+                                          "those edits are not saved to the cache")
+        report.update({
+            "onstart_bytes_before": len(onstart.encode('utf-8')),
+            "onstart_bytes_after": len(remaining.encode('utf-8'))
+        })
+        if self.dry_run:
+            return report
+
+        package.set_app_formula('OnStart', remaining)
+        if deferred:
+            prepend_on_visible(package, index, start_screen, deferred, report["warnings"])
+        if package.exists(DATASOURCES):
+            document = package.read_json(DATASOURCES)
+            sources = document.setdefault("DataSources", [])
+            declared = {s.get("Name") for s in sources}
+            sources.extend({"Name": stamp_collection(c["collection"]), "Type": "Collection"}
+                           for c in report["cacheable"] if stamp_collection(c["collection"]) not in declared)
+            package.write_json(DATASOURCES, document)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache OnStart collection loads on the device with SaveData/LoadData")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Offline.msapp)")
+    parser.add_argument("--collection", action="append", metavar="NAME",
+                        help="Only cache these collections (repeatable; default: every OnStart ClearCollect)")
+    parser.add_argument("--max-age", type=int, default=DEFAULT_MAX_AGE_MINUTES, metavar="MINUTES",
+                        help=f"Refresh caches older than this (default: {DEFAULT_MAX_AGE_MINUTES})")
+    parser.add_argument("--version", help="Storage key version (default: a hash of each load statement)")
+    parser.add_argument("--refresh-in-onstart", action="store_true",
+                        help="Refresh stale caches in OnStart instead of the start screen's OnVisible")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing a package")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    if args.max_age <= 0:
+        parser.error("--max-age must be positive")
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = OfflineCache(args.collection, args.max_age, args.version, args.refresh_in_onstart,
+                          args.dry_run).run(package)
+    for entry in report["cacheable"]:
+        print(f"  {entry['collection']:<18} cached as \"{entry['key']}\", refreshed in {entry['refresh']}")
+    for collection, reason in report["kept"].items():
+        print(f"  {collection:<18} not cached: {reason}")
+    for warning in report["warnings"]:
+        print(f"   WARNING: {warning}")
+    if not report["cacheable"]:
+        print("Nothing to cache")
+        return 0
+    print(f"\n{len(report['cacheable'])} collections cacheable (max age {report['max_age_minutes']} minutes); "
+          f"OnStart {report['onstart_bytes_before']:,} -> {report['onstart_bytes_after']:,} bytes")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.dry_run:
+        output_path = Path(args.output) if args.output else input_path.parent / f"{input_path.stem}_Offline.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+App OnStart Concurrency Optimizer
+Builds the dependency graph of the App OnStart statements and groups the
+independent ones into Concurrent(...) blocks
+
+A statement depends on an earlier one when it reads something the earlier
+one writes, writes something it reads, or writes the same variable or
+collection. Navigation, notifications, SaveData and similar calls are
+barriers and keep their place. Statements already inside a top-level
+Concurrent(...) are scheduled again, so the rewrite is idempotent.
+
+The cost model is deliberately simple: Power Fx evaluates local work on one
+thread, so inside a Concurrent block local costs still add up and only
+connector calls overlap. Device storage calls (LoadData, SaveData,
+ClearData) are local work. critical_path_ms is the ideal lower bound
+if everything could overlap.
+
+Usage:
+  python onstart_concurrency.py app.msapp --dry-run
+  python onstart_concurrency.py app.msapp out.msapp --report onstart.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Set, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from msapp_package import MSAppPackage
+
+DATASOURCES = 'References/DataSources.json'
+
+# Functions whose first argument is the variable/collection they write
+WRITE_FUNCTIONS = {'Set', 'ClearCollect', 'Collect', 'Clear', 'Patch', 'Remove', 'RemoveIf',
+                   'Update', 'UpdateIf', 'LoadData'}
+# ... and that also read it (they modify existing contents)
+MODIFY_FUNCTIONS = {'Collect', 'Patch', 'Remove', 'RemoveIf', 'Update', 'UpdateIf'}
+# Calls whose ordering is observable
+BARRIER_FUNCTIONS = {'Navigate', 'Back', 'Notify', 'Launch', 'Exit', 'Select', 'Reset', 'ResetForm',
+                     'SubmitForm', 'NewForm', 'EditForm', 'ViewForm', 'Refresh', 'Revert', 'Trace'}
+# Device storage: LoadData(col, "key") reads and SaveData(col, "key") / ClearData("key") write '@key'
+STORAGE_FUNCTIONS = {'LoadData', 'SaveData', 'ClearData'}
+# Calls that leave the client
+REMOTE_FUNCTIONS = {'Refresh'}
+
+STATEMENT_MS = 0.5
+LOCAL_MS_PER_KB = 2.0
+REMOTE_MS = 300.0
+# Device storage calls are local work: they run on the app thread and do not overlap
+STORAGE_MS = 15.0
+
+
+class Statement:
+    """One unit of OnStart work with its read/write sets and estimated cost"""
+
+    def __init__(self, text: str, remote_names: Set[str]):
+        self.text = text
+        self.reads: Set[str] = set()
+        self.writes: Set[str] = set()
+        self.barrier = False
+        self.remote = False
+        self.label = text[:40]
+
+        tokens = powerfx.significant(powerfx.tokenize(text))
+        for k, token in enumerate(tokens):
+            name = powerfx.identifier_name(token)
+            if name is None:
+                continue
+            is_call = token.kind == 'ident' and k + 1 < len(tokens) and tokens[k + 1].text == '('
+            if not is_call:
+                self.reads.add(name)
+                self.remote |= name in remote_names
+                continue
+            self.barrier |= name in BARRIER_FUNCTIONS
+            self.remote |= name in REMOTE_FUNCTIONS
+            target = powerfx.identifier_name(tokens[k + 2]) if k + 2 < len(tokens) else None
+            if name in STORAGE_FUNCTIONS:
+                self._storage(name, tokens[k + 1:])
+            elif name in WRITE_FUNCTIONS and target:
+                self.writes.add(target)
+                if name in MODIFY_FUNCTIONS:
+                    self.reads.add(target)
+            if k == 0 and target:
+                self.label = f"{name}({target})"
+
+        size_kb = len(text.encode('utf-8')) / 1024
+        storage_calls = sum(1 for k, t in enumerate(tokens[:-1])
+                            if t.text in STORAGE_FUNCTIONS and tokens[k + 1].text == '(')
+        self.local_ms = STATEMENT_MS + STORAGE_MS * storage_calls + LOCAL_MS_PER_KB * size_kb
+        self.remote_ms = REMOTE_MS if self.remote else 0.0
+
+    def _storage(self, name: str, call_tokens: List):
+        """Device storage effects; a ClearData() without a key clears everything"""
+        strings = [t.text[1:-1] for t in call_tokens if t.kind == 'string']
+        idents = [powerfx.identifier_name(t) for t in call_tokens[1:2]]
+        key = f"@{strings[0]}" if strings else None
+        if name == 'ClearData':
+            if key:
+                self.writes.add(key)
+            else:
+                self.barrier = True
+        elif name == 'SaveData':
+            self.reads.update(i for i in idents if i)
+            if key:
+                self.writes.add(key)
+            else:
+                self.barrier = True
+        else:  # LoadData
+            self.writes.update(i for i in idents if i)
+            if key:
+                self.reads.add(key)
+
+    @property
+    def cost_ms(self) -> float:
+        return self.local_ms + self.remote_ms
+
+    def depends_on(self, earlier: "Statement") -> bool:
+        return (self.barrier or earlier.barrier
+                or bool(earlier.writes & (self.reads | self.writes))
+                or bool(earlier.reads & self.writes))
+
+
+def remote_data_sources(package: MSAppPackage) -> Set[str]:
+    """Names of connector data sources (anything in DataSources.json that is not a collection)"""
+    if not package.exists(DATASOURCES):
+        return set()
+    return {s.get('Name') for s in package.read_json(DATASOURCES).get('DataSources', [])
+            if s.get('Type') not in ('Collection', 'StaticDataSourceInfo')}
+
+
+def schedule(statements: List[Statement]) -> List[List[int]]:
+    """Group statement indexes into levels; each level only depends on earlier levels"""
+    levels: List[int] = []
+    for j, statement in enumerate(statements):
+        level = 0
+        for i in range(j):
+            if statement.depends_on(statements[i]):
+                level = max(level, levels[i] + 1)
+        levels.append(level)
+    groups: List[List[int]] = [[] for _ in range(max(levels) + 1)] if levels else []
+    for index, level in enumerate(levels):
+        groups[level].append(index)
+    return groups
+
+
+def critical_path_ms(statements: List[Statement]) -> float:
+    """Longest dependency chain, weighting each statement by its full cost"""
+    finish: List[float] = []
+    for j, statement in enumerate(statements):
+        start = max((finish[i] for i in range(j) if statement.depends_on(statements[i])), default=0.0)
+        finish.append(start + statement.cost_ms)
+    return max(finish, default=0.0)
+
+
+def optimize_onstart(formula: str, remote_names: Set[str] = frozenset()) -> Tuple[str, Dict]:
+    """Rewrite an OnStart formula with Concurrent(...) groups; returns (formula, report)"""
+    statements = [Statement(text, remote_names) for _, _, text in powerfx.statement_units(formula)]
+    groups = schedule(statements)
+
+    parts = []
+    for group in groups:
+        texts = [statements[i].text for i in group]
+        parts.append(texts[0] if len(texts) == 1 else powerfx.format_concurrent(texts))
+    rewritten = powerfx.join_statements(parts)
+
+    sequential = sum(s.cost_ms for s in statements)
+    concurrent = sum(sum(statements[i].local_ms for i in group) + max(statements[i].remote_ms for i in group)
+                     for group in groups)
+    report = {
+        "statements": len(statements),
+        "levels": [[statements[i].label for i in group] for group in groups],
+        "concurrent_groups": sum(1 for g in groups if len(g) > 1),
+        "remote_statements": [s.label for s in statements if s.remote],
+        "barriers": [s.label for s in statements if s.barrier],
+        "sequential_ms": round(sequential, 2),
+        "concurrent_ms": round(concurrent, 2),
+        "critical_path_ms": round(critical_path_ms(statements), 2),
+        "reduction_ms": round(sequential - concurrent, 2),
+        "reduction_pct": round(100 * (sequential - concurrent) / sequential, 1) if sequential else 0.0,
+        "changed": rewritten != powerfx.join_statements(powerfx.split_statements(formula))
+    }
+    if not report["remote_statements"]:
+        report["note"] = "no connector calls in OnStart: grouping adds no measurable overlap"
+    return rewritten, report
+
+
+class ConcurrentOnStart:
+    """Pipeline stage: {"stage": "concurrent_onstart"}"""
+
+    name = "concurrent_onstart"
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+
+    def run(self, package: MSAppPackage) -> Dict:
+        onstart = package.get_app_formula('OnStart')
+        if not onstart:
+            return {"skipped": "no App OnStart formula"}
+        rewritten, report = optimize_onstart(onstart, remote_data_sources(package))
+        if report["changed"] and not self.dry_run:
+            package.set_app_formula('OnStart', rewritten)
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group independent App OnStart statements into Concurrent()")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Concurrent.msapp)")
+    parser.add_argument("--dry-run", action="store_true", help="Report the schedule without writing a package")
+    parser.add_argument("--show", action="store_true", help="Print the rewritten OnStart formula")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    report = ConcurrentOnStart(dry_run=args.dry_run).run(package)
+    if "skipped" in report:
+        print(f"Nothing to do: {report['skipped']}")
+        return 0
+
+    for number, level in enumerate(report["levels"], 1):
+        kind = "Concurrent" if len(level) > 1 else "sequential"
+        print(f"  level {number} ({kind}): {', '.join(level)}")
+    print(f"\n{report['statements']} statements in {len(report['levels'])} levels "
+          f"({report['concurrent_groups']} Concurrent groups)")
+    print(f"Estimated OnStart: {report['sequential_ms']} ms -> {report['concurrent_ms']} ms "
+          f"({report['reduction_pct']}% less; critical path {report['critical_path_ms']} ms)")
+    if report.get("note"):
+        print(f"   NOTE: {report['note']}")
+    if args.show:
+        print(package.get_app_formula('OnStart'))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if not args.dry_run and report["changed"]:
+        output_path = Path(args.output) if args.output else \
+            input_path.parent / f"{input_path.stem}_Concurrent.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
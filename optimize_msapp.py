@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+MSAPP Package Optimizer
+Strips unused metadata from a .msapp package and reports the savings
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import re
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from msapp_package import MSAppPackage
+
+PALETTE_REF = re.compile(r'%Palette\.([^%]+)%')
+DEFAULT_STYLE = re.compile(r'^default\w+Style$')
+TEMPLATES_MEMBER = "References/Templates.json"
+# libjpeg's standard luminance quantization table (quality 50), in zig-zag order like Pillow's
+JPEG_LUMINANCE = [16, 11, 12, 14, 12, 10, 16, 14, 13, 14, 18, 17, 16, 19, 24, 40, 26, 24, 22, 22, 24, 49, 35, 37,
+                  29, 40, 58, 51, 61, 60, 57, 51, 56, 55, 64, 72, 92, 78, 64, 68, 87, 69, 55, 56, 80, 109, 81, 87,
+                  95, 98, 103, 104, 103, 62, 77, 113, 121, 112, 100, 120, 92, 101, 103, 99]
+
+
+def jpeg_quality_estimate(image) -> Optional[int]:
+    """Approximate libjpeg quality (1-100) of an opened JPEG from its luminance table; None if unknown"""
+    table = getattr(image, 'quantization', None) or {}
+    if 0 not in table:
+        return None
+    scale = 100.0 * sum(table[0]) / sum(JPEG_LUMINANCE)
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+
+def measure_member(data: bytes) -> Dict:
+    """Raw size, deflated size and JSON parse time of one member"""
+    parse_ms = None
+    try:
+        text = data.decode('utf-8-sig')
+        best = None
+        for _ in range(3):
+            start = time.perf_counter()
+            json.loads(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        parse_ms = round(best * 1000, 3)
+    except ValueError:
+        pass
+    return {
+        "bytes": len(data),
+        "compressed_bytes": len(zlib.compress(data, 6)),
+        "parse_ms": parse_ms
+    }
+
+
+class ThemePruner:
+    """Keeps only the current theme and the styles/palette entries controls reference
+
+    Default styles (defaultLabelStyle, ...) are kept too: Studio applies them to
+    controls inserted later, so pruning them would leave new controls unstyled.
+    prune_default_styles drops the ones no control uses, except the defaults of
+    templates listed in Templates.json.
+    """
+
+    name = "themes"
+    member = "References/Themes.json"
+
+    def __init__(self, keep_styles: List[str] = None, prune_default_styles: bool = False):
+        self.keep_styles = set(keep_styles or [])
+        self.prune_default_styles = prune_default_styles
+
+    def referenced_styles(self, package: MSAppPackage) -> set:
+        """StyleName of every control in the package"""
+        return {c.get('StyleName') for c in package.iter_controls() if c.get('StyleName')}
+
+    @staticmethod
+    def template_default_styles(package: MSAppPackage) -> set:
+        """defaultXStyle of every template listed in Templates.json"""
+        if not package.exists(TEMPLATES_MEMBER):
+            return set()
+        names = {t.get('Name', '') for t in package.read_json(TEMPLATES_MEMBER).get('UsedTemplates', [])}
+        return {f"default{n[:1].upper()}{n[1:]}Style" for n in names if n}
+
+    def run(self, package: MSAppPackage) -> Dict:
+        if not package.exists(self.member):
+            return {"skipped": f"{self.member} not found"}
+
+        before = measure_member(package.read(self.member))
+        themes = package.read_json(self.member)
+        current_name = themes.get('CurrentTheme')
+        current = next((t for t in themes.get('CustomThemes', []) if t.get('name') == current_name), None)
+        if current is None:
+            return {"skipped": f"current theme '{current_name}' not found"}
+
+        used_styles = self.referenced_styles(package) | self.keep_styles
+        available = {s.get('name') for s in current.get('styles', [])}
+        missing = sorted(used_styles - available)
+
+        keep = used_styles | self.template_default_styles(package)
+        if not self.prune_default_styles:
+            keep |= {name for name in available if name and DEFAULT_STYLE.match(name)}
+        styles = [s for s in current.get('styles', []) if s.get('name') in keep]
+        used_palette = set(PALETTE_REF.findall(json.dumps(styles)))
+        palette = [p for p in current.get('palette', []) if p.get('name') in used_palette]
+
+        removed_themes = len(themes.get('CustomThemes', [])) - 1
+        removed_styles = len(current.get('styles', [])) - len(styles)
+        removed_palette = len(current.get('palette', [])) - len(palette)
+
+        pruned_theme = dict(current)
+        pruned_theme['styles'] = styles
+        pruned_theme['palette'] = palette
+        pruned = dict(themes)
+        pruned['CustomThemes'] = [pruned_theme]
+        package.write_json(self.member, pruned)
+
+        after = measure_member(package.read(self.member))
+        return {
+            "member": self.member,
+            "kept_styles": sorted(s['name'] for s in styles),
+            "missing_styles": missing,
+            "removed_themes": removed_themes,
+            "removed_styles": removed_styles,
+            "removed_palette_entries": removed_palette,
+            "before": before,
+            "after": after
+        }
+
+
+class TemplatePruner:
+    """Keeps only the control templates referenced by Controls/*.json and checks none are missing"""
+
+    name = "templates"
+    member = TEMPLATES_MEMBER
+
+    # Templates Power Apps resolves itself; they never appear in UsedTemplates
+    BUILTIN_TEMPLATES = {"appinfo", "screen", "hostControl", "AppTest", "TestSuite", "TestCase", "component"}
+
+    def referenced_templates(self, package: MSAppPackage) -> Dict:
+        """(Name, Version) of every non-builtin control template -> Template.Id"""
+        used = {}
+        for control in package.iter_controls():
+            template = control.get('Template', {})
+            if template.get('Name') in self.BUILTIN_TEMPLATES or template.get('IsComponentDefinition'):
+                continue
+            used[(template.get('Name'), template.get('Version'))] = template.get('Id')
+        return used
+
+    def missing_templates(self, package: MSAppPackage) -> List[str]:
+        """Templates used by a control but absent from Templates.json"""
+        available = set()
+        if package.exists(self.member):
+            available = {(t.get('Name'), t.get('Version'))
+                         for t in package.read_json(self.member).get('UsedTemplates', [])}
+        return sorted(f"{name}@{version} ({template_id})"
+                      for (name, version), template_id in self.referenced_templates(package).items()
+                      if (name, version) not in available)
+
+    def run(self, package: MSAppPackage) -> Dict:
+        if not package.exists(self.member):
+            return {"skipped": f"{self.member} not found"}
+
+        before = measure_member(package.read(self.member))
+        templates = package.read_json(self.member)
+        used = self.referenced_templates(package)
+        missing = self.missing_templates(package)
+
+        kept = [t for t in templates.get('UsedTemplates', []) if (t.get('Name'), t.get('Version')) in used]
+        removed = [f"{t.get('Name')}@{t.get('Version')}" for t in templates.get('UsedTemplates', [])
+                   if (t.get('Name'), t.get('Version')) not in used]
+        if removed:
+            pruned = dict(templates)
+            pruned['UsedTemplates'] = kept
+            package.write_json(self.member, pruned)
+
+        result = {
+            "member": self.member,
+            "kept_templates": [f"{t.get('Name')}@{t.get('Version')}" for t in kept],
+            "removed_templates": removed,
+            "before": before,
+            "after": measure_member(package.read(self.member))
+        }
+        if missing:
+            result["errors"] = [f"Template used by a control but missing from {self.member}: {m}"
+                                for m in missing]
+        return result
+
+
+class ResourceOptimizer:
+    """Deduplicates packaged resources and re-encodes oversized images
+
+    JPEGs are only re-encoded (lossily) when they are downscaled, at their own
+    quality, or when jpeg_quality is given and they are above it; a JPEG at or
+    below the target is left alone, so repeated runs do not compound the loss.
+    """
+
+    name = "resources"
+    member = "References/Resources.json"
+    publish_info = "Resources/PublishInfo.json"
+
+    RESOURCE_FOLDERS = ('Resources/', 'Assets/')
+    IMAGE_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF', '.bmp': 'BMP'}
+
+    def __init__(self, max_dimension: int = 1024, jpeg_quality: Optional[int] = None):
+        self.max_dimension = max_dimension
+        self.jpeg_quality = jpeg_quality
+
+    def resource_files(self, package: MSAppPackage) -> List[str]:
+        return [n for n in package.names()
+                if n.startswith(self.RESOURCE_FOLDERS) and Path(n).suffix.lower() in self.IMAGE_FORMATS]
+
+    def deduplicate(self, package: MSAppPackage, names: List[str]) -> Dict[str, str]:
+        """Remove byte-identical resources; returns removed name -> kept name"""
+        first_by_hash = {}
+        replaced = {}
+        for name in names:
+            digest = hashlib.sha256(package.read(name)).hexdigest()
+            if digest in first_by_hash:
+                replaced[name] = first_by_hash[digest]
+                package.remove(name)
+            else:
+                first_by_hash[digest] = name
+        return replaced
+
+    def reencode(self, data: bytes, suffix: str) -> bytes:
+        """Downscale to max_dimension and re-encode; returns the original if not smaller"""
+        from PIL import Image
+
+        image_format = self.IMAGE_FORMATS[suffix]
+        with Image.open(io.BytesIO(data)) as image:
+            if getattr(image, 'is_animated', False):
+                return data
+            image.load()
+            resize = max(image.size) > self.max_dimension
+            quality = None
+            if image_format == 'JPEG':
+                quality = jpeg_quality_estimate(image) or 85
+                above_target = self.jpeg_quality is not None and quality > self.jpeg_quality
+                if not (resize or above_target):
+                    return data
+                if self.jpeg_quality is not None:
+                    quality = min(quality, self.jpeg_quality)
+            if resize:
+                image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+            output = io.BytesIO()
+            if image_format == 'JPEG':
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+            elif image_format == 'PNG':
+                image.save(output, 'PNG', optimize=True)
+            else:
+                image.save(output, image_format)
+        encoded = output.getvalue()
+        return encoded if len(encoded) < len(data) else data
+
+    def update_references(self, package: MSAppPackage, replaced: Dict[str, str]):
+        """Point Resources.json entries and the app logo at the surviving copies"""
+        if package.exists(self.member):
+            resources = package.read_json(self.member)
+            changed = False
+            for entry in resources.get('Resources', []):
+                path = MSAppPackage.normalize_name(entry.get('Path', ''))
+                if path in replaced:
+                    entry['Path'] = replaced[path].replace('/', '\\')
+                    entry['FileName'] = Path(replaced[path]).name
+                    changed = True
+            if changed:
+                package.mark_dirty(self.member)
+
+        if package.exists(self.publish_info):
+            info = package.read_json(self.publish_info)
+            logo = f"Resources/{info.get('LogoFileName', '')}"
+            if logo in replaced:
+                info['LogoFileName'] = Path(replaced[logo]).name
+                package.mark_dirty(self.publish_info)
+
+    def run(self, package: MSAppPackage) -> Dict:
+        names = self.resource_files(package)
+        if not names:
+            return {"skipped": "no image resources found"}
+
+        bytes_before = sum(len(package.read(n)) for n in names)
+        replaced = self.deduplicate(package, names)
+        self.update_references(package, replaced)
+
+        files = {}
+        warnings = []
+        try:
+            import PIL  # noqa: F401 - optional dependency
+            can_reencode = True
+        except ImportError:
+            can_reencode = False
+            warnings.append("Pillow is not installed - image re-encoding skipped")
+
+        for name in names:
+            if name in replaced:
+                continue
+            data = package.read(name)
+            optimized = data
+            if can_reencode:
+                try:
+                    optimized = self.reencode(data, Path(name).suffix.lower())
+                except (OSError, ValueError) as e:
+                    warnings.append(f"{name}: could not re-encode ({e})")
+            if optimized is not data:
+                package.write(name, optimized)
+            files[name] = {"before": len(data), "after": len(optimized)}
+
+        bytes_after = sum(f["after"] for f in files.values())
+        result = {
+            "duplicates": replaced,
+            "files": files,
+            "removed_duplicates": len(replaced),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "saved_bytes": bytes_before - bytes_after
+        }
+        if warnings:
+            result["warnings"] = warnings
+        return result
+
+
+STAGES = {
+    ThemePruner.name: ThemePruner,
+    TemplatePruner.name: TemplatePruner,
+    ResourceOptimizer.name: ResourceOptimizer
+}
+
+
+class MSAppOptimizer:
+    """Runs optimization stages over a package and writes the optimized copy"""
+
+    def __init__(self, stages: List = None):
+        self.stages = stages if stages is not None else [cls() for cls in STAGES.values()]
+
+    def optimize_package(self, package: MSAppPackage) -> Dict:
+        """Apply every stage in order, returning a report keyed by stage name"""
+        report = {}
+        for stage in self.stages:
+            start = time.perf_counter()
+            result = stage.run(package)
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            report[stage.name] = result
+        return report
+
+    def optimize(self, input_path: Path, output_path: Path) -> Dict:
+        """Optimize input_path into output_path and report package savings"""
+        print("=" * 70)
+        print("MSAPP PACKAGE OPTIMIZER")
+        print("=" * 70)
+        print(f"\nInput:  {input_path.name}")
+        print(f"Output: {output_path.name}")
+
+        package = MSAppPackage.load(input_path)
+        input_size = input_path.stat().st_size
+        report = {"stages": self.optimize_package(package)}
+        output_size = package.save(output_path)
+
+        report["package"] = {
+            "input_bytes": input_size,
+            "output_bytes": output_size,
+            "saved_bytes": input_size - output_size
+        }
+        print_report(report)
+        return report
+
+
+def print_report(report: Dict):
+    """Human-readable summary of an optimization report"""
+    for name, result in report["stages"].items():
+        print(f"\n[{name}]")
+        if "skipped" in result:
+            print(f"   Skipped: {result['skipped']}")
+            continue
+        before, after = result.get("before"), result.get("after")
+        if before and after:
+            print(f"   {result['member']}: {before['bytes']:,} -> {after['bytes']:,} bytes "
+                  f"({before['compressed_bytes']:,} -> {after['compressed_bytes']:,} compressed)")
+            if before['parse_ms'] is not None and after['parse_ms'] is not None:
+                print(f"   Parse time: {before['parse_ms']} ms -> {after['parse_ms']} ms")
+        for key, value in result.items():
+            if key.startswith("removed_"):
+                if isinstance(value, list):
+                    value = ", ".join(value) if value else "none"
+                print(f"   {key.replace('_', ' ').capitalize()}: {value}")
+        if "saved_bytes" in result:
+            print(f"   Resources: {result['bytes_before']:,} -> {result['bytes_after']:,} bytes "
+                  f"(saved {result['saved_bytes']:,} bytes)")
+        for warning in result.get("warnings", []):
+            print(f"   WARNING: {warning}")
+        if result.get("missing_styles"):
+            print(f"   WARNING: styles referenced but not defined: {', '.join(result['missing_styles'])}")
+        for error in result.get("errors", []):
+            print(f"   ERROR: {error}")
+
+    package = report.get("package")
+    if package:
+        print(f"\nPackage: {package['input_bytes']:,} -> {package['output_bytes']:,} bytes "
+              f"(saved {package['saved_bytes']:,} bytes)")
+
+
+def has_errors(report: Dict) -> bool:
+    """True if any stage reported an error"""
+    return any(result.get("errors") for result in report["stages"].values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strip unused metadata from a .msapp package")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Optimized.msapp)")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma separated stages to run (default: {','.join(STAGES)})")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    parser.add_argument("--prune-default-styles", action="store_true",
+                        help="Also drop default styles of templates the app does not list in Templates.json")
+    parser.add_argument("--max-dimension", type=int, default=1024,
+                        help="Largest image width/height kept by the resources stage (default: 1024)")
+    parser.add_argument("--quality", type=int,
+                        help="Re-encode JPEGs above this quality (lossy; default: only downscaled JPEGs "
+                             "are re-encoded, at their own quality)")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+    output_path = Path(args.output) if args.output else \
+        input_path.parent / f"{input_path.stem}_Optimized.msapp"
+
+    names = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [n for n in names if n not in STAGES]
+    if unknown:
+        print(f"ERROR: Unknown stage(s): {', '.join(unknown)}")
+        return 1
+
+    stage_options = {
+        ThemePruner.name: {"prune_default_styles": args.prune_default_styles},
+        ResourceOptimizer.name: {"max_dimension": args.max_dimension, "jpeg_quality": args.quality}
+    }
+    optimizer = MSAppOptimizer([STAGES[n](**stage_options.get(n, {})) for n in names])
+    report = optimizer.optimize(input_path, output_path)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 2 if has_errors(report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Power Apps pa.yaml Helpers
+Header, property formatting and in-place property edits for Src/*.pa.yaml files
+"""
+
+import re
+from typing import List, Optional
+
+HEADER = '''# ************************************************************************************************
+# Warning: YAML source code for Canvas Apps should only be used to review changes made within Power Apps Studio and for minor edits (Preview).
+# Use the maker portal to create and edit your Power Apps.
+#
+# The schema file for Canvas Apps is available at https://go.microsoft.com/fwlink/?linkid=2304907
+#
+# For more information, visit https://go.microsoft.com/fwlink/?linkid=2292623
+# ************************************************************************************************
+'''
+
+_KEY_LINE = re.compile(r'^(\s*)([^\s:#][^:]*):(?:\s(.*))?$')
+
+
+def needs_block(value: str) -> bool:
+    """True if a formula cannot be written as a plain YAML scalar"""
+    return ('\n' in value or '\r' in value or ': ' in value or ' #' in value or '\t' in value
+            or value != value.strip() or value.endswith(':'))
+
+
+def format_property(name: str, formula: str, indent: int) -> List[str]:
+    """Lines for 'Name: =formula', switching to a |- block (|+ to keep trailing newlines) when required"""
+    value = formula if formula.startswith('=') else '=' + formula
+    pad = ' ' * indent
+    if not needs_block(value):
+        return [f"{pad}{name}: {value}"]
+    if value.endswith('\n'):
+        return [f"{pad}{name}: |+"] + [f"{pad}  {line}" if line else '' for line in value[:-1].split('\n')]
+    return [f"{pad}{name}: |-"] + [f"{pad}  {line}" if line else '' for line in value.split('\n')]
+
+
+def _indent_of(line: str) -> int:
+    return len(line) - len(line.lstrip(' '))
+
+
+def _find_properties(lines: List[str], control: Optional[str] = None) -> Optional[int]:
+    """Index of a control's 'Properties:' line (the first, screen/app-level block if no control)"""
+    if control is None:
+        for i, line in enumerate(lines):
+            if line.strip() == 'Properties:':
+                return i
+        return None
+
+    heads = (f"- {control}:", f"{control}:")
+    for i, line in enumerate(lines):
+        if line.strip() not in heads:
+            continue
+        control_indent = _indent_of(line)
+        body_indent = None
+        for j in range(i + 1, len(lines)):
+            if not lines[j].strip():
+                continue
+            indent = _indent_of(lines[j])
+            if indent <= control_indent:
+                break
+            if body_indent is None:
+                body_indent = indent
+            if indent == body_indent and lines[j].strip() == 'Properties:':
+                return j
+        return None
+    return None
+
+
+def _property_span(lines: List[str], block: int, name: str):
+    """(start, end) line indexes of a property inside a Properties block"""
+    block_indent = _indent_of(lines[block])
+    i = block + 1
+    while i < len(lines):
+        line = lines[i]
+        if line.strip() and _indent_of(line) <= block_indent:
+            break
+        match = _KEY_LINE.match(line)
+        if match and match.group(2) == name and _indent_of(line) > block_indent:
+            end = i + 1
+            while end < len(lines) and (not lines[end].strip() or _indent_of(lines[end]) > _indent_of(line)):
+                end += 1
+            while end > i + 1 and not lines[end - 1].strip():
+                end -= 1
+            return i, end
+        i += 1
+    return None
+
+
+def get_property(text: str, name: str, control: Optional[str] = None) -> Optional[str]:
+    """Formula (without '=') of a property in the first (or a named control's) Properties block"""
+    lines = text.split('\n')
+    block = _find_properties(lines, control)
+    if block is None:
+        return None
+    span = _property_span(lines, block, name)
+    if span is None:
+        return None
+    start, end = span
+    value = _KEY_LINE.match(lines[start]).group(3) or ''
+    if value.strip() in ('|', '|-', '|+', '>', '>-', '>+'):
+        body = lines[start + 1:end]
+        indent = min((_indent_of(l) for l in body if l.strip()), default=0)
+        value = '\n'.join(l[indent:] for l in body)
+    value = value.strip() if '\n' not in value else value
+    return value[1:] if value.startswith('=') else value
+
+
+def set_property(text: str, name: str, formula: str, control: Optional[str] = None) -> str:
+    """Replace (or add) a property in the first (or a named control's) Properties block"""
+    lines = text.split('\n')
+    block = _find_properties(lines, control)
+    if block is None:
+        raise ValueError(f"No Properties block found for {control}" if control else "No Properties block found")
+    indent = _indent_of(lines[block]) + 2
+    span = _property_span(lines, block, name)
+    if span:
+        start, end = span
+        indent = _indent_of(lines[start])
+    else:
+        start = end = block + 1
+    lines[start:end] = format_property(name, formula, indent)
+    return '\n'.join(lines)
+
+
+def remove_property(text: str, name: str, control: Optional[str] = None) -> str:
+    """Drop a property from the first (or a named control's) Properties block if present"""
+    lines = text.split('\n')
+    block = _find_properties(lines, control)
+    span = _property_span(lines, block, name) if block is not None else None
+    if span is None:
+        return text
+    del lines[span[0]:span[1]]
+    return '\n'.join(lines)
+
+
+def _screens_order_span(lines: List[str]):
+    """(index of 'ScreensOrder:', end of its list) in _EditorState.pa.yaml lines, None if absent"""
+    for i, line in enumerate(lines):
+        if line.strip() == 'ScreensOrder:':
+            end = i + 1
+            while end < len(lines) and lines[end].strip().startswith('- ') \
+                    and _indent_of(lines[end]) > _indent_of(line):
+                end += 1
+            return i, end
+    return None
+
+
+def screens_order(text: str) -> List[str]:
+    """Screen names listed under EditorState ScreensOrder"""
+    lines = text.split('\n')
+    span = _screens_order_span(lines)
+    if span is None:
+        return []
+    return [line.strip()[2:].strip().strip('"\'') for line in lines[span[0] + 1:span[1]]]
+
+
+def set_screens_order(text: str, screens: List[str]) -> str:
+    """Replace (or add) the EditorState ScreensOrder list"""
+    lines = text.split('\n')
+    span = _screens_order_span(lines)
+    if span is None:
+        state = next((i for i, line in enumerate(lines) if line.strip() == 'EditorState:'), None)
+        if state is None:
+            raise ValueError("No EditorState block found")
+        lines.insert(state + 1, ' ' * (_indent_of(lines[state]) + 2) + 'ScreensOrder:')
+        span = state + 1, state + 2
+    pad = ' ' * (_indent_of(lines[span[0]]) + 2)
+    lines[span[0] + 1:span[1]] = [f"{pad}- {screen}" for screen in screens]
+    return '\n'.join(lines)
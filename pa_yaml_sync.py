@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Controls JSON <-> pa.yaml Converter
+Regenerates Src/<Screen>.pa.yaml from Controls/*.json for a whole package, or
+applies edited pa.yaml back onto the Controls JSON, one screen per worker
+
+to-yaml writes canonical pa.yaml (control_model.screen_pa_yaml) holding the
+User rules of every control; Studio defaults stay in the JSON only.
+to-json matches controls by name, so existing controls keep their unique ids
+and default rules; controls and rules missing from the YAML are reported and
+only removed with --prune.
+
+Usage:
+  python pa_yaml_sync.py to-yaml app.msapp --out-dir review/        # readable YAML for diffing
+  python pa_yaml_sync.py to-yaml app.msapp app_with_yaml.msapp
+  python pa_yaml_sync.py to-json app.msapp out.msapp --yaml-dir review/ --prune
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import control_model
+from msapp_package import MSAppPackage
+
+
+def _json_to_yaml(task: Tuple[str, bytes, bool]) -> Dict:
+    """Worker: Controls JSON member bytes -> pa.yaml text"""
+    member, data, include_defaults = task
+    top = json.loads(data.decode('utf-8-sig'))['TopParent']
+    screen = control_model.from_controls_json(top, include_defaults)
+    return {"screen": screen['Name'], "member": member, "yaml": control_model.screen_pa_yaml(screen),
+            "controls": sum(1 for _ in control_model.walk(screen))}
+
+
+def _yaml_to_json(task: Tuple[str, str, Optional[bytes], int, bool]) -> Dict:
+    """Worker: pa.yaml text (+ existing Controls JSON bytes) -> Controls JSON document"""
+    yaml_member, text, data, first_id, prune = task
+    try:
+        screen = control_model.screen_from_pa_yaml(text)
+    except control_model.PaYamlError as e:
+        return {"yaml_member": yaml_member, "error": f"{yaml_member}: {e}"}
+    next_id = iter(range(first_id, 1 << 30))
+    if data is None:
+        document = control_model.screen_controls_json(screen, start_unique_id=first_id)
+        changes = {"added": [c['Name'] for c in control_model.walk(screen)], "missing_controls": [],
+                   "missing_rules": []}
+    else:
+        document = json.loads(data.decode('utf-8-sig'))
+        changes = control_model.merge_controls_json(screen, document['TopParent'], next_id, prune)
+    return dict(changes, yaml_member=yaml_member, screen=screen['Name'], document=document)
+
+
+def _run(worker, tasks: List, jobs: Optional[int]) -> Iterator[Dict]:
+    """Results in task order; screens are converted in worker processes when there is more than one"""
+    if jobs == 1 or len(tasks) < 2:
+        yield from map(worker, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(worker, tasks)
+
+
+def is_screen_yaml(text: str) -> bool:
+    """True for current-format (Screens:) pa.yaml"""
+    for line in text.splitlines():
+        if line.strip() and not line.startswith('#'):
+            return line.rstrip() == 'Screens:'
+    return False
+
+
+def screen_members(package: MSAppPackage) -> List[str]:
+    """Controls/*.json members whose TopParent is a screen"""
+    return [m for m in package.control_files() if m.startswith('Controls/')
+            and package.read_json(m).get('TopParent', {}).get('Template', {}).get('Name') == 'screen']
+
+
+def controls_to_yaml(package: MSAppPackage, jobs: Optional[int] = None, include_defaults: bool = False,
+                     out_dir: Optional[Path] = None) -> Dict:
+    """Regenerate Src/<Screen>.pa.yaml for every screen (into the package, or files under out_dir)"""
+    package.flush()
+    tasks = [(m, package.read(m), include_defaults) for m in screen_members(package)]
+    screens = []
+    for result in _run(_json_to_yaml, tasks, jobs):
+        yaml_member = f"Src/{result['screen']}.pa.yaml"
+        text = result.pop('yaml')
+        result["changed"] = not package.exists(yaml_member) or package.read_text(yaml_member) != text
+        result["chars"] = len(text)
+        if out_dir is not None:
+            path = Path(out_dir) / f"{result['screen']}.pa.yaml"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding='utf-8')
+        elif result["changed"]:
+            package.write(yaml_member, text)
+        screens.append(result)
+    return {"screens": screens, "changed": sum(s["changed"] for s in screens)}
+
+
+def yaml_to_controls(package: MSAppPackage, jobs: Optional[int] = None, prune: bool = False,
+                     yaml_dir: Optional[Path] = None) -> Dict:
+    """Apply Src/<Screen>.pa.yaml (or *.pa.yaml files in yaml_dir) onto the Controls JSON"""
+    package.flush()
+    if yaml_dir is not None:
+        sources = {f"Src/{p.name}": p.read_text(encoding='utf-8-sig') for p in sorted(Path(yaml_dir).glob('*.pa.yaml'))}
+    else:
+        sources = {m: package.read_text(m) for m in package.names()
+                   if m.startswith('Src/') and m.endswith('.pa.yaml')}
+    members = {package.read_json(m)['TopParent']['Name']: m for m in screen_members(package)}
+
+    # Each screen gets its own block of unique ids for new controls (at most one per 'Control:' line)
+    next_id = package.max_unique_id() + 1
+    tasks = []
+    for yaml_member, text in sources.items():
+        if not is_screen_yaml(text):
+            continue  # App.pa.yaml, _EditorState.pa.yaml, old 'As screen' files
+        member = members.get(Path(yaml_member).name[:-len('.pa.yaml')])
+        tasks.append((yaml_member, text, package.read(member) if member else None, next_id, prune))
+        next_id += text.count('Control:') + 1
+
+    report = {"screens": [], "errors": [], "warnings": []}
+    screen_count = len(members)
+    for result in _run(_yaml_to_json, tasks, jobs):
+        if "error" in result:
+            report["errors"].append(result["error"])
+            continue
+        document = result.pop('document')
+        member = members.get(result['screen'])
+        if member is None:
+            member = f"Controls/{document['TopParent']['ControlUniqueId']}.json"
+            document['TopParent']['Index'] = screen_count
+            screen_count += 1
+        package.write_json(member, document)
+        result["member"] = member
+        for name in result["missing_controls"]:
+            report["warnings"].append(f"{result['yaml_member']}: control {name} not in YAML "
+                                      f"({'removed' if prune else 'kept'})")
+        report["screens"].append(result)
+    if report["screens"]:
+        package.update_control_count()
+    return report
+
+
+class SyncScreenYaml:
+    """Pipeline stage: {"stage": "sync_yaml", "direction": "to_yaml" | "to_json", "prune": false}"""
+
+    name = "sync_yaml"
+
+    def __init__(self, direction: str = "to_yaml", prune: bool = False, all_rules: bool = False,
+                 jobs: Optional[int] = None):
+        if direction not in ("to_yaml", "to_json"):
+            raise ValueError(f"sync_yaml direction must be to_yaml or to_json, not '{direction}'")
+        self.direction = direction
+        self.prune = prune
+        self.all_rules = all_rules
+        self.jobs = jobs
+
+    def run(self, package: MSAppPackage) -> Dict:
+        if self.direction == "to_yaml":
+            report = controls_to_yaml(package, self.jobs, self.all_rules)
+        else:
+            report = yaml_to_controls(package, self.jobs, self.prune)
+            for screen in report["screens"]:
+                screen.pop("missing_rules")
+        report["screens"] = [s["screen"] for s in report["screens"]]
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert screens between Controls JSON and pa.yaml")
+    parser.add_argument("direction", choices=["to-yaml", "to-json"])
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output .msapp (not needed with to-yaml --out-dir)")
+    parser.add_argument("--out-dir", help="to-yaml: write <Screen>.pa.yaml files here instead of into a package")
+    parser.add_argument("--yaml-dir", help="to-json: read <Screen>.pa.yaml files from here instead of Src/")
+    parser.add_argument("--all-rules", action="store_true", help="to-yaml: include Studio default rules")
+    parser.add_argument("--prune", action="store_true", help="to-json: remove controls and rules missing from the YAML")
+    parser.add_argument("--jobs", type=int, help="Worker processes (default: CPU count, 1 to run inline)")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+    if not args.output and not (args.direction == "to-yaml" and args.out_dir):
+        parser.error("an output .msapp is required")
+
+    start = time.perf_counter()
+    package = MSAppPackage.load(input_path)
+    if args.direction == "to-yaml":
+        report = controls_to_yaml(package, args.jobs, args.all_rules, Path(args.out_dir) if args.out_dir else None)
+        for screen in report["screens"]:
+            print(f"  {screen['screen']:<28} {screen['controls']:>5} controls  {screen['chars']:>8,} chars  "
+                  f"{'updated' if screen['changed'] else 'unchanged'}")
+    else:
+        report = yaml_to_controls(package, args.jobs, args.prune, Path(args.yaml_dir) if args.yaml_dir else None)
+        for screen in report["screens"]:
+            print(f"  {screen['screen']:<28} -> {screen['member']:<20} +{len(screen['added'])} controls, "
+                  f"{len(screen['missing_rules'])} rules not in YAML")
+        for warning in report["warnings"]:
+            print(f"   WARNING: {warning}")
+        for error in report["errors"]:
+            print(f"   ERROR: {error}")
+
+    if args.output:
+        package.save(Path(args.output))
+        print(f"Created: {args.output}")
+    print(f"{len(report['screens'])} screens in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return 2 if report.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
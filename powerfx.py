@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Power Fx Formula Helpers
+Lossless tokenizer, statement splitting and literal formatting for Power Fx formulas
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+Token = namedtuple('Token', ['kind', 'text', 'start'])
+
+OPERATORS = ('<=', '>=', '<>', '&&', '||', '=', '<', '>', '+', '-', '*', '/', '^', '&', '%',
+             '!', '.', ',', ';', ':', '(', ')', '{', '}', '[', ']', '@')
+
+_WHITESPACE = re.compile(r'\s+')
+_NUMBER = re.compile(r'\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?')
+_IDENT = re.compile(r'[^\W\d]\w*', re.UNICODE)
+_PLAIN_IDENT = re.compile(r'^[^\W\d]\w*$', re.UNICODE)
+
+OPEN_BRACKETS = '({['
+CLOSE_BRACKETS = ')}]'
+
+
+def _scan_string(formula: str, pos: int, quote: str) -> int:
+    """Return the end of a quoted string/identifier starting at pos (doubled quotes escape)"""
+    i = pos + 1
+    while i < len(formula):
+        if formula[i] == quote:
+            if formula[i + 1:i + 2] == quote:
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return len(formula)
+
+
+def _scan_interpolated(formula: str, pos: int) -> int:
+    """Return the end of a $"..." string, skipping {...} islands"""
+    i = pos + 2
+    depth = 0
+    while i < len(formula):
+        ch = formula[i]
+        if depth == 0:
+            if ch == '"':
+                if formula[i + 1:i + 2] == '"':
+                    i += 2
+                    continue
+                return i + 1
+            if ch == '{':
+                depth = 1
+        else:
+            if ch == '"':
+                i = _scan_string(formula, i, '"')
+                continue
+            if ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+        i += 1
+    return len(formula)
+
+
+@lru_cache(maxsize=8192)
+def tokenize(formula: str) -> Tuple[Token, ...]:
+    """Split a formula into tokens; ''.join(t.text) reproduces the input exactly
+
+    Kinds: ws, comment, string, number, ident, qident (quoted 'identifier'), op, other
+    """
+    tokens = []
+    i = 0
+    length = len(formula)
+    while i < length:
+        ch = formula[i]
+        if ch.isspace():
+            end = _WHITESPACE.match(formula, i).end()
+            kind = 'ws'
+        elif formula.startswith('//', i):
+            newline = formula.find('\n', i)
+            end = length if newline == -1 else newline
+            kind = 'comment'
+        elif formula.startswith('/*', i):
+            close = formula.find('*/', i + 2)
+            end = length if close == -1 else close + 2
+            kind = 'comment'
+        elif ch == '"':
+            end = _scan_string(formula, i, '"')
+            kind = 'string'
+        elif formula.startswith('$"', i):
+            end = _scan_interpolated(formula, i)
+            kind = 'string'
+        elif ch == "'":
+            end = _scan_string(formula, i, "'")
+            kind = 'qident'
+        elif ch.isdigit() or (ch == '.' and formula[i + 1:i + 2].isdigit()):
+            end = _NUMBER.match(formula, i).end()
+            kind = 'number'
+        else:
+            match = _IDENT.match(formula, i)
+            if match:
+                end = match.end()
+                kind = 'ident'
+            else:
+                op = next((o for o in OPERATORS if formula.startswith(o, i)), None)
+                end = i + (len(op) if op else 1)
+                kind = 'op' if op else 'other'
+        tokens.append(Token(kind, formula[i:end], i))
+        i = end
+    return tuple(tokens)
+
+
+def significant(tokens) -> List[Token]:
+    """Tokens without whitespace and comments"""
+    return [t for t in tokens if t.kind not in ('ws', 'comment')]
+
+
+def identifier_name(token: Token) -> Optional[str]:
+    """Name of an ident or 'quoted ident' token, None for anything else"""
+    if token.kind == 'ident':
+        return token.text
+    if token.kind == 'qident':
+        return token.text[1:-1].replace("''", "'")
+    return None
+
+
+def split_top_level(formula: str, separator: str) -> List[str]:
+    """Split on separator tokens that are not nested in (), {} or []"""
+    parts = []
+    depth = 0
+    start = 0
+    for token in tokenize(formula):
+        if token.kind != 'op':
+            continue
+        if token.text in OPEN_BRACKETS:
+            depth += 1
+        elif token.text in CLOSE_BRACKETS:
+            depth -= 1
+        elif token.text == separator and depth == 0:
+            parts.append(formula[start:token.start])
+            start = token.start + len(token.text)
+    parts.append(formula[start:])
+    return parts
+
+
+def split_statements(formula: str) -> List[str]:
+    """Split a behavior formula into its ';'-chained statements"""
+    return [s.strip() for s in split_top_level(formula, ';') if s.strip()]
+
+
+def join_statements(statements: List[str], separator: str = ';') -> str:
+    return separator.join(statements)
+
+
+def parse_call(statement: str) -> Optional[Tuple[str, List[str]]]:
+    """Split 'Fn(a, b, ...)' into ('Fn', ['a', 'b', ...]); None if not a single call"""
+    tokens = significant(tokenize(statement))
+    if len(tokens) < 3 or tokens[0].kind != 'ident' or tokens[1].text != '(' or tokens[-1].text != ')':
+        return None
+    depth = 0
+    for token in tokens[1:-1]:
+        if token.kind == 'op' and token.text in OPEN_BRACKETS:
+            depth += 1
+        elif token.kind == 'op' and token.text in CLOSE_BRACKETS:
+            depth -= 1
+            if depth == 0:
+                return None
+    inner = statement[tokens[1].start + 1:tokens[-1].start]
+    args = [a.strip() for a in split_top_level(inner, ',')]
+    return tokens[0].text, ([] if args == [''] else args)
+
+
+def format_name(name: str) -> str:
+    """Quote a record field / identifier name when needed"""
+    if _PLAIN_IDENT.match(name):
+        return name
+    return "'" + name.replace("'", "''") + "'"
+
+
+def format_value(value: Any) -> str:
+    """Python value -> Power Fx literal, in the compact style used by the enhancers"""
+    if value is None:
+        return 'Blank()'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, dict):
+        return '{' + ','.join(f"{format_name(str(k))}:{format_value(v)}" for k, v in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(format_value(v) for v in value) + ']'
+    raise TypeError(f"Cannot express {type(value).__name__} as a Power Fx literal")
+
+
+def clear_collect(collection: str, rows: List[dict]) -> str:
+    """ClearCollect(collection, {..}, {..}) statement for a list of records"""
+    if not rows:
+        raise ValueError(f"{collection}: at least one record is required to seed a collection")
+    return f"ClearCollect({collection}," + ','.join(format_value(r) for r in rows) + ')'
+
+
+def concurrent_args(statement: str) -> Optional[List[str]]:
+    """Arguments of a Concurrent(a, b, ...) statement, None for any other statement"""
+    call = parse_call(statement)
+    return call[1] if call and call[0] == 'Concurrent' else None
+
+
+def format_concurrent(statements: List[str]) -> str:
+    return 'Concurrent(\n    ' + ',\n    '.join(statements) + '\n)'
+
+
+def statement_units(formula: str) -> List[Tuple[int, Optional[int], str]]:
+    """(statement index, Concurrent argument index or None, text) for every unit of work
+
+    Top-level statements, with the arguments of a top-level Concurrent(...)
+    listed as units of their own.
+    """
+    units = []
+    for i, statement in enumerate(split_statements(formula)):
+        args = concurrent_args(statement)
+        if args is None:
+            units.append((i, None, statement))
+        else:
+            units.extend((i, j, arg) for j, arg in enumerate(args))
+    return units
+
+
+def replace_unit(formula: str, index: int, arg: Optional[int], text: Optional[str]) -> str:
+    """Replace (or drop, if text is None) a unit found by statement_units"""
+    statements = split_statements(formula)
+    if arg is None:
+        if text is None:
+            del statements[index]
+        else:
+            statements[index] = text
+    else:
+        args = concurrent_args(statements[index])
+        if text is None:
+            del args[arg]
+        else:
+            args[arg] = text
+        if len(args) > 1:
+            statements[index] = format_concurrent(args)
+        elif args:
+            statements[index] = args[0]
+        else:
+            del statements[index]
+    return join_statements(statements)
+
+
+def set_clear_collect(formula: str, collection: str, rows: List[dict]) -> str:
+    """Replace the ClearCollect seeding a collection in a behavior formula (or append one)"""
+    replacement = clear_collect(collection, rows)
+    for index, arg, statement in statement_units(formula):
+        call = parse_call(statement)
+        if call and call[0] == 'ClearCollect' and call[1] and call[1][0] == collection:
+            return replace_unit(formula, index, arg, replacement)
+    return join_statements(split_statements(formula) + [replacement])
+
+
+def parse_record(text: str) -> Optional[List[Tuple[str, str]]]:
+    """Split a '{A:1, B:"x"}' record literal into [(field, value formula)]; None if not a record"""
+    tokens = significant(tokenize(text))
+    if len(tokens) < 2 or tokens[0].text != '{' or tokens[-1].text != '}':
+        return None
+    inner = text[tokens[0].start + 1:tokens[-1].start]
+    fields = []
+    for part in split_top_level(inner, ','):
+        if not part.strip():
+            continue
+        name_value = split_top_level(part, ':')
+        if len(name_value) < 2:
+            return None
+        name_tokens = significant(tokenize(name_value[0]))
+        if len(name_tokens) != 1 or identifier_name(name_tokens[0]) is None:
+            return None
+        fields.append((identifier_name(name_tokens[0]), ':'.join(name_value[1:]).strip()))
+    return fields
+
+
+def format_record(fields: List[Tuple[str, str]]) -> str:
+    """[(field, value formula)] -> compact record literal"""
+    return '{' + ','.join(f"{format_name(name)}:{value}" for name, value in fields) + '}'
+
+
+def set_record_fields(formula: str, variable: str, fields: Dict[str, str]) -> str:
+    """Override fields of the record in Set(variable, {...}); values are Power Fx formulas"""
+    for index, arg, statement in statement_units(formula):
+        call = parse_call(statement)
+        if not (call and call[0] == 'Set' and len(call[1]) == 2 and call[1][0] == variable):
+            continue
+        record = parse_record(call[1][1])
+        if record is None:
+            raise ValueError(f"{variable} is not set to a record literal")
+        values = dict(record)
+        values.update(fields)
+        return replace_unit(formula, index, arg, f"Set({variable},{format_record(list(values.items()))})")
+    raise ValueError(f"No Set({variable}, ...) statement found")
+
+
+def parse_named_formulas(text: str) -> List[Tuple[str, str]]:
+    """Split App.Formulas ('Name = expr; Other = expr;') into [(name, formula)]"""
+    formulas = []
+    for statement in split_statements(text):
+        name_value = split_top_level(statement, '=')
+        tokens = significant(tokenize(name_value[0]))
+        if len(name_value) < 2 or len(tokens) != 1 or identifier_name(tokens[0]) is None:
+            raise ValueError(f"Not a named formula: {statement[:60]}")
+        formulas.append((identifier_name(tokens[0]), '='.join(name_value[1:]).strip()))
+    return formulas
+
+
+def format_named_formulas(formulas: List[Tuple[str, str]]) -> str:
+    return '\n'.join(f"{format_name(name)} = {formula};" for name, formula in formulas)
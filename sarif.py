@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+SARIF Output Helpers
+Builds SARIF 2.1.0 logs shaped like the AppCheckerResult.sarif that Power Apps
+Studio packages, so the same viewers (VS Code SARIF viewer, GitHub code
+scanning) show our findings next to the app checker's
+
+  rules = [sarif_rule("perf-Example", "{0} is slow", "Why it matters", ["How to fix"])]
+  results = [sarif_result(rules, "perf-Example", "HomeScreen.Gallery1.Items",
+                          "HomeScreen", "gallery", "Items", arguments=["Gallery1"])]
+  write_sarif("findings.sarif", sarif_log("msapp delegation check", "1.0", rules, results))
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+SCHEMA = "https://schemastore.azurewebsites.net/schemas/json/sarif-2.1.0-rtm.4.json"
+LEVELS = ("High", "Medium", "Low")
+
+
+def sarif_rule(rule_id: str, text: str, why: str, how_to_fix: List[str], level: str = "Medium",
+               category: str = "performance", component: str = "app") -> Dict:
+    """A tool.driver.rules entry; text may use {0}, {1}... placeholders filled from result arguments"""
+    if level not in LEVELS:
+        raise ValueError(f"SARIF level must be one of {', '.join(LEVELS)}, not '{level}'")
+    return {
+        "id": rule_id,
+        "messageStrings": {"issue": {"text": text}},
+        "properties": {"howToFix": how_to_fix, "whyFix": why, "componentType": component,
+                       "primaryCategory": category, "level": level}
+    }
+
+
+def sarif_result(rules: List[Dict], rule_id: str, name: str, module: str, kind: str, member: str,
+                 arguments: Optional[List[str]] = None, level: Optional[str] = None) -> Dict:
+    """One finding at a dotted location such as HomeScreen.SitesGallery.Items"""
+    index = next(i for i, r in enumerate(rules) if r["id"] == rule_id)
+    message = {"id": "issue"}
+    if arguments:
+        message["arguments"] = [str(a) for a in arguments]
+    return {
+        "ruleId": rule_id,
+        "ruleIndex": index,
+        "message": message,
+        "locations": [{
+            "physicalLocation": {"address": {"relativeAddress": 0, "fullyQualifiedName": name}},
+            "logicalLocations": [{"fullyQualifiedName": name}],
+            "properties": {"module": module, "type": kind, "member": member}
+        }],
+        "properties": {"level": level or rules[index]["properties"]["level"]}
+    }
+
+
+def sarif_log(tool: str, version: str, rules: List[Dict], results: List[Dict]) -> Dict:
+    return {
+        "$schema": SCHEMA,
+        "version": "2.1.0",
+        "runs": [{
+            "results": results,
+            "tool": {"driver": {"name": tool, "fullName": tool, "version": version, "rules": rules}},
+            "invocations": [{"executionSuccessful": True}],
+            "columnKind": "utf16CodeUnits"
+        }]
+    }
+
+
+def result_message(log: Dict, result: Dict) -> str:
+    """The rendered text of a result (rule text with its arguments substituted)"""
+    rule = log["runs"][0]["tool"]["driver"]["rules"][result["ruleIndex"]]
+    text = rule["messageStrings"][result["message"]["id"]]["text"]
+    for k, argument in enumerate(result["message"].get("arguments", [])):
+        text = text.replace(f"{{{k}}}", argument)
+    return text
+
+
+def write_sarif(path: Union[str, Path], log: Dict):
+    Path(path).write_text(json.dumps(log, indent=2), encoding='utf-8')
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Screen Complexity Budgets
+Checks every screen against performance budgets and writes the findings as
+SARIF in the AppCheckerResult.sarif format
+
+  controls           controls on a screen (the screen itself excluded)
+  depth              nesting depth of any control (screen children are depth 1)
+  gallery_children   controls in one gallery template
+  formula_length     characters in one User rule
+  cross_screen_refs  rules referencing controls of other screens (each one keeps
+                     that screen loaded, which defeats delayed screen loading)
+
+Screens are read from Controls JSON; a Src/<Screen>.pa.yaml is only used for
+screens that have no Controls JSON. Budgets can be changed per run or per
+screen with a JSON file:
+
+  {"controls": 250, "formula_length": 800, "screens": {"HomeScreen": {"controls": 400}}}
+
+Usage:
+  python screen_budgets.py app.msapp
+  python screen_budgets.py app.msapp --set controls=150 --set depth=4 --strict
+  python screen_budgets.py app.msapp --budgets budgets.json --sarif budgets.sarif
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import control_model
+from lazy_load import referenced_names
+from msapp_package import MSAppPackage
+from sarif import result_message, sarif_log, sarif_result, sarif_rule, write_sarif
+
+SARIF_MEMBER = 'ScreenBudgetResult.sarif'
+DEFAULT_BUDGETS = {
+    "controls": 300,
+    "depth": 6,
+    "gallery_children": 15,
+    "formula_length": 1000,
+    "cross_screen_refs": 0
+}
+
+RULES = [
+    sarif_rule("perf-ScreenControlCount", "{0} has {1} controls (budget {2})",
+               "Every control on a screen is created, bound and laid out before the screen shows.",
+               ["Split the screen, or move rarely used controls into a component shown on demand."]),
+    sarif_rule("perf-NestingDepth", "{0} is nested {1} levels deep (budget {2})",
+               "Each container level adds a layout pass; deep trees slow rendering and resizing.",
+               ["Flatten containers, or replace nested containers with one auto-layout container."],
+               level="Low"),
+    sarif_rule("perf-GalleryTemplateSize", "Gallery {0} has {1} controls in its template (budget {2})",
+               "Template controls are repeated for every visible row, so their cost is multiplied.",
+               ["Combine labels into one Text formula, or show details on a separate screen."]),
+    sarif_rule("perf-FormulaLength", "{0} is {1} characters long (budget {2})",
+               "Long rules are slower to parse and bind, and are recalculated whenever any input changes.",
+               ["Move shared logic into App.Formulas named formulas, or split the rule with With()."],
+               level="Low"),
+    sarif_rule("perf-CrossScreenReference", "{0} references {1} on {2}",
+               "Referencing another screen's control loads that screen too, defeating delayed screen loading.",
+               ["Pass the value with a global variable, a named formula or Navigate() context instead."]),
+]
+
+
+def screen_models(package: MSAppPackage) -> List[Dict]:
+    """Control models of every screen, Controls JSON first, pa.yaml for screens without JSON"""
+    tops = [package.read_json(m).get('TopParent') or {} for m in package.control_files() if m.startswith('Controls/')]
+    screens = [control_model.from_controls_json(top)
+               for top in sorted(tops, key=lambda t: t.get('Index', 0))
+               if top.get('Template', {}).get('Name') == 'screen']
+    known = {s["Name"] for s in screens}
+    for member in package.names():
+        if not (member.startswith('Src/') and member.endswith('.pa.yaml')):
+            continue
+        try:
+            screen = control_model.screen_from_pa_yaml(package.read_text(member))
+        except control_model.PaYamlError:
+            continue
+        if screen["Name"] not in known:
+            screens.append(screen)
+    return screens
+
+
+def measure_screen(screen: Dict) -> Dict:
+    """Control count, deepest control, gallery template sizes and rule lengths of one screen"""
+    controls, deepest, galleries, lengths = 0, (screen["Name"], 0), {}, []
+    stack: List[Tuple[Dict, int, List[str]]] = [(child, 1, []) for child in screen["Children"]]
+    while stack:
+        control, depth, enclosing = stack.pop()
+        controls += 1
+        if depth > deepest[1]:
+            deepest = (control["Name"], depth)
+        for gallery in enclosing:
+            galleries[gallery] += 1
+        if control["Type"] == 'gallery':
+            galleries[control["Name"]] = 0
+            enclosing = enclosing + [control["Name"]]
+        stack.extend((child, depth + 1, enclosing) for child in control["Children"])
+    for control in control_model.walk(screen):
+        lengths.extend((control["Name"], prop, len(formula)) for prop, formula in control["Properties"].items())
+    return {"controls": controls, "deepest": deepest, "galleries": galleries, "lengths": lengths}
+
+
+def check_budgets(package: MSAppPackage, budgets: Dict = None) -> Tuple[Dict, Dict]:
+    """Check every screen; returns (SARIF log, summary)"""
+    budgets = dict(budgets or {})
+    overrides = budgets.pop("screens", {})
+    screens = screen_models(package)
+    owner = {c["Name"]: s["Name"] for s in screens for c in control_model.walk(s) if c is not s}
+    screen_names = {s["Name"] for s in screens}
+
+    results, summary = [], {"screens": {}}
+    for screen in screens:
+        name = screen["Name"]
+        limits = {**DEFAULT_BUDGETS, **budgets, **overrides.get(name, {})}
+        measured = measure_screen(screen)
+
+        def add(rule_id, control, prop, *arguments, kind='screen'):
+            location = '.'.join(p for p in (name, control if control != name else None, prop) if p)
+            results.append(sarif_result(RULES, rule_id, location, name, kind, prop or control, list(arguments)))
+
+        if measured["controls"] > limits["controls"]:
+            add("perf-ScreenControlCount", name, None, name, measured["controls"], limits["controls"])
+        deepest, depth = measured["deepest"]
+        if depth > limits["depth"]:
+            add("perf-NestingDepth", deepest, None, deepest, depth, limits["depth"], kind='control')
+        for gallery, size in measured["galleries"].items():
+            if size > limits["gallery_children"]:
+                add("perf-GalleryTemplateSize", gallery, None, gallery, size, limits["gallery_children"],
+                    kind='gallery')
+        for control, prop, length in measured["lengths"]:
+            if length > limits["formula_length"]:
+                add("perf-FormulaLength", control, prop, f"{control}.{prop}", length, limits["formula_length"],
+                    kind='control')
+
+        cross = []
+        for control in control_model.walk(screen):
+            for prop, formula in control["Properties"].items():
+                for ref in sorted(referenced_names(formula) - screen_names):
+                    if owner.get(ref, name) != name:
+                        cross.append((control["Name"], prop, ref, owner[ref]))
+        if len(cross) > limits["cross_screen_refs"]:
+            for control, prop, ref, other in cross:
+                add("perf-CrossScreenReference", control, prop, f"{control}.{prop}", ref, other, kind='control')
+
+        summary["screens"][name] = {
+            "controls": measured["controls"],
+            "depth": depth,
+            "largest_gallery": max(measured["galleries"].values(), default=0),
+            "longest_formula": max((length for _, _, length in measured["lengths"]), default=0),
+            "cross_screen_refs": len(cross)
+        }
+
+    log = sarif_log("msapp screen budgets", "1.0", RULES, results)
+    summary.update({
+        "budgets": dict(DEFAULT_BUDGETS, **budgets),
+        "findings": len(results),
+        "by_rule": dict(Counter(r["ruleId"] for r in results)),
+        "results": [{"rule": r["ruleId"], "level": r["properties"]["level"],
+                     "location": r["locations"][0]["logicalLocations"][0]["fullyQualifiedName"],
+                     "message": result_message(log, r)} for r in results]
+    })
+    return log, summary
+
+
+def parse_budgets(specs: List[str]) -> Dict[str, int]:
+    """['controls=150', ...] -> {'controls': 150}"""
+    budgets = {}
+    for spec in specs:
+        name, _, value = spec.partition('=')
+        if name not in DEFAULT_BUDGETS or not value.isdigit():
+            raise ValueError(f"--set expects NAME=N with NAME one of {', '.join(DEFAULT_BUDGETS)}, got '{spec}'")
+        budgets[name] = int(value)
+    return budgets
+
+
+class ScreenBudgets:
+    """Pipeline stage: {"stage": "screen_budgets", "budgets": {"controls": 250}, "strict": false}"""
+
+    name = "screen_budgets"
+
+    def __init__(self, budgets: Dict = None, strict: bool = False, sarif_member: str = SARIF_MEMBER):
+        unknown = set(budgets or {}) - set(DEFAULT_BUDGETS) - {"screens"}
+        if unknown:
+            raise ValueError(f"Unknown screen budgets: {', '.join(sorted(unknown))}")
+        self.budgets = budgets
+        self.strict = strict
+        self.sarif_member = sarif_member
+
+    def run(self, package: MSAppPackage) -> Dict:
+        log, summary = check_budgets(package, self.budgets)
+        if self.sarif_member:
+            package.write(self.sarif_member, json.dumps(log))
+            summary["sarif_member"] = self.sarif_member
+        messages = [f"{r['location']}: {r['message']}" for r in summary.pop("results")]
+        summary["errors" if self.strict else "warnings"] = messages
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check screens against performance budgets")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help=f"Also save a copy of the package with {SARIF_MEMBER}")
+    parser.add_argument("--budgets", help="JSON file with budgets (and per-screen overrides under \"screens\")")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=N",
+                        help=f"Override one budget ({', '.join(DEFAULT_BUDGETS)}); repeatable")
+    parser.add_argument("--sarif", help="SARIF output path (default: <input>_Budgets.sarif)")
+    parser.add_argument("--report", help="Write the JSON summary to this path")
+    parser.add_argument("--strict", action="store_true", help="Exit with status 2 when any budget is exceeded")
+    args = parser.parse_args()
+
+    budgets = {}
+    if args.budgets:
+        with open(args.budgets, 'r', encoding='utf-8') as f:
+            budgets = json.load(f)
+    try:
+        budgets.update(parse_budgets(args.set))
+    except ValueError as e:
+        parser.error(str(e))
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    package = MSAppPackage.load(input_path)
+    log, summary = check_budgets(package, budgets)
+    print(f"  {'screen':<28} {'controls':>8} {'depth':>6} {'gallery':>8} {'formula':>8} {'x-refs':>7}")
+    for name, screen in summary["screens"].items():
+        print(f"  {name:<28} {screen['controls']:>8} {screen['depth']:>6} {screen['largest_gallery']:>8} "
+              f"{screen['longest_formula']:>8} {screen['cross_screen_refs']:>7}")
+    for result in summary["results"]:
+        print(f"   [{result['level']:<6}] {result['location']}: {result['message']}")
+    print(f"\n{summary['findings']} budget findings in {len(summary['screens'])} screens")
+
+    sarif_path = Path(args.sarif) if args.sarif else input_path.parent / f"{input_path.stem}_Budgets.sarif"
+    write_sarif(sarif_path, log)
+    print(f"Created: {sarif_path}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    if args.output:
+        package.write(SARIF_MEMBER, json.dumps(log))
+        package.save(Path(args.output))
+        print(f"Created: {args.output}")
+    return 2 if args.strict and summary["findings"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -571,8 +571,9 @@ Screen(
         AccessibleLabel: "Go to next page of assessments"
       )
     )
-  ),  // Re
-view Panel (Right) - Enhanced with empty state handling
+  ),
+
+  // Review Panel (Right) - Enhanced with empty state handling
   Container(
     X: 360, Y: 100, Width: Parent.Width - 380, Height: Parent.Height - 120,
     
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Static Start-up Cost Estimator
+Scores the work an app does before its first screen is usable, without
+opening Studio: App OnStart, App.Formulas, the start screen's OnVisible and
+the rules of every control on the start screen
+
+  data_calls   connector calls (Refresh, data source reads)
+  records      rows seeded by ClearCollect/Collect literals
+  onstart_kb   OnStart + start screen OnVisible formula size (evaluated at launch)
+  formulas_kb  App.Formulas size (parsed at launch, evaluated on first use)
+  rules_kb     start screen control rule size (parsed and bound before render)
+  controls     controls on the start screen
+  image_kb     images the start screen and splash load
+
+Each count is multiplied by a weight (roughly milliseconds on a mid-range
+device) and summed into one score. Weights are a model, not a measurement:
+compare scores between builds of the same app, not between apps.
+
+Usage:
+  python startup_cost.py app.msapp
+  python startup_cost.py app.msapp --report startup.json
+  python startup_cost.py app.msapp --baseline startup.json --max-increase 5   # CI gate, exit 2 on regression
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from control_query import ControlIndex
+from delegation_check import formula_sites
+from lazy_load import referenced_names, screen_order
+from msapp_package import MSAppPackage
+from onstart_concurrency import LOCAL_MS_PER_KB, REMOTE_MS, Statement, remote_data_sources
+
+DEFAULT_WEIGHTS = {
+    "data_calls": REMOTE_MS,
+    "records": 0.05,
+    "onstart_kb": LOCAL_MS_PER_KB,
+    "formulas_kb": 0.5,
+    "rules_kb": 1.0,
+    "controls": 1.5,
+    "image_kb": 0.2
+}
+RESOURCES = 'References/Resources.json'
+PUBLISH_INFO = 'Resources/PublishInfo.json'
+
+
+def seeded_records(formula: str) -> int:
+    """Records written by ClearCollect/Collect literals: {..} arguments and [..] / Table(..) rows"""
+    if 'Collect' not in formula:
+        return 0
+    tokens = powerfx.significant(powerfx.tokenize(formula))
+    stack: List[Optional[str]] = []
+    count = 0
+    for k, token in enumerate(tokens):
+        if token.text in powerfx.OPEN_BRACKETS:
+            previous = tokens[k - 1].text if k else ''
+            parent = stack[-1] if stack else None
+            if token.text == '(' and previous in ('Collect', 'ClearCollect'):
+                role = 'collect'
+            elif parent == 'collect' and (token.text == '[' or (token.text == '(' and previous == 'Table')):
+                role = 'table'
+            elif token.text == '{' and parent in ('collect', 'table'):
+                role = 'record'
+                count += 1
+            else:
+                role = None
+            stack.append(role)
+        elif token.text in powerfx.CLOSE_BRACKETS and stack:
+            stack.pop()
+    return count
+
+
+def _kb(text: str) -> float:
+    return len(text.encode('utf-8')) / 1024
+
+
+def image_bytes(package: MSAppPackage, names: set) -> Dict[str, int]:
+    """Packaged images referenced by name in the given formulas, plus the splash logo"""
+    images = {}
+    if package.exists(RESOURCES):
+        for entry in package.read_json(RESOURCES).get('Resources', []):
+            path = MSAppPackage.normalize_name(entry.get('Path', ''))
+            if entry.get('Name') in names and package.exists(path):
+                images[path] = len(package.read(path))
+    if package.exists(PUBLISH_INFO):
+        logo = f"Resources/{package.read_json(PUBLISH_INFO).get('LogoFileName', '')}"
+        if package.exists(logo):
+            images[logo] = len(package.read(logo))
+    return images
+
+
+def estimate_startup(package: MSAppPackage, weights: Dict[str, float] = None) -> Dict:
+    """Counts, weighted score and breakdown of the start-up work"""
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    remote = remote_data_sources(package)
+    index = ControlIndex(package)
+    order = screen_order(package, index)
+    start_screen = order[0] if order else None
+
+    onstart = package.get_app_formula('OnStart') or ''
+    formulas = package.get_app_formula('Formulas') or ''
+    sites = [s for s in formula_sites(package) if start_screen and s.screen == start_screen]
+    on_visible = next((s.formula for s in sites if s.control == s.screen and s.prop == 'OnVisible'), '')
+    rules = [s for s in sites if not (s.control == s.screen and s.prop == 'OnVisible')]
+
+    launch = [Statement(text, remote) for formula in (onstart, on_visible)
+              for _, _, text in powerfx.statement_units(formula)]
+    rule_calls = sum(len(referenced_names(s.formula) & remote) for s in rules)
+    mentioned = set().union(*(referenced_names(f) for f in [onstart, formulas, on_visible] + [s.formula for s in rules]))
+    images = image_bytes(package, mentioned)
+    controls = {s.control for s in sites} | {r.name for r in index.query(f'screen={start_screen}')} \
+        if start_screen else set()
+
+    counts = {
+        "data_calls": sum(s.remote for s in launch) + rule_calls,
+        "records": seeded_records(onstart) + seeded_records(on_visible),
+        "onstart_kb": _kb(onstart) + _kb(on_visible),
+        "formulas_kb": _kb(formulas),
+        "rules_kb": sum(_kb(s.formula) for s in rules),
+        "controls": len(controls),
+        "image_kb": sum(images.values()) / 1024
+    }
+    points = {name: counts[name] * weights[name] for name in counts}
+    score = sum(points.values())
+    largest = sorted([("App.OnStart", onstart), ("App.Formulas", formulas), (f"{start_screen}.OnVisible", on_visible)]
+                     + [(f"{s.control}.{s.prop}", s.formula) for s in rules], key=lambda x: -len(x[1]))[:5]
+    return {
+        "start_screen": start_screen,
+        "score": round(score, 1),
+        "breakdown": {name: {"count": round(counts[name], 2), "weight": weights[name],
+                             "points": round(points[name], 1),
+                             "pct": round(100 * points[name] / score, 1) if score else 0.0}
+                      for name in counts},
+        "largest_formulas": [{"rule": where, "bytes": len(text.encode('utf-8'))} for where, text in largest if text],
+        "images": images
+    }
+
+
+def compare(report: Dict, baseline: Dict) -> Dict:
+    """Score change against an earlier report, with the components that moved"""
+    before, after = baseline["score"], report["score"]
+    return {
+        "score_before": before,
+        "score_after": after,
+        "change_pct": round(100 * (after - before) / before, 1) if before else 0.0,
+        "components": {name: round(item["points"] - baseline["breakdown"].get(name, {}).get("points", 0.0), 1)
+                       for name, item in report["breakdown"].items()
+                       if item["points"] != baseline["breakdown"].get(name, {}).get("points", 0.0)}
+    }
+
+
+class StartupCost:
+    """Pipeline stage: {"stage": "startup_cost", "budget": 1500}"""
+
+    name = "startup_cost"
+
+    def __init__(self, budget: float = None, weights: Dict[str, float] = None):
+        self.budget = budget
+        self.weights = weights
+
+    def run(self, package: MSAppPackage) -> Dict:
+        report = estimate_startup(package, self.weights)
+        if self.budget is not None and report["score"] > self.budget:
+            report["errors"] = [f"start-up score {report['score']} is over the budget of {self.budget}"]
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the start-up cost of a .msapp package")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("--weights", help="JSON file overriding component weights")
+    parser.add_argument("--report", help="Write the JSON report to this path (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="Earlier --report to compare against")
+    parser.add_argument("--max-increase", type=float, metavar="PCT",
+                        help="With --baseline: exit with status 2 if the score rises by more than PCT percent")
+    parser.add_argument("--budget", type=float, help="Exit with status 2 if the score is above this")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+    weights = None
+    if args.weights:
+        with open(args.weights, 'r', encoding='utf-8') as f:
+            weights = json.load(f)
+        unknown = set(weights) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            parser.error(f"unknown weights: {', '.join(sorted(unknown))} (known: {', '.join(DEFAULT_WEIGHTS)})")
+
+    report = estimate_startup(MSAppPackage.load(input_path), weights)
+    print(f"Start screen: {report['start_screen']}")
+    for name, item in report["breakdown"].items():
+        print(f"  {name:<12} {item['count']:>10,} x {item['weight']:<6} = {item['points']:>9,.1f}  ({item['pct']}%)")
+    print(f"Start-up score: {report['score']:,}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report["comparison"] = compare(report, json.load(f))
+        change = report["comparison"]
+        moved = ', '.join(f"{n} {d:+}" for n, d in change["components"].items())
+        print(f"Baseline: {change['score_before']:,} -> {change['score_after']:,} ({change['change_pct']:+}%)"
+              f"{'  [' + moved + ']' if moved else ''}")
+        if args.max_increase is not None and change["change_pct"] > args.max_increase:
+            print(f"   ERROR: start-up score rose {change['change_pct']}% (allowed {args.max_increase}%)")
+            status = 2
+    if args.budget is not None and report["score"] > args.budget:
+        print(f"   ERROR: start-up score {report['score']} is over the budget of {args.budget}")
+        status = 2
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Static Table Data Sources
+Embeds seed datasets as static (imported-Excel-style) tables declared in
+References/DataSources.json instead of ClearCollect record literals in
+App OnStart, and points every formula at the table:
+
+  OnStart:           ...;ClearCollect(colSites,{SiteId:1,...},{SiteId:2,...});...
+  DataSources.json:  {"Name": "colSites", "Type": "Collection"}
+
+becomes
+
+  OnStart:           ...
+  DataSources.json:  {"Name": "tblSites", "Type": "StaticDataSourceInfo",
+                      "Schema": "*[SiteId:n, SiteName:s, ...]", "Data": "[{...}]", ...}
+  Gallery Items:     Filter(colSites, ...)  ->  Filter(tblSites, ...)
+
+Static tables are read-only, so a collection is only converted when its seed
+is the one thing that writes it (no Collect, Patch, Remove, LoadData, ...).
+Literal values must be numbers, strings, booleans, Blank() or
+DateValue("yyyy-mm-dd"); a seed calling anything else (User(), Now()) stays.
+
+--benchmark builds the same datasets both ways (OnStart literals vs static
+tables) and compares build time, package size, OnStart size and the
+start-up score; --rows scales every dataset to N rows first. The score
+does not count static table data, which is read when a formula first uses
+the table rather than at launch.
+
+Usage:
+  python static_tables.py app.msapp --dry-run
+  python static_tables.py app.msapp out.msapp --dataset colSites=sites.json --name colSites=Sites
+  python static_tables.py app.msapp --benchmark --rows 5000 --report static.json
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from dead_code import drop_statements
+from delegation_check import formula_sites
+from formula_rewrite import FormulaRewriter, rename_identifier
+from msapp_package import MSAppPackage
+from named_formulas import rename_in_yaml
+from onstart_concurrency import DATASOURCES, Statement
+from startup_cost import estimate_startup
+
+_ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# Python value -> Schema type letter; dates only come from DateValue() literals
+SCHEMA_TYPES = {bool: 'b', int: 'n', float: 'n', str: 's'}
+
+
+class NotLiteral(ValueError):
+    """A seed value that cannot be stored in a static table"""
+
+
+def _add_type(types: Dict[str, Optional[str]], name: str, kind: Optional[str]):
+    """Record a column's type; None (blank) fits any type, anything else must agree"""
+    known = types.setdefault(name, kind)
+    if kind is None or known == kind:
+        return
+    if known is not None:
+        raise NotLiteral(f"column {name} mixes types {known} and {kind}")
+    types[name] = kind
+
+
+def table_name(collection: str) -> str:
+    """tblSites for colSites, tblMethods for Methods"""
+    stem = collection[3:] if collection.startswith('col') and collection[3:4].isupper() else collection
+    return f"tbl{stem[:1].upper()}{stem[1:]}"
+
+
+def literal_value(text: str) -> Tuple[Any, Optional[str]]:
+    """Power Fx literal -> (value, schema type); type None for Blank()"""
+    tokens = powerfx.significant(powerfx.tokenize(text))
+    texts = [t.text for t in tokens]
+    if len(tokens) == 1 and tokens[0].kind == 'number':
+        value = float(texts[0])
+        return (int(value), 'n') if value.is_integer() and '.' not in texts[0] else (value, 'n')
+    if len(tokens) == 2 and texts[0] == '-' and tokens[1].kind == 'number':
+        value, kind = literal_value(texts[1])
+        return -value, kind
+    if len(tokens) == 1 and tokens[0].kind == 'string' and texts[0].startswith('"'):
+        return texts[0][1:-1].replace('""', '"'), 's'
+    if texts in (['true'], ['false']):
+        return texts[0] == 'true', 'b'
+    if texts == ['Blank', '(', ')']:
+        return None, None
+    if len(tokens) == 4 and texts[:2] == ['DateValue', '('] and texts[3] == ')' and tokens[2].kind == 'string':
+        value = texts[2][1:-1]
+        if _ISO_DATE.match(value):
+            return value, 'D'
+    raise NotLiteral(f"'{text.strip()}' is not a literal")
+
+
+def literal_rows(args: List[str]) -> Tuple[List[Dict], Dict[str, str]]:
+    """ClearCollect record/table arguments -> (rows, {column: schema type}); raises NotLiteral"""
+    records = []
+    for arg in args:
+        tokens = powerfx.significant(powerfx.tokenize(arg))
+        if tokens and tokens[0].text == '[' and tokens[-1].text == ']':
+            inner = arg[tokens[0].start + 1:tokens[-1].start]
+            records.extend(part for part in powerfx.split_top_level(inner, ',') if part.strip())
+        else:
+            records.append(arg)
+
+    rows, types = [], {}
+    for record in records:
+        fields = powerfx.parse_record(record)
+        if fields is None:
+            raise NotLiteral(f"'{record.strip()[:40]}' is not a record literal")
+        row = {}
+        for name, formula in fields:
+            row[name], kind = literal_value(formula)
+            _add_type(types, name, kind)
+        rows.append(row)
+    return rows, types
+
+
+def dataset_types(rows: List[Dict]) -> Dict[str, str]:
+    """Column schema types of JSON rows; raises NotLiteral for nested values or mixed types"""
+    types = {}
+    for row in rows:
+        for name, value in row.items():
+            kind = None if value is None else SCHEMA_TYPES.get(type(value))
+            if kind is None and value is not None:
+                raise NotLiteral(f"column {name} holds a {type(value).__name__}")
+            _add_type(types, name, kind)
+    return types
+
+
+def static_source(name: str, rows: List[Dict], types: Dict[str, str]) -> Dict:
+    """StaticDataSourceInfo entry for References/DataSources.json"""
+    columns = list(types)
+    return {
+        "Name": name,
+        "Type": "StaticDataSourceInfo",
+        "Schema": "*[" + ", ".join(f"{powerfx.format_name(c)}:{types[c] or 's'}" for c in columns) + "]",
+        "Data": json.dumps([{c: row.get(c) for c in columns} for row in rows], separators=(',', ':')),
+        "OrderedColumnNames": columns,
+        "IsSampleData": False,
+        "IsWritable": False
+    }
+
+
+def onstart_seeds(onstart: str) -> Dict[str, List[str]]:
+    """collection -> ClearCollect arguments for every top-level seed in OnStart"""
+    seeds = {}
+    for _, _, statement in powerfx.statement_units(onstart):
+        call = powerfx.parse_call(statement)
+        if call and call[0] == 'ClearCollect' and len(call[1]) > 1:
+            seeds[call[1][0].strip()] = call[1][1:]
+    return seeds
+
+
+def scale_rows(rows: List[Dict], count: int) -> List[Dict]:
+    """Repeat rows up to count, renumbering the first integer column so rows stay distinct"""
+    key = next((name for name, value in rows[0].items()
+                if isinstance(value, int) and not isinstance(value, bool)), None)
+    scaled = []
+    for i in range(count):
+        row = dict(rows[i % len(rows)])
+        if key:
+            row[key] = i + 1
+        scaled.append(row)
+    return scaled
+
+
+class StaticTables:
+    """Pipeline stage: {"stage": "static_tables", "datasets": {"colSites": [...]}, "names": {"colSites": "Sites"}}"""
+
+    name = "static_tables"
+
+    def __init__(self, datasets: Dict[str, List[dict]] = None, collections: List[str] = None,
+                 names: Dict[str, str] = None, dry_run: bool = False):
+        self.datasets = datasets or {}
+        self.collections = set(collections) if collections else None
+        self.names = names or {}
+        self.dry_run = dry_run
+
+    def tables(self, package: MSAppPackage) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+        """(collection -> static source entry, collection -> reason it stays a collection)"""
+        onstart = package.get_app_formula('OnStart') or ''
+        seeds = onstart_seeds(onstart)
+        wanted = set(self.datasets) | (set(seeds) if self.collections is None else self.collections)
+        writes = {}
+        for site in formula_sites(package):
+            for _, _, text in powerfx.statement_units(site.formula):
+                for name in Statement(text, set()).writes & wanted:
+                    writes[name] = writes.get(name, 0) + 1
+        existing = {s.get('Name') for s in package.read_json(DATASOURCES).get('DataSources', [])} \
+            if package.exists(DATASOURCES) else set()
+
+        tables, skipped = {}, {}
+        for collection in sorted(wanted):
+            table = self.names.get(collection) or table_name(collection)
+            if writes.get(collection, 0) > (1 if collection in seeds else 0):
+                skipped[collection] = "written outside its OnStart seed (static tables are read-only)"
+                continue
+            if table in existing and table != collection:
+                skipped[collection] = f"a data source named {table} already exists"
+                continue
+            try:
+                if collection in self.datasets:
+                    rows = self.datasets[collection]
+                    types = dataset_types(rows)
+                elif collection in seeds:
+                    rows, types = literal_rows(seeds[collection])
+                else:
+                    skipped[collection] = "no ClearCollect seed in OnStart"
+                    continue
+            except NotLiteral as e:
+                skipped[collection] = str(e)
+                continue
+            if not rows:
+                skipped[collection] = "no rows"
+                continue
+            tables[collection] = static_source(table, rows, types)
+        return tables, skipped
+
+    def run(self, package: MSAppPackage) -> Dict:
+        onstart = package.get_app_formula('OnStart') or ''
+        tables, skipped = self.tables(package)
+        report = {
+            "tables": {c: {"table": s["Name"], "rows": len(json.loads(s["Data"])), "columns": len(s["OrderedColumnNames"]),
+                           "data_bytes": len(s["Data"].encode('utf-8'))} for c, s in tables.items()},
+            "skipped": skipped
+        }
+        if not tables:
+            return report
+
+        rewrites = [drop_statements(set(tables))] + \
+            [rename_identifier(c, s["Name"]) for c, s in tables.items() if s["Name"] != c]
+        rewrite = FormulaRewriter(rewrites).run(package, self.dry_run)
+        yaml_only = [] if self.dry_run else rename_in_yaml(package, rewrites)
+        if not self.dry_run:
+            document = package.read_json(DATASOURCES) if package.exists(DATASOURCES) else {"DataSources": []}
+            names = set(tables) | {s["Name"] for s in tables.values()}
+            document["DataSources"] = [s for s in document.get("DataSources", []) if s.get("Name") not in names] \
+                + list(tables.values())
+            package.write_json(DATASOURCES, document)
+
+        new_onstart = rewrites[0](onstart) or onstart
+        report.update({
+            "changed_rules": [f"{c['screen']}/{c['control']}.{c['property']}" for c in rewrite["changes"]],
+            "yaml_only_changed": yaml_only,
+            "onstart_bytes_before": len(onstart.encode('utf-8')),
+            "onstart_bytes_after": len(new_onstart.encode('utf-8'))
+        })
+        return report
+
+
+def _measure(package: MSAppPackage, stage, repeat: int) -> Dict:
+    """Best-of-repeat build time of one stage on copies of the package, with the built package's sizes"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        built = package.copy()
+        stage.run(built)
+        data = built.to_bytes()
+        timings.append(time.perf_counter() - start)
+    onstart = built.get_app_formula('OnStart') or ''
+    start = time.perf_counter()
+    powerfx.statement_units(onstart)
+    return {
+        "build_ms": round(min(timings) * 1000, 1),
+        "package_bytes": len(data),
+        "onstart_bytes": len(onstart.encode('utf-8')),
+        "onstart_parse_ms": round((time.perf_counter() - start) * 1000, 2),
+        "datasources_bytes": len(built.read(DATASOURCES)) if built.exists(DATASOURCES) else 0,
+        "startup_score": estimate_startup(built)["score"]
+    }
+
+
+def benchmark(package: MSAppPackage, datasets: Dict[str, List[dict]], repeat: int = 3) -> Dict:
+    """Build the datasets as OnStart literals and as static tables; compare the two"""
+    from msapp_pipeline import SetOnStart
+
+    literal = _measure(package, SetOnStart(datasets=datasets), repeat)
+    static = _measure(package, StaticTables(datasets=datasets, collections=list(datasets)), repeat)
+    return {
+        "rows": {name: len(rows) for name, rows in datasets.items()},
+        "literal": literal,
+        "static": static,
+        "change_pct": {key: round(100 * (static[key] - literal[key]) / literal[key], 1) if literal[key] else 0.0
+                       for key in literal}
+    }
+
+
+def parse_names(specs: List[str]) -> Dict[str, str]:
+    """['colSites=Sites', ...] -> {'colSites': 'Sites'}"""
+    names = {}
+    for spec in specs:
+        collection, _, table = spec.partition('=')
+        if not (collection and table):
+            raise ValueError(f"--name expects COLLECTION=TABLE, got '{spec}'")
+        names[collection] = table
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed seed datasets as static table data sources")
+    parser.add_argument("input", help="Path to the .msapp file")
+    parser.add_argument("output", nargs="?", help="Output path (default: <input>_Static.msapp)")
+    parser.add_argument("--dataset", action="append", default=[], metavar="COLLECTION=FILE",
+                        help="Rows for a collection from a JSON file (default: the OnStart ClearCollect literals)")
+    parser.add_argument("--collection", action="append", metavar="NAME",
+                        help="Only convert these collections (repeatable)")
+    parser.add_argument("--name", action="append", default=[], metavar="COLLECTION=TABLE",
+                        help="Table name for a collection (default: colSites -> tblSites)")
+    parser.add_argument("--dry-run", action="store_true", help="Report without writing a package")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare OnStart literals with static tables instead of converting")
+    parser.add_argument("--rows", type=int, help="With --benchmark: scale every dataset to this many rows")
+    parser.add_argument("--repeat", type=int, default=3, help="With --benchmark: builds per approach (best is kept)")
+    parser.add_argument("--report", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    try:
+        names = parse_names(args.name)
+    except ValueError as e:
+        parser.error(str(e))
+
+    input_path = Path(args.input)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {input_path}")
+        return 1
+
+    datasets = {}
+    for spec in args.dataset:
+        collection, _, path = spec.partition('=')
+        with open(path, 'r', encoding='utf-8') as f:
+            datasets[collection] = json.load(f)
+
+    package = MSAppPackage.load(input_path)
+    if args.benchmark:
+        stage = StaticTables(datasets, args.collection, names)
+        tables, skipped = stage.tables(package)
+        datasets = {c: json.loads(s["Data"]) for c, s in tables.items()}
+        if not datasets:
+            print("No convertible datasets to benchmark")
+            return 1
+        if args.rows:
+            datasets = {c: scale_rows(rows, args.rows) for c, rows in datasets.items()}
+        report = benchmark(package, datasets, args.repeat)
+        print(f"Datasets: {', '.join(f'{c} ({n:,} rows)' for c, n in report['rows'].items())}")
+        print(f"  {'':<18} {'literal':>12} {'static':>12} {'change':>8}")
+        for key, change in report["change_pct"].items():
+            print(f"  {key:<18} {report['literal'][key]:>12,} {report['static'][key]:>12,} {change:>+7}%")
+    else:
+        report = StaticTables(datasets, args.collection, names, args.dry_run).run(package)
+        for collection, table in report["tables"].items():
+            print(f"  {collection:<18} -> {table['table']} ({table['rows']:,} rows, {table['columns']} columns, "
+                  f"{table['data_bytes']:,} bytes)")
+        for collection, reason in report["skipped"].items():
+            print(f"  {collection:<18} stays a collection: {reason}")
+        if not report["tables"]:
+            print("Nothing to convert")
+            return 0
+        print(f"\n{len(report['changed_rules'])} rules changed; OnStart {report['onstart_bytes_before']:,} -> "
+              f"{report['onstart_bytes_after']:,} bytes")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if not (args.dry_run or args.benchmark):
+        output_path = Path(args.output) if args.output else input_path.parent / f"{input_path.stem}_Static.msapp"
+        package.save(output_path)
+        print(f"Created: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,22 +1,19 @@
-import zipfile, json, os, shutil
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from msapp_package import MSAppPackage
+
 print("Testing MINIMAL enhancement - OnStart only")
 
 msapp_path = Path("Natural England Condition Assessment.msapp")
-extract_dir = Path('.test_minimal')
 output_path = Path("Natural England Condition Assessment_Test_Minimal.msapp")
 
-# Extract
-if extract_dir.exists():
-    shutil.rmtree(extract_dir)
-extract_dir.mkdir()
-with zipfile.ZipFile(msapp_path, 'r') as zip_ref:
-    zip_ref.extractall(extract_dir)
+# Load in memory
+package = MSAppPackage.load(msapp_path)
 
 # Read original App.pa.yaml
-with open(extract_dir / 'Src' / 'App.pa.yaml', 'r', encoding='utf-8') as f:
-    original = f.read()
+original = package.read_text('Src/App.pa.yaml')
 
 print("Original App.pa.yaml:")
 print(original)
@@ -38,23 +35,13 @@ App:
 
 '''
 
-with open(extract_dir / 'Src' / 'App.pa.yaml', 'w', encoding='utf-8') as f:
-    f.write(minimal_content)
+package.write('Src/App.pa.yaml', minimal_content)
 
 print("Modified App.pa.yaml:")
 print(minimal_content)
 
 # Repackage
-if output_path.exists():
-    output_path.unlink()
-with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-    for file_path in extract_dir.rglob('*'):
-        if file_path.is_file():
-            arcname = str(file_path.relative_to(extract_dir)).replace(os.sep, '/')
-            zipf.write(file_path, arcname)
-
-# Cleanup
-shutil.rmtree(extract_dir)
+package.save(output_path)
 
 print(f"\nCreated: {output_path.name}")
 print("Try importing this MINIMAL test file first")
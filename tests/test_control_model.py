@@ -0,0 +1,84 @@
+"""Round-trip tests for the canonical pa.yaml emitter in control_model"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+import control_model
+from fx_source import compile_screen
+from msapp_package import MSAppPackage
+
+PACKAGES = sorted(REPO.glob('*.msapp'))
+FX_SCREENS = sorted((REPO / 'src' / 'screens').glob('*.fx'))
+
+
+def _package_screens():
+    """(id, screen model) for every Controls JSON screen and screen pa.yaml in the repo's packages"""
+    screens = []
+    for path in PACKAGES:
+        package = MSAppPackage.load(path)
+        for member in package.control_files():
+            top = package.read_json(member).get('TopParent', {})
+            if top.get('Template', {}).get('Name') == 'screen':
+                screens.append((f"{path.stem}:{member}", control_model.from_controls_json(top)))
+        for member in package.names():
+            if member.startswith('Src/') and member.endswith('.pa.yaml') and member != 'Src/App.pa.yaml':
+                try:
+                    screen = control_model.screen_from_pa_yaml(package.read_text(member))
+                except control_model.PaYamlError:
+                    continue
+                screens.append((f"{path.stem}:{member}", screen))
+    return screens
+
+
+PACKAGE_SCREENS = _package_screens()
+
+
+def _assert_roundtrip(screen):
+    text = control_model.screen_pa_yaml(screen)
+    assert control_model.verify_roundtrip(screen) is None
+    assert control_model.screen_pa_yaml(screen) == text, "emitter is not deterministic"
+    assert control_model.screen_pa_yaml(control_model.screen_from_pa_yaml(text)) == text
+
+
+def test_repo_has_screens():
+    assert PACKAGE_SCREENS and FX_SCREENS
+
+
+@pytest.mark.parametrize('screen', [s for _, s in PACKAGE_SCREENS], ids=[i for i, _ in PACKAGE_SCREENS])
+def test_package_screen_roundtrip(screen):
+    _assert_roundtrip(screen)
+
+
+@pytest.mark.parametrize('path', FX_SCREENS, ids=[p.stem for p in FX_SCREENS])
+def test_fx_screen_roundtrip(path):
+    _assert_roundtrip(compile_screen(path))
+
+
+def test_thousand_control_screen_roundtrip():
+    screen = control_model.synthetic_screen(1000)
+    assert sum(1 for _ in control_model.walk(screen)) == 1000
+    _assert_roundtrip(screen)
+    parsed = control_model.screen_from_pa_yaml(control_model.screen_pa_yaml(screen))
+    assert control_model.count_controls(parsed) == control_model.count_controls(screen)
+
+
+@pytest.mark.parametrize('formula', [
+    '"a: b"',
+    '"# not a comment"',
+    'If(x,\n    "line one",\n    "line two")',
+    "'Quoted Name'.Value & \"\"\"\"",
+    '  leading spaces',
+    'trailing space ',
+    '-1',
+    '[1, 2, 3]',
+    '{A: 1}',
+    '',
+])
+def test_formula_roundtrip(formula):
+    screen = control_model.new_control("EdgeScreen", "screen")
+    screen["Children"].append(control_model.new_control("Label1", "label", {"Text": formula}))
+    _assert_roundtrip(screen)
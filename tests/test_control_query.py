@@ -0,0 +1,31 @@
+"""Selector parsing tests for control_query"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from control_query import SelectorError, Term, parse_selector
+
+
+def test_quoted_value_with_spaces():
+    assert parse_selector('rule:BorderColor="RGBA(0, 18, 107, 1)" screen=HomeScreen') == (
+        Term('rule', 'BorderColor', '=', 'RGBA(0, 18, 107, 1)'), Term('screen', None, '=', 'HomeScreen'))
+
+
+def test_power_fx_string_in_other_quotes():
+    assert parse_selector('rule:Text=\'"Natural England"\'') == (Term('rule', 'Text', '=', '"Natural England"'),)
+
+
+def test_regex_backslashes_are_kept():
+    assert parse_selector(r'rule:Fill~varTheme\..*') == (Term('rule', 'Fill', '~', r'varTheme\..*'),)
+
+
+def test_empty_value():
+    assert parse_selector('type=screen parent=') == (Term('type', None, '=', 'screen'), Term('parent', None, '=', ''))
+
+
+def test_unclosed_quote():
+    with pytest.raises(SelectorError):
+        parse_selector('rule:Fill="RGBA(0, 0')
@@ -0,0 +1,42 @@
+"""Tests for identifier renames reaching the collection declarations"""
+
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+from formula_rewrite import FormulaRewriter, RewriteFormulas, rename_identifier
+from msapp_package import MSAppPackage
+from msapp_pipeline import UpdateDataSources
+from onstart_concurrency import DATASOURCES
+
+BASE = REPO / 'Natural England Condition Assessment_ENHANCED_FINAL.msapp'
+
+
+def _declared(package):
+    return [(s['Name'], s['Type']) for s in package.read_json(DATASOURCES)['DataSources']]
+
+
+def test_collection_rename_updates_datasources():
+    package = MSAppPackage.load(BASE)
+    UpdateDataSources(["colSites", "colUsers"]).run(package)
+    report = RewriteFormulas(rename={"colSites": "colSurveySites"}).run(package)
+    assert report["changed_rules"]
+    assert report["datasources_renamed"] == ["colSites -> colSurveySites"]
+    assert _declared(package) == [("colSurveySites", "Collection"), ("colUsers", "Collection")]
+
+
+def test_dry_run_reports_without_renaming():
+    package = MSAppPackage.load(BASE)
+    UpdateDataSources(["colSites"]).run(package)
+    report = FormulaRewriter([rename_identifier("colSites", "colSurveySites")]).run(package, dry_run=True)
+    assert report["datasources_renamed"] == ["colSites -> colSurveySites"]
+    assert _declared(package) == [("colSites", "Collection")]
+
+
+def test_existing_declaration_is_not_duplicated():
+    package = MSAppPackage.load(BASE)
+    UpdateDataSources(["colSites", "colSurveySites"]).run(package)
+    report = RewriteFormulas(rename={"colSites": "colSurveySites"}).run(package)
+    assert report["datasources_renamed"] == []
+    assert [name for name, _ in _declared(package)].count("colSurveySites") == 1
@@ -0,0 +1,55 @@
+"""Tests for the src/screens/*.fx compiler used by watch mode"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+from fx_source import FXCompileError, FXScreenCompiler, compile_screen
+
+FX_SCREENS = sorted((REPO / 'src' / 'screens').glob('*.fx'))
+
+
+def _controls(control):
+    yield control
+    for child in control.get('Children', []):
+        yield from _controls(child)
+
+
+@pytest.mark.parametrize('path', FX_SCREENS, ids=[p.stem for p in FX_SCREENS])
+def test_compiles_repo_screen(path):
+    screen = compile_screen(path)
+    assert screen['Name'] == path.stem
+    assert screen['Children']
+
+
+def test_comment_before_child():
+    screen = FXScreenCompiler('S').compile('''Screen(
+  Fill: White,
+  // Header
+  /* banner */ Label(Text: "Hi")
+)''')
+    assert [c['Name'] for c in screen['Children']] == ['SLabel1']
+    assert screen['Children'][0]['Properties']['Text'] == '"Hi"'
+
+
+def test_with_scope_wraps_child_formulas():
+    screen = FXScreenCompiler('S').compile('''Screen(
+  With({ok: !IsBlank(varSite)},
+    Container(
+      Label(Text: If(ok, "Ready", "Missing"), Size: 10),
+      If(ok, Icon(Icon: Icon.Check))
+    )
+  )
+)''')
+    controls = {c['Name']: c for c in _controls(screen)}
+    assert controls['SLabel1']['Properties']['Text'] == 'With({ok: !IsBlank(varSite)}, If(ok, "Ready", "Missing"))'
+    assert controls['SLabel1']['Properties']['Size'] == '10'
+    assert controls['SIcon1']['Properties']['Visible'] == 'With({ok: !IsBlank(varSite)}, ok)'
+
+
+def test_uncompilable_argument():
+    with pytest.raises(FXCompileError):
+        FXScreenCompiler('S').compile('Screen(Sum(1, 2))')
@@ -0,0 +1,29 @@
+"""Tests for moving static OnStart globals into App.Formulas"""
+
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+from msapp_package import MSAppPackage
+from named_formulas import NamedFormulas, impure_calls
+
+BASE = REPO / 'Natural England Condition Assessment_ENHANCED_FINAL.msapp'
+
+
+def test_impure_calls():
+    assert impure_calls('If(x, Round(y, 0), Blank())') == set()
+    assert impure_calls('MyFlow.Run(x)') == {'MyFlow.Run'}
+    assert impure_calls('Patch(Sites, Defaults(Sites), {})') == {'Patch', 'Defaults'}
+
+
+def test_volatile_values_stay_in_onstart():
+    package = MSAppPackage.load(BASE)
+    package.set_app_formula('OnStart', (package.get_app_formula('OnStart') or '')
+                            + ';Set(varSessionId, GUID());Set(varLaunched, Now());Set(varLimit, Round(42.5, 0))')
+    report = NamedFormulas({"varSessionId": "SessionId", "varLaunched": "Launched", "varLimit": "Limit"}).run(package)
+    assert report["moved"] == {"varLimit": "Limit"}
+    assert any(w.startswith("varSessionId: value calls GUID") for w in report["warnings"])
+    assert any(w.startswith("varLaunched: value calls Now") for w in report["warnings"])
+    assert 'Set(varLaunched, Now())' in package.get_app_formula('OnStart')
+    assert 'Limit = Round(42.5, 0)' in package.get_app_formula('Formulas')
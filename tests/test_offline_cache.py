@@ -0,0 +1,41 @@
+"""Tests for the offline collection cache stage"""
+
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+from msapp_package import MSAppPackage
+from offline_cache import OfflineCache
+from onstart_concurrency import DATASOURCES
+
+BASE = REPO / 'Natural England Condition Assessment_ENHANCED_FINAL.msapp'
+
+
+def _package(onstart_suffix: str = '') -> MSAppPackage:
+    package = MSAppPackage.load(BASE)
+    package.read_json(DATASOURCES).setdefault('DataSources', []).append(
+        {"Name": "Sites", "Type": "ConnectedDataSourceInfo"})
+    package.mark_dirty(DATASOURCES)
+    package.set_app_formula('OnStart', (package.get_app_formula('OnStart') or '') + onstart_suffix)
+    return package
+
+
+def test_literal_seeds_are_not_cached():
+    package = _package()
+    onstart = package.get_app_formula('OnStart')
+    report = OfflineCache().run(package)
+    assert report["cacheable"] == []
+    assert report["kept"]["colSites"] == "load reads no connector; nothing to cache"
+    assert package.get_app_formula('OnStart') == onstart
+
+
+def test_connector_load_is_cached():
+    package = _package(';ClearCollect(colActive, Filter(Sites, Active))')
+    report = OfflineCache(version='1').run(package)
+    assert [c["collection"] for c in report["cacheable"]] == ["colActive"]
+    onstart = package.get_app_formula('OnStart')
+    assert 'LoadData(colActive,"colActive.v1",true)' in onstart
+    assert 'SaveData(colActive,"colActive.v1")' in onstart
+    names = {s["Name"] for s in package.read_json(DATASOURCES)["DataSources"]}
+    assert "colActiveCachedAt" in names
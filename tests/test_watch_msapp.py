@@ -0,0 +1,77 @@
+"""Tests for watch mode: watchers and the incremental builder"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+import pa_yaml
+from msapp_package import EDITOR_STATE, MSAppPackage
+from watch_msapp import IncrementalBuilder, InotifyWatcher, PollingWatcher
+
+BASE = REPO / 'Natural England Condition Assessment_Enhanced.msapp'
+
+
+def _inotify(targets):
+    try:
+        return InotifyWatcher(targets)
+    except (OSError, AttributeError):
+        pytest.skip("inotify is not available")
+
+
+def _polling(targets):
+    return PollingWatcher(targets, interval=0.05)
+
+
+def _drain(watcher):
+    changed = watcher.poll(0.5)
+    while True:
+        more = watcher.poll(0.1)
+        if not more:
+            return changed
+        changed |= more
+
+
+@pytest.mark.parametrize('create', [_polling, _inotify], ids=['polling', 'inotify'])
+def test_missing_targets_are_watched_once_created(tmp_path, create):
+    targets = [tmp_path / 'src' / 'screens', tmp_path / 'config' / 'app.config.json', tmp_path / 'data']
+    watcher = create(targets)
+    try:
+        (tmp_path / 'src' / 'screens' / 'nested').mkdir(parents=True)
+        (tmp_path / 'src' / 'screens' / 'Home.fx').write_text('Screen()')
+        (tmp_path / 'config').mkdir()
+        (tmp_path / 'config' / 'app.config.json').write_text('{}')
+        (tmp_path / 'data').mkdir()
+        (tmp_path / 'data' / 'colSites.json').write_text('[]')
+        assert _drain(watcher) >= {tmp_path / 'src' / 'screens' / 'Home.fx',
+                                     tmp_path / 'config' / 'app.config.json',
+                                     tmp_path / 'data' / 'colSites.json'}
+
+        (tmp_path / 'src' / 'screens' / 'nested' / 'Part.fx').write_text('Label()')
+        assert _drain(watcher) == {tmp_path / 'src' / 'screens' / 'nested' / 'Part.fx'}
+    finally:
+        watcher.close()
+
+
+def test_builder_adds_and_removes_screens(tmp_path):
+    screens = tmp_path / 'src' / 'screens'
+    screens.mkdir(parents=True)
+    source = screens / 'AssessmentDetailScreen.fx'
+    shutil.copy(REPO / 'src' / 'screens' / source.name, source)
+    output = tmp_path / 'out.msapp'
+    builder = IncrementalBuilder(BASE, output, tmp_path)
+
+    assert builder.rebuild({source})
+    package = MSAppPackage.load(output)
+    assert package.find_control_file('AssessmentDetailScreen')
+    assert pa_yaml.screens_order(package.read_text(EDITOR_STATE))[-1] == 'AssessmentDetailScreen'
+
+    source.unlink()
+    assert builder.rebuild({source})
+    package = MSAppPackage.load(output)
+    assert package.find_control_file('AssessmentDetailScreen') is None
+    assert not package.exists('Src/AssessmentDetailScreen.pa.yaml')
+    assert 'AssessmentDetailScreen' not in pa_yaml.screens_order(package.read_text(EDITOR_STATE))
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+MSAPP Watch Mode
+Watches the app sources and incrementally rebuilds only the affected package members
+
+Sources -> members:
+  src/screens/<Screen>.fx   -> Controls/<n>.json + Src/<Screen>.pa.yaml (+ ControlCount);
+                               deleting the source removes the screen
+  src/App.OnStart.fx        -> App OnStart (Controls/1.json + Src/App.pa.yaml)
+  config/app.config.json    -> Properties.json AppDescription, PublishInfo AppName
+  <datasets>/<collection>.json -> ClearCollect(<collection>, ...) in App OnStart
+  src/components/*.fx       -> reported only; components are not compiled by the Python builder
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+sys.path.insert(0, str(Path(__file__).parent))
+import powerfx
+from fx_source import FXCompileError, compile_screen
+from msapp_package import MSAppPackage
+
+
+class PollingWatcher:
+    """Portable watcher comparing file mtimes/sizes every interval"""
+
+    def __init__(self, targets: List[Path], interval: float = 0.5):
+        self.targets = targets
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self) -> Dict[Path, tuple]:
+        state = {}
+        for target in self.targets:
+            files = target.rglob('*') if target.is_dir() else [target]
+            for path in files:
+                try:
+                    if path.is_file():
+                        stat = path.stat()
+                        state[path] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    pass
+        return state
+
+    def poll(self, timeout: float) -> Set[Path]:
+        time.sleep(min(timeout, self.interval))
+        current = self._scan()
+        changed = {p for p in current.keys() | self.snapshot.keys()
+                   if current.get(p) != self.snapshot.get(p)}
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify watcher (via libc, no extra dependencies)"""
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, targets: List[Path]):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError("inotify is not available on this platform")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # Watch directories; single files are watched through their parent
+        self.directories: Dict[int, Path] = {}
+        self.trees: Set[Path] = set()
+        self.files: Set[Path] = set()
+        self.targets = list(targets)
+        for target in self.targets:
+            self._watch_target(target)
+
+    def _watch_target(self, target: Path) -> Set[Path]:
+        """Watch a target, or its nearest existing parent until it is created; returns the files found"""
+        if target.is_dir():
+            self.files.discard(target)
+            return self._add_tree(target)
+        if target.parent.is_dir():
+            self.files.add(target)
+            self._add(target.parent)
+            return {target} if target.exists() else set()
+        self._add(next(p for p in target.parents if p.is_dir()))
+        return set()
+
+    def _add(self, directory: Path):
+        if directory in self.directories.values():
+            return
+        wd = self.libc.inotify_add_watch(self.fd, str(directory).encode(), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.directories[wd] = directory
+
+    def _add_tree(self, root: Path) -> Set[Path]:
+        """Watch a directory and its subdirectories; returns the files already inside"""
+        files = set()
+        for directory in [root] + [d for d in root.rglob('*') if d.is_dir()]:
+            self.trees.add(directory)
+            try:
+                self._add(directory)
+            except OSError:
+                continue  # removed again before the watch was added
+            files.update(p for p in directory.iterdir() if p.is_file())
+        return files
+
+    def poll(self, timeout: float) -> Set[Path]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset + self.EVENT.size <= len(data):
+            wd, mask, _cookie, length = self.EVENT.unpack_from(data, offset)
+            name = data[offset + self.EVENT.size:offset + self.EVENT.size + length].rstrip(b'\0').decode()
+            offset += self.EVENT.size + length
+            if mask & self.IN_IGNORED:
+                # Watched directory deleted; forget it and fall back to a parent for the targets it held
+                gone = self.directories.pop(wd, None)
+                self.trees.discard(gone)
+                for target in self.targets:
+                    if gone is not None and (target == gone or gone in target.parents):
+                        changed |= self._watch_target(target)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+            if mask & self.IN_ISDIR:
+                # New directory: watch it and pick up files written before the watch existed
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and path.is_dir():
+                    if directory in self.trees:
+                        changed |= self._add_tree(path)
+                    for target in self.targets:
+                        if target == path or path in target.parents:
+                            changed |= self._watch_target(target)
+                continue
+            if directory in self.trees or path in self.files:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(targets: List[Path], force_polling: bool = False):
+    """inotify where available, polling otherwise; missing targets are picked up once created"""
+    if not force_polling:
+        try:
+            return InotifyWatcher(targets)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(targets)
+
+
+class IncrementalBuilder:
+    """Keeps the package in memory and re-applies only the sources that changed"""
+
+    def __init__(self, base_path: Path, output_path: Path, root: Path, datasets_dir: Optional[Path] = None):
+        self.base_path = base_path
+        self.output_path = output_path
+        self.root = root
+        self.screens_dir = root / 'src' / 'screens'
+        self.components_dir = root / 'src' / 'components'
+        self.onstart_path = root / 'src' / 'App.OnStart.fx'
+        self.config_path = root / 'config' / 'app.config.json'
+        self.datasets_dir = datasets_dir
+        self.package = MSAppPackage.load(base_path)
+        self.base_onstart = self.package.get_app_formula('OnStart') or ''
+
+    def targets(self) -> List[Path]:
+        targets = [self.screens_dir, self.components_dir, self.onstart_path, self.config_path]
+        if self.datasets_dir:
+            targets.append(self.datasets_dir)
+        return targets
+
+    def all_sources(self) -> Set[Path]:
+        sources = set(self.screens_dir.glob('*.fx')) | {self.onstart_path, self.config_path}
+        if self.datasets_dir:
+            sources |= set(self.datasets_dir.glob('*.json'))
+        return {s for s in sources if s.exists()}
+
+    def _is_under(self, path: Path, directory: Optional[Path]) -> bool:
+        return directory is not None and path.parent.resolve() == directory.resolve()
+
+    def apply_screen(self, path: Path) -> str:
+        screen = compile_screen(path)
+        member = self.package.set_screen(screen)
+        return f"{screen['Name']} -> {member}"
+
+    def remove_screen(self, path: Path) -> Optional[str]:
+        """Deleted (or renamed away) source: drop its screen from the package"""
+        member = self.package.remove_screen(path.stem)
+        if member is None:
+            print(f"   WARNING: {path.name} was deleted but the package has no screen {path.stem}")
+        return member
+
+    def apply_onstart(self) -> str:
+        """OnStart = App.OnStart.fx (or the base OnStart) with dataset seeds applied"""
+        onstart = self.onstart_path.read_text(encoding='utf-8').strip() \
+            if self.onstart_path.exists() else self.base_onstart
+        if self.datasets_dir and self.datasets_dir.exists():
+            for dataset in sorted(self.datasets_dir.glob('*.json')):
+                with open(dataset, 'r', encoding='utf-8') as f:
+                    onstart = powerfx.set_clear_collect(onstart, dataset.stem, json.load(f))
+        self.package.set_app_formula('OnStart', onstart)
+        return "App OnStart"
+
+    def apply_config(self) -> str:
+        with open(self.config_path, 'r', encoding='utf-8') as f:
+            app = json.load(f).get('app', {})
+        if 'description' in app:
+            self.package.read_json('Properties.json')['AppDescription'] = app['description']
+            self.package.mark_dirty('Properties.json')
+        if 'displayName' in app and self.package.exists('Resources/PublishInfo.json'):
+            self.package.read_json('Resources/PublishInfo.json')['AppName'] = app['displayName']
+            self.package.mark_dirty('Resources/PublishInfo.json')
+        return "Properties.json / PublishInfo.json"
+
+    def rebuild(self, changed: Iterable[Path]) -> bool:
+        """Apply changed sources; returns True if the output was rewritten"""
+        start = time.perf_counter()
+        updated, errors = [], []
+        screens_changed = onstart_changed = False
+
+        for path in sorted(set(changed)):
+            try:
+                if self._is_under(path, self.screens_dir) and path.suffix == '.fx':
+                    if path.exists():
+                        updated.append(self.apply_screen(path))
+                    elif self.remove_screen(path):
+                        updated.append(f"{path.stem} removed")
+                    screens_changed = True
+                elif self._is_under(path, self.components_dir):
+                    print(f"   NOTE: {path.name} changed - components are not compiled by the Python builder")
+                elif path == self.onstart_path or self._is_under(path, self.datasets_dir):
+                    onstart_changed = True
+                elif path == self.config_path and path.exists():
+                    updated.append(self.apply_config())
+            except (FXCompileError, ValueError, OSError) as e:
+                errors.append(f"{path.name}: {e}")
+
+        if onstart_changed:
+            try:
+                updated.append(self.apply_onstart())
+            except (ValueError, OSError) as e:
+                errors.append(f"OnStart: {e}")
+        if screens_changed:
+            self.package.update_control_count()
+
+        for error in errors:
+            print(f"   ERROR: {error}")
+        if not updated:
+            return False
+
+        self.package.save(self.output_path)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"   Rebuilt {', '.join(updated)} in {elapsed:.0f} ms -> {self.output_path.name}")
+        return True
+
+
+def watch(builder: IncrementalBuilder, debounce: float, force_polling: bool = False):
+    watcher = create_watcher(builder.targets(), force_polling)
+    print(f"Watching with {type(watcher).__name__} (Ctrl+C to stop)")
+    try:
+        while True:
+            changed = watcher.poll(1.0)
+            if not changed:
+                continue
+            # Debounce: keep collecting until the burst of saves goes quiet
+            while True:
+                more = watcher.poll(debounce)
+                if not more:
+                    break
+                changed |= more
+            print(f"\n{time.strftime('%H:%M:%S')} {len(changed)} change(s)")
+            builder.rebuild(changed)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    finally:
+        watcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a .msapp incrementally when sources change")
+    parser.add_argument("--base", required=True, help="Base .msapp package")
+    parser.add_argument("--output", required=True, help="Output .msapp (published atomically)")
+    parser.add_argument("--root", default=".", help="Project root containing src/ and config/")
+    parser.add_argument("--datasets", help="Directory of <collection>.json seed datasets")
+    parser.add_argument("--debounce", type=float, default=0.3, help="Quiet period in seconds (default: 0.3)")
+    parser.add_argument("--poll", action="store_true", help="Force polling instead of inotify")
+    args = parser.parse_args()
+
+    base_path = Path(args.base)
+    if not base_path.exists():
+        print(f"ERROR: Base package not found: {base_path}")
+        return 1
+
+    builder = IncrementalBuilder(base_path, Path(args.output), Path(args.root),
+                                 Path(args.datasets) if args.datasets else None)
+    print("Initial build...")
+    builder.rebuild(builder.all_sources())
+    watch(builder, args.debounce, args.poll)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())